@@ -0,0 +1,232 @@
+import asyncio
+import json
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+from metrics import metrics
+
+# Priority classes
+READ = "read"
+WRITE = "write"
+SEARCH = "search"
+
+# Default concurrency and queue limits per class; override with ADMISSION_<CLASS>_<FIELD>
+DEFAULT_LIMITS = {
+    READ: {"concurrency": 200, "queue": 100, "timeout": 0.5},
+    WRITE: {"concurrency": 50, "queue": 50, "timeout": 1.0},
+    SEARCH: {"concurrency": 20, "queue": 20, "timeout": 0.25},
+}
+
+# Seconds clients are asked to wait before retrying a shed request
+RETRY_AFTER = int(os.environ.get("ADMISSION_RETRY_AFTER", 1))
+
+# Paths never subject to admission control, so probes and operators get through under load
+EXEMPT_PATHS = {"/api/health", "/api/ready", "/api/metrics"}
+EXEMPT_PREFIXES = ("/api/admin/",)
+
+# Long-lived streams would hold a slot for their whole lifetime
+EXEMPT_ROUTES = [
+    re.compile(r"^/api/events/(live|[^/]+/live)$"),
+]
+
+# Expensive reads: list scans, faceted search, feeds and suggestions
+SEARCH_ROUTES = [
+    re.compile(r"^/api/events/?$"),
+    re.compile(r"^/api/organizers/?$"),
+    re.compile(r"^/api/feed/?$"),
+    re.compile(r"^/api/search/"),
+    re.compile(r"^/api/events/similar/"),
+    re.compile(r"^/api/organizers/nearby/"),
+]
+
+# POST endpoints that only read, such as batch lookups
+READ_ONLY_POSTS = [
+    re.compile(r"^/api/(events|organizers)/batch$"),
+]
+
+def _limit_from_env(priority: str, field: str, default: float) -> float:
+    value = os.environ.get(f"ADMISSION_{priority.upper()}_{field.upper()}")
+    return type(default)(value) if value is not None else default
+
+class Budget:
+    """Concurrency budget with a short bounded wait queue"""
+
+    def __init__(self, name: str, concurrency: int, queue: int, timeout: float):
+        self.name = name
+        self.concurrency = concurrency
+        self.queue = queue
+        self.timeout = timeout
+        self.active = 0
+        self.waiting = 0
+        self._released = asyncio.Condition()
+
+    async def acquire(self) -> bool:
+        """Take a slot, waiting briefly if none is free; return False if the request should be shed"""
+        if self.active < self.concurrency:
+            self.active += 1
+            return True
+        if self.waiting >= self.queue:
+            return False
+
+        self.waiting += 1
+        try:
+            async with self._released:
+                await asyncio.wait_for(
+                    self._released.wait_for(lambda: self.active < self.concurrency),
+                    self.timeout
+                )
+                self.active += 1
+                return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self.waiting -= 1
+
+    async def release(self):
+        """Return a slot and wake one waiter"""
+        self.active -= 1
+        if self.waiting:
+            async with self._released:
+                self._released.notify()
+
+    def configure(self, concurrency: Optional[int] = None, queue: Optional[int] = None, timeout: Optional[float] = None):
+        """Change limits at runtime; waiters pick up a raised concurrency on the next release"""
+        if concurrency is not None:
+            self.concurrency = concurrency
+        if queue is not None:
+            self.queue = queue
+        if timeout is not None:
+            self.timeout = timeout
+
+    def stats(self) -> dict:
+        return {
+            "concurrency": self.concurrency,
+            "queue": self.queue,
+            "timeout": self.timeout,
+            "active": self.active,
+            "waiting": self.waiting,
+        }
+
+def classify(method: str, path: str) -> str:
+    """Assign a request to a priority class"""
+    if method == "POST" and any(pattern.match(path) for pattern in READ_ONLY_POSTS):
+        return READ
+    if method not in ("GET", "HEAD", "OPTIONS"):
+        return WRITE
+    if any(pattern.match(path) for pattern in SEARCH_ROUTES):
+        return SEARCH
+    return READ
+
+class AdmissionController:
+    """Per-class budgets plus optional per-route budgets"""
+
+    def __init__(self):
+        self.budgets: Dict[str, Budget] = {
+            priority: Budget(
+                priority,
+                int(_limit_from_env(priority, "concurrency", limits["concurrency"])),
+                int(_limit_from_env(priority, "queue", limits["queue"])),
+                float(_limit_from_env(priority, "timeout", limits["timeout"])),
+            )
+            for priority, limits in DEFAULT_LIMITS.items()
+        }
+        # (method, path regex) -> budget; checked in addition to the class budget
+        self.route_budgets: List[Tuple[str, re.Pattern, Budget]] = []
+        self._load_route_budgets(os.environ.get("ADMISSION_ROUTE_LIMITS"))
+
+        metrics.register_gauge("admission", self.stats)
+
+    def _load_route_budgets(self, config: Optional[str]):
+        """Load route budgets from JSON: [{"method", "path", "concurrency", "queue", "timeout"}]"""
+        if not config:
+            return
+        for route in json.loads(config):
+            self.set_route_budget(**route)
+
+    def set_route_budget(self, method: str, path: str, concurrency: int, queue: int = 0, timeout: float = 0.25):
+        """Add or replace the budget of a route pattern"""
+        pattern = re.compile(path)
+        for route_method, route_pattern, budget in self.route_budgets:
+            if route_method == method.upper() and route_pattern.pattern == path:
+                budget.configure(concurrency, queue, timeout)
+                return
+        self.route_budgets.append((method.upper(), pattern, Budget(f"{method.upper()} {path}", concurrency, queue, timeout)))
+
+    def remove_route_budget(self, method: str, path: str) -> bool:
+        """Drop the budget of a route pattern; in-flight requests still release their slot"""
+        for i, (route_method, route_pattern, _) in enumerate(self.route_budgets):
+            if route_method == method.upper() and route_pattern.pattern == path:
+                del self.route_budgets[i]
+                return True
+        return False
+
+    def route_budget(self, method: str, path: str) -> Optional[Budget]:
+        for route_method, pattern, budget in self.route_budgets:
+            if route_method == method and pattern.match(path):
+                return budget
+        return None
+
+    def stats(self) -> dict:
+        return {
+            "classes": {name: budget.stats() for name, budget in self.budgets.items()},
+            "routes": {budget.name: budget.stats() for _, _, budget in self.route_budgets},
+        }
+
+admission_controller = AdmissionController()
+
+class AdmissionMiddleware:
+    """ASGI middleware that sheds load with 503 and Retry-After once a budget is exhausted"""
+
+    def __init__(self, app, controller: AdmissionController = admission_controller):
+        self.app = app
+        self.controller = controller
+
+    @staticmethod
+    def exempt(path: str) -> bool:
+        if path in EXEMPT_PATHS or path.startswith(EXEMPT_PREFIXES):
+            return True
+        return any(pattern.match(path) for pattern in EXEMPT_ROUTES)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.exempt(scope["path"]):
+            await self.app(scope, receive, send)
+            return
+
+        method, path = scope["method"], scope["path"]
+        priority = classify(method, path)
+        budgets = [self.controller.budgets[priority]]
+        route_budget = self.controller.route_budget(method, path)
+        if route_budget:
+            budgets.insert(0, route_budget)
+
+        acquired = []
+        try:
+            for budget in budgets:
+                if not await budget.acquire():
+                    metrics.inc(f"admission.shed.{priority}")
+                    await self._reject(send, priority)
+                    return
+                acquired.append(budget)
+
+            metrics.inc(f"admission.admitted.{priority}")
+            await self.app(scope, receive, send)
+        finally:
+            for budget in acquired:
+                await budget.release()
+
+    async def _reject(self, send, priority: str):
+        body = json.dumps({
+            "error": "Service Unavailable",
+            "message": f"Server is busy ({priority} capacity exhausted), please retry",
+            "status_code": 503
+        }).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(RETRY_AFTER).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,108 @@
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+from pymongo import ReplaceOne
+from database import events_collection, events_archive_collection, event_neighbors_collection
+from search_index import suggest_index, EVENT
+from fuzzy import event_fuzzy
+from map_clusters import map_index
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Events that started more than this many days ago move to the archive
+ARCHIVE_AFTER_DAYS = float(os.environ.get("ARCHIVE_AFTER_DAYS", 30))
+
+# Events moved per batch, and seconds between batches so the move stays in the background
+ARCHIVE_BATCH_SIZE = int(os.environ.get("ARCHIVE_BATCH_SIZE", 500))
+ARCHIVE_BATCH_DELAY = float(os.environ.get("ARCHIVE_BATCH_DELAY", 1))
+
+# Seconds between archiving runs
+ARCHIVE_INTERVAL = float(os.environ.get("ARCHIVE_INTERVAL", 3600))
+
+class EventArchiver:
+    """Moves long-past events from the events collection to events_archive"""
+
+    moved = 0
+    last_run_at = None
+
+    @staticmethod
+    def cutoff() -> datetime:
+        return datetime.utcnow() - timedelta(days=ARCHIVE_AFTER_DAYS)
+
+    @staticmethod
+    async def archive_batch(batch_size: int = ARCHIVE_BATCH_SIZE) -> int:
+        """Copy one batch of past events to the archive, then delete them, returning how many moved"""
+        cutoff = EventArchiver.cutoff()
+        events = await events_collection.find({"starts_at": {"$lt": cutoff}}).limit(batch_size).to_list(length=batch_size)
+        if not events:
+            return 0
+
+        # Copying first means a crash leaves an event in both collections, never in neither;
+        # the replace makes the copy idempotent when the batch is retried
+        now = datetime.utcnow()
+        await events_archive_collection.bulk_write(
+            [ReplaceOne({"_id": event["_id"]}, {**event, "archived_at": now}, upsert=True) for event in events],
+            ordered=False
+        )
+        # Only delete events still past the cutoff, in case one was rescheduled meanwhile
+        await events_collection.delete_many({"_id": {"$in": [event["_id"] for event in events]}, "starts_at": {"$lt": cutoff}})
+        kept = {event["_id"] async for event in events_collection.find({"_id": {"$in": [event["_id"] for event in events]}}, {"_id": 1})}
+        if kept:
+            await events_archive_collection.delete_many({"_id": {"$in": list(kept)}})
+        events = [event for event in events if event["_id"] not in kept]
+        if not events:
+            return 0
+
+        # Archived events are no longer suggested as similar to anything
+        archived_ids = [event["id"] for event in events]
+        await event_neighbors_collection.delete_many({"event_id": {"$in": archived_ids}})
+        await event_neighbors_collection.update_many(
+            {"neighbors.id": {"$in": archived_ids}},
+            {"$pull": {"neighbors": {"id": {"$in": archived_ids}}}}
+        )
+
+        # Other instances drop the events when the deletes reach the invalidation bus
+        for event in events:
+            suggest_index.remove(EVENT, event["id"])
+            event_fuzzy.remove(event["id"])
+            map_index.remove(event["id"])
+
+        EventArchiver.moved += len(events)
+        metrics.inc("archiver.events", len(events))
+        return len(events)
+
+    @staticmethod
+    async def archive_all() -> int:
+        """Archive every event past the cutoff, a batch at a time"""
+        moved = 0
+        while True:
+            count = await EventArchiver.archive_batch()
+            moved += count
+            if count < ARCHIVE_BATCH_SIZE:
+                break
+            await asyncio.sleep(ARCHIVE_BATCH_DELAY)
+        EventArchiver.last_run_at = datetime.utcnow()
+        if moved:
+            logger.info("Archived %d events", moved)
+        return moved
+
+    @staticmethod
+    async def run_archiver():
+        """Archive past events periodically"""
+        while True:
+            try:
+                await EventArchiver.archive_all()
+            except Exception as e:
+                logger.error("Event archiving failed: %s", e)
+            await asyncio.sleep(ARCHIVE_INTERVAL)
+
+    @staticmethod
+    def stats() -> dict:
+        return {
+            "moved": EventArchiver.moved,
+            "last_run_at": EventArchiver.last_run_at.isoformat() if EventArchiver.last_run_at else None,
+        }
+
+metrics.register_gauge("archiver", EventArchiver.stats)
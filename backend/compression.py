@@ -0,0 +1,131 @@
+import gzip
+import os
+from typing import List, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+# Responses smaller than this many bytes are sent uncompressed
+COMPRESSION_MIN_SIZE = int(os.environ.get("COMPRESSION_MIN_SIZE", 1024))
+
+# gzip level 1-9 and brotli quality 0-11
+GZIP_LEVEL = int(os.environ.get("GZIP_LEVEL", 6))
+BROTLI_QUALITY = int(os.environ.get("BROTLI_QUALITY", 5))
+
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript")
+
+# Streamed responses are never buffered for compression
+STREAMING_TYPES = ("text/event-stream",)
+
+def supported_encodings() -> List[str]:
+    """Return the encodings this process can produce, most preferred first"""
+    return ["br", "gzip"] if brotli else ["gzip"]
+
+def negotiate(accept_encoding: str) -> Optional[str]:
+    """Pick the best supported encoding from an Accept-Encoding header"""
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                continue
+        accepted[name.strip().lower()] = quality
+
+    for encoding in supported_encodings():
+        if accepted.get(encoding, accepted.get("*", 0)) > 0:
+            return encoding
+    return None
+
+def compress(body: bytes, encoding: str) -> bytes:
+    """Compress a body with the given encoding"""
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+def is_compressible(headers: List[Tuple[bytes, bytes]]) -> bool:
+    """Return True if a response with these headers should be compressed"""
+    content_type = ""
+    for name, value in headers:
+        if name.lower() == b"content-encoding":
+            return False
+        if name.lower() == b"content-type":
+            content_type = value.decode("latin-1").lower()
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+def header_value(headers: List[Tuple[bytes, bytes]], name: bytes) -> str:
+    """Return a header from an ASGI header list, or an empty string"""
+    for key, value in headers:
+        if key.lower() == name:
+            return value.decode("latin-1")
+    return ""
+
+def encoded_headers(headers: List[Tuple[bytes, bytes]], encoding: Optional[str], length: int) -> List[Tuple[bytes, bytes]]:
+    """Rewrite response headers for a body sent with the given encoding"""
+    result = [
+        (name, value) for name, value in headers
+        if name.lower() not in (b"content-length", b"content-encoding", b"vary")
+    ]
+    result.append((b"content-length", str(length).encode()))
+    result.append((b"vary", b"Accept-Encoding"))
+    if encoding:
+        result.append((b"content-encoding", encoding.encode()))
+    return result
+
+class CompressionMiddleware:
+    """ASGI middleware that compresses large responses with brotli or gzip"""
+
+    def __init__(self, app, min_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.min_size = min_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+
+        request_headers = scope.get("headers", [])
+        encoding = negotiate(header_value(request_headers, b"accept-encoding"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        chunks = []
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start, passthrough
+            if passthrough:
+                await send(message)
+                return
+
+            if message["type"] == "http.response.start":
+                content_type = header_value(message.get("headers", []), b"content-type")
+                if not is_compressible(message.get("headers", [])) or content_type.startswith(STREAMING_TYPES):
+                    passthrough = True
+                    await send(message)
+                    return
+                start = message
+                return
+
+            # Buffer the body; API responses are sent whole, so this adds no latency
+            chunks.append(message.get("body", b""))
+            if message.get("more_body", False):
+                return
+
+            body = b"".join(chunks)
+            headers = start.get("headers", [])
+            if len(body) >= self.min_size:
+                body_encoding = encoding
+                body = compress(body, encoding)
+            else:
+                body_encoding = None
+            await send({**start, "headers": encoded_headers(headers, body_encoding, len(body))})
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_compressed)
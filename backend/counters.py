@@ -0,0 +1,155 @@
+import asyncio
+import logging
+import os
+from contextvars import ContextVar
+from typing import Dict, Iterable, List, Optional, Tuple
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
+from database import events_collection, organizers_collection
+from metrics import metrics
+from trending import SIGNAL_WEIGHTS, score_update
+
+logger = logging.getLogger(__name__)
+
+# Seconds between flushes; also the most counts a crash can lose
+COUNTER_FLUSH_INTERVAL = float(os.environ.get("COUNTER_FLUSH_INTERVAL", 5))
+
+# Flush early once this many events have pending counts
+COUNTER_MAX_PENDING = int(os.environ.get("COUNTER_MAX_PENDING", 10000))
+
+# Event counter -> organizer counter it rolls up into
+ORGANIZER_FIELDS = {"views": "totalViews", "impressions": "totalImpressions"}
+
+# (event id, organizer id) pairs shown by the current request, so cached
+# responses can replay their impressions without running the handler
+impression_log: ContextVar[Optional[List[Tuple[str, Optional[str]]]]] = ContextVar("impression_log", default=None)
+
+class CounterBuffer:
+    """Aggregates view and impression counts in memory and writes them with one bulk $inc"""
+
+    def __init__(self, interval: float = COUNTER_FLUSH_INTERVAL, max_pending: int = COUNTER_MAX_PENDING):
+        self.interval = interval
+        self.max_pending = max_pending
+        # event id -> {"views": n, "impressions": n}
+        self._events: Dict[str, Dict[str, int]] = {}
+        self._organizers: Dict[str, Dict[str, int]] = {}
+        # Views not yet folded into trending scores, kept apart so a failed
+        # score update is retried without counting the views again
+        self._trending: Dict[str, Dict[str, int]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._flush_now = asyncio.Event()
+
+        metrics.register_gauge("counters.pending_events", lambda: len(self._events))
+
+    def increment(self, event_id: str, organizer_id: Optional[str], field: str, amount: int = 1):
+        """Count a view or impression; nothing is written until the next flush"""
+        counts = self._events.setdefault(event_id, {})
+        counts[field] = counts.get(field, 0) + amount
+        if field == "views":
+            trending = self._trending.setdefault(event_id, {})
+            trending["views"] = trending.get("views", 0) + amount
+        if organizer_id:
+            organizer_counts = self._organizers.setdefault(organizer_id, {})
+            organizer_field = ORGANIZER_FIELDS[field]
+            organizer_counts[organizer_field] = organizer_counts.get(organizer_field, 0) + amount
+        metrics.inc(f"counters.{field}", amount)
+        if len(self._events) >= self.max_pending:
+            self._flush_now.set()
+
+    def view(self, event: dict):
+        """Count a detail view of an event"""
+        self.increment(event["id"], event.get("organizer_id"), "views")
+
+    def impressions(self, events: Iterable[dict]):
+        """Count one impression for each event shown in a list"""
+        refs = [(event["id"], event.get("organizer_id")) for event in events if event.get("id")]
+        log = impression_log.get()
+        if log is not None:
+            log.extend(refs)
+        self.replay(refs)
+
+    def replay(self, refs: Iterable[Tuple[str, Optional[str]]]):
+        """Count impressions recorded earlier, e.g. for a response served from cache"""
+        for event_id, organizer_id in refs:
+            self.increment(event_id, organizer_id, "impressions")
+
+    @staticmethod
+    def _operations(buffer: str, pending: Dict[str, Dict[str, int]]) -> List[Tuple[str, str, UpdateOne]]:
+        # No updated_at: counters must not look like content changes to the invalidation bus
+        return [(buffer, doc_id, UpdateOne({"id": doc_id}, {"$inc": counts})) for doc_id, counts in pending.items()]
+
+    @staticmethod
+    def _trending_operations(trending: Dict[str, Dict[str, int]]) -> List[Tuple[str, str, UpdateOne]]:
+        """Fold each event's views into its trending score, one update per event per flush"""
+        return [
+            ("trending", event_id, UpdateOne({"id": event_id}, score_update(SIGNAL_WEIGHTS["view"] * counts["views"])))
+            for event_id, counts in trending.items() if counts.get("views")
+        ]
+
+    def _merge_back(self, target: Dict[str, Dict[str, int]], pending: Dict[str, Dict[str, int]]):
+        for doc_id, counts in pending.items():
+            current = target.setdefault(doc_id, {})
+            for field, amount in counts.items():
+                current[field] = current.get(field, 0) + amount
+
+    @staticmethod
+    async def _write(collection, writes: List[Tuple[str, str, UpdateOne]]) -> List[Tuple[str, str]]:
+        """Bulk write (buffer, document id, operation) triples, returning the (buffer, document id) of failed writes"""
+        if not writes:
+            return []
+        try:
+            await collection.bulk_write([operation for _, _, operation in writes], ordered=False)
+            return []
+        except BulkWriteError as e:
+            # The write is unordered, so every operation not listed in writeErrors was applied
+            errors = e.details.get("writeErrors", [])
+            logger.error("Counter flush failed on %d of %d writes, retrying them next interval", len(errors), len(writes))
+            return [writes[error["index"]][:2] for error in errors]
+        except PyMongoError as e:
+            logger.error("Counter flush failed, retrying next interval: %s", e)
+            return [write[:2] for write in writes]
+
+    async def flush(self) -> int:
+        """Write pending counts, returning the documents updated; failed writes are retried next flush"""
+        pending = {
+            "events": self._events,
+            "trending": self._trending,
+            "organizers": self._organizers,
+        }
+        self._events, self._trending, self._organizers = {}, {}, {}
+        if not any(pending.values()):
+            return 0
+
+        event_writes = self._operations("events", pending["events"]) + self._trending_operations(pending["trending"])
+        organizer_writes = self._operations("organizers", pending["organizers"])
+        failed = await self._write(events_collection, event_writes)
+        failed += await self._write(organizers_collection, organizer_writes)
+
+        buffers = {"events": self._events, "trending": self._trending, "organizers": self._organizers}
+        for buffer, doc_id in failed:
+            self._merge_back(buffers[buffer], {doc_id: pending[buffer][doc_id]})
+
+        metrics.inc("counters.flushes")
+        return len(pending["events"]) + len(pending["organizers"]) - sum(1 for buffer, _ in failed if buffer != "trending")
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_now.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_now.clear()
+            await self.flush()
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the flusher and write whatever is pending"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+counter_buffer = CounterBuffer()
@@ -1,47 +1,87 @@
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument
 from typing import Optional, List, Dict, Any
+import logging
 import os
-from datetime import datetime
+from datetime import datetime, date, timedelta
+from bson import ObjectId
+from bson.errors import InvalidId
+import base64
+import json
 import math
 from dotenv import load_dotenv
 from pathlib import Path
+from indexes import IndexReconciler, INDEX_SPECS
+from query_shapes import record_query_shape, query_shape_recorder
+from geo import geo_point, METERS_PER_MILE
+from single_flight import SingleFlight
+from repository import Repository
+from memory_store import MemoryDatabase
+from fuzzy import event_fuzzy, organizer_fuzzy
+from trending import SIGNAL_WEIGHTS, city_key, decayed_score, score_update
+
+logger = logging.getLogger(__name__)
 
 # Load environment variables
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+# Where collections live: "mongo", or "memory" to keep everything in this process for tests and benchmarks
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "mongo")
+
 # MongoDB connection
-mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ.get('DB_NAME', 'nearme_events')]
+if STORAGE_BACKEND == "memory":
+    db = MemoryDatabase(os.environ.get('DB_NAME', 'nearme_events'))
+else:
+    mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+    client = AsyncIOMotorClient(mongo_url)
+    db = client[os.environ.get('DB_NAME', 'nearme_events')]
+
+# Recorded shapes are replayed through MongoDB's explain(), which the memory backend lacks
+query_shape_recorder.enabled = STORAGE_BACKEND != "memory"
 
 # Collections
 users_collection = db.users
 events_collection = db.events
+# Long-past events, moved out by the archiver; read by id and for organizer stats
+events_archive_collection = db.events_archive
 organizers_collection = db.organizers
+event_neighbors_collection = db.event_neighbors
+organizer_leaderboards_collection = db.organizer_leaderboards
+job_outbox_collection = db.job_outbox
+change_stream_state_collection = db.change_stream_state
+migrations_collection = db.migrations
+
+# Concurrent reads of the same document share one MongoDB round trip
+event_reads = SingleFlight("events")
+organizer_reads = SingleFlight("organizers")
+
+# Sort specifications for list queries; distance ordering happens in Python
+EVENT_SORT_FIELDS = {
+    "date": [("starts_at", 1)],
+    "rating": [("rating", -1)],
+    "price": [("price.min", 1)],
+    "trending": [("trending_score", -1)],
+}
+ORGANIZER_SORT_FIELDS = {
+    "rating": [("rating", -1)],
+    "events": [("totalEvents", -1)],
+    "name": [("name", 1)],
+}
+
+# Event fields omitted from list responses
+EVENT_LIST_PROJECTION = {"reviews": 0}
+
+# Index reconciliation runs in the background so startup is not blocked
+index_reconciler = IndexReconciler(db, INDEX_SPECS)
+
+class MotorRepository(Repository):
+    """Repository over the MongoDB collections of this module"""
 
-class Database:
     @staticmethod
     async def create_indexes():
-        """Create database indexes for better performance"""
-        # Users indexes
-        await users_collection.create_index("email", unique=True)
-        await users_collection.create_index([("location.lat", 1), ("location.lng", 1)])
-        
-        # Events indexes
-        await events_collection.create_index([("location.lat", 1), ("location.lng", 1)])
-        await events_collection.create_index("organizer_id")
-        await events_collection.create_index("category")
-        await events_collection.create_index("date")
-        await events_collection.create_index("rating")
-        await events_collection.create_index([("title", "text"), ("description", "text")])
-        
-        # Organizers indexes
-        await organizers_collection.create_index([("location.lat", 1), ("location.lng", 1)])
-        await organizers_collection.create_index("categories")
-        await organizers_collection.create_index("rating")
-        await organizers_collection.create_index("totalEvents")
-        await organizers_collection.create_index([("name", "text"), ("description", "text")])
+        """Create any missing database indexes and wait for them to finish"""
+        return await index_reconciler.run()
 
     @staticmethod
     def calculate_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
@@ -65,6 +105,26 @@ class Database:
         
         return round(distance, 1)
 
+    @staticmethod
+    def parse_start_time(event_date: Optional[str], event_time: Optional[str]) -> Optional[datetime]:
+        """Combine an ISO date string and an HH:MM time string into a datetime"""
+        if not event_date:
+            return None
+        
+        try:
+            starts_at = datetime.fromisoformat(event_date)
+        except ValueError:
+            return None
+        
+        if event_time:
+            try:
+                hour, minute = (int(part) for part in event_time.split(":")[:2])
+                starts_at = starts_at.replace(hour=hour, minute=minute)
+            except ValueError:
+                pass
+        
+        return starts_at
+
     # User operations
     @staticmethod
     async def create_user(user_data: dict) -> dict:
@@ -102,12 +162,22 @@ class Database:
         )
         return result.modified_count > 0
 
+    @staticmethod
+    async def add_user_created_event(user_id: str, event_id: str) -> bool:
+        """Add an event to a user's created events"""
+        result = await users_collection.update_one(
+            {"id": user_id},
+            {"$addToSet": {"createdEvents": event_id}, "$set": {"updated_at": datetime.utcnow()}}
+        )
+        return result.modified_count > 0
+
     # Organizer operations
     @staticmethod
     async def create_organizer(organizer_data: dict) -> dict:
         """Create a new organizer"""
         organizer_data['created_at'] = datetime.utcnow()
         organizer_data['updated_at'] = datetime.utcnow()
+        organizer_data['geo'] = geo_point(organizer_data.get('location'))
         
         result = await organizers_collection.insert_one(organizer_data)
         organizer_data['_id'] = str(result.inserted_id)
@@ -116,28 +186,46 @@ class Database:
     @staticmethod
     async def get_organizer_by_id(organizer_id: str) -> Optional[dict]:
         """Get organizer by ID"""
-        organizer = await organizers_collection.find_one({"id": organizer_id})
+        organizer = await organizer_reads.do(
+            organizer_id, lambda: organizers_collection.find_one({"id": organizer_id})
+        )
         if organizer:
             organizer['_id'] = str(organizer['_id'])
         return organizer
 
     @staticmethod
-    async def get_organizers_with_filters(
+    async def attach_organizers(events: List[dict]) -> List[dict]:
+        """Embed organizer data into events with a single batched lookup"""
+        organizer_ids = list({event['organizer_id'] for event in events if event.get('organizer_id')})
+        if not organizer_ids:
+            return events
+        
+        organizers = {}
+        async for organizer in organizers_collection.find({"id": {"$in": organizer_ids}}):
+            organizer['_id'] = str(organizer['_id'])
+            organizers[organizer['id']] = organizer
+        
+        for event in events:
+            organizer = organizers.get(event.get('organizer_id'))
+            if organizer:
+                event['organizer'] = organizer
+        
+        return events
+
+    @staticmethod
+    def build_organizer_query(
         search: Optional[str] = None,
         categories: Optional[List[str]] = None,
         min_rating: Optional[float] = None,
-        max_distance: Optional[float] = None,
-        user_lat: Optional[float] = None,
-        user_lng: Optional[float] = None,
-        sort_by: str = "distance",
-        limit: int = 50
-    ) -> List[dict]:
-        """Get organizers with filters and distance calculation"""
-        
-        # Build query
+        fuzzy: bool = False
+    ) -> dict:
+        """Build the MongoDB filter for organizer list queries"""
         query = {}
         
-        if search:
+        # Fuzzy matching needs the in-memory index; until it is built, fall back to substring search
+        if search and fuzzy and organizer_fuzzy.ready:
+            query["id"] = {"$in": organizer_fuzzy.search(search)}
+        elif search:
             query["$or"] = [
                 {"name": {"$regex": search, "$options": "i"}},
                 {"description": {"$regex": search, "$options": "i"}},
@@ -150,46 +238,82 @@ class Database:
         if min_rating:
             query["rating"] = {"$gte": min_rating}
         
-        # Execute query
-        cursor = organizers_collection.find(query)
-        organizers = await cursor.to_list(length=None)
+        return query
+
+    @staticmethod
+    async def get_organizers_with_filters(
+        search: Optional[str] = None,
+        categories: Optional[List[str]] = None,
+        min_rating: Optional[float] = None,
+        max_distance: Optional[float] = None,
+        user_lat: Optional[float] = None,
+        user_lng: Optional[float] = None,
+        sort_by: str = "distance",
+        limit: int = 50,
+        fuzzy: bool = False
+    ) -> List[dict]:
+        """Get organizers with filters and distance calculation"""
         
-        # Calculate distances and filter by max_distance
-        result_organizers = []
+        # Build query
+        query = Database.build_organizer_query(search, categories, min_rating, fuzzy)
+        
+        record_query_shape("organizers", query, ORGANIZER_SORT_FIELDS.get(sort_by))
+        
+        # With a user location, let the 2dsphere index find and order nearby organizers
+        if user_lat is not None and user_lng is not None:
+            return await Database.get_nearby_organizers(query, user_lat, user_lng, max_distance, sort_by, limit)
+        
+        # Without a location there is no distance, so a distance sort keeps natural order
+        cursor = organizers_collection.find(query)
+        db_sort = ORGANIZER_SORT_FIELDS.get(sort_by)
+        if db_sort:
+            cursor = cursor.sort(db_sort)
+        organizers = await cursor.limit(limit).to_list(length=limit)
         
         for organizer in organizers:
             organizer['_id'] = str(organizer['_id'])
-            
-            # Calculate distance if user location provided
-            if user_lat is not None and user_lng is not None:
-                distance = Database.calculate_distance(
-                    user_lat, user_lng,
-                    organizer['location']['lat'], organizer['location']['lng']
-                )
-                organizer['distance'] = distance
-                
-                # Filter by max distance
-                if max_distance and distance > max_distance:
-                    continue
-            
-            result_organizers.append(organizer)
         
-        # Sort results
-        if sort_by == "distance" and user_lat is not None:
-            result_organizers.sort(key=lambda x: x.get('distance', float('inf')))
-        elif sort_by == "rating":
-            result_organizers.sort(key=lambda x: x.get('rating', 0), reverse=True)
-        elif sort_by == "events":
-            result_organizers.sort(key=lambda x: x.get('totalEvents', 0), reverse=True)
-        elif sort_by == "name":
-            result_organizers.sort(key=lambda x: x.get('name', ''))
+        return organizers
+
+    @staticmethod
+    async def get_nearby_organizers(
+        query: dict,
+        user_lat: float,
+        user_lng: float,
+        max_distance: Optional[float] = None,
+        sort_by: str = "distance",
+        limit: int = 50
+    ) -> List[dict]:
+        """Get organizers near a location with $geoNear, optionally re-sorted"""
+        geo_near = {
+            "near": geo_point({"lat": user_lat, "lng": user_lng}),
+            "distanceField": "distance",
+            "distanceMultiplier": 1 / METERS_PER_MILE,
+            "query": query,
+            "spherical": True
+        }
+        if max_distance:
+            geo_near["maxDistance"] = max_distance * METERS_PER_MILE
+        
+        pipeline = [{"$geoNear": geo_near}]
+        db_sort = ORGANIZER_SORT_FIELDS.get(sort_by)
+        if db_sort:
+            pipeline.append({"$sort": dict(db_sort)})
+        pipeline.append({"$limit": limit})
+        
+        organizers = await organizers_collection.aggregate(pipeline).to_list(length=limit)
+        for organizer in organizers:
+            organizer['_id'] = str(organizer['_id'])
+            organizer['distance'] = round(organizer['distance'], 1)
         
-        return result_organizers[:limit]
+        return organizers
 
     @staticmethod
     async def update_organizer(organizer_id: str, update_data: dict) -> bool:
         """Update organizer data"""
         update_data['updated_at'] = datetime.utcnow()
+        if 'location' in update_data:
+            update_data['geo'] = geo_point(update_data['location'])
         result = await organizers_collection.update_one(
             {"id": organizer_id},
             {"$set": update_data}
@@ -202,15 +326,26 @@ class Database:
         """Create a new event"""
         event_data['created_at'] = datetime.utcnow()
         event_data['updated_at'] = datetime.utcnow()
+        event_data['starts_at'] = Database.parse_start_time(event_data.get('date'), event_data.get('time'))
+        event_data['geo'] = geo_point(event_data.get('location'))
+        event_data['city_key'] = city_key(event_data.get('location'))
         
         result = await events_collection.insert_one(event_data)
         event_data['_id'] = str(result.inserted_id)
         return event_data
 
     @staticmethod
-    async def get_event_by_id(event_id: str, user_lat: Optional[float] = None, user_lng: Optional[float] = None) -> Optional[dict]:
-        """Get event by ID with optional distance calculation"""
+    async def find_event(event_id: str) -> Optional[dict]:
+        """Find an event in the live collection, then in the archive"""
         event = await events_collection.find_one({"id": event_id})
+        if event is None:
+            event = await events_archive_collection.find_one({"id": event_id})
+        return event
+
+    @staticmethod
+    async def get_event_by_id(event_id: str, user_lat: Optional[float] = None, user_lng: Optional[float] = None) -> Optional[dict]:
+        """Get event by ID with optional distance calculation, falling back to archived events"""
+        event = await event_reads.do(event_id, lambda: Database.find_event(event_id))
         
         if event:
             event['_id'] = str(event['_id'])
@@ -231,24 +366,24 @@ class Database:
         return event
 
     @staticmethod
-    async def get_events_with_filters(
+    def build_event_query(
         search: Optional[str] = None,
         category: Optional[str] = None,
         min_price: Optional[float] = None,
         max_price: Optional[float] = None,
         min_rating: Optional[float] = None,
-        max_distance: Optional[float] = None,
-        user_lat: Optional[float] = None,
-        user_lng: Optional[float] = None,
-        sort_by: str = "distance",
-        limit: int = 50
-    ) -> List[dict]:
-        """Get events with filters and distance calculation"""
-        
-        # Build query
+        date_from: Optional[date] = None,
+        date_to: Optional[date] = None,
+        upcoming: bool = False,
+        fuzzy: bool = False
+    ) -> dict:
+        """Build the MongoDB filter for event list queries"""
         query = {}
         
-        if search:
+        # Fuzzy matching needs the in-memory index; until it is built, fall back to substring search
+        if search and fuzzy and event_fuzzy.ready:
+            query["id"] = {"$in": event_fuzzy.search(search)}
+        elif search:
             query["$or"] = [
                 {"title": {"$regex": search, "$options": "i"}},
                 {"description": {"$regex": search, "$options": "i"}},
@@ -263,22 +398,64 @@ class Database:
             query["rating"] = {"$gte": min_rating}
         
         # Price filtering
-        price_query = {}
         if min_price is not None:
-            price_query["price.min"] = {"$gte": min_price}
+            query["price.min"] = {"$gte": min_price}
         if max_price is not None:
-            price_query["price.max"] = {"$lte": max_price}
-        if price_query:
-            query.update(price_query)
+            query["price.max"] = {"$lte": max_price}
+        
+        # Start time filtering; date_to includes the whole day
+        starts_at_query = {}
+        if date_from is not None:
+            starts_at_query["$gte"] = datetime.combine(date_from, datetime.min.time())
+        if upcoming:
+            now = datetime.utcnow()
+            starts_at_query["$gte"] = max(starts_at_query.get("$gte", now), now)
+        if date_to is not None:
+            starts_at_query["$lt"] = datetime.combine(date_to + timedelta(days=1), datetime.min.time())
+        if starts_at_query:
+            query["starts_at"] = starts_at_query
+        
+        return query
+
+    @staticmethod
+    async def get_events_with_filters(
+        search: Optional[str] = None,
+        category: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        min_rating: Optional[float] = None,
+        max_distance: Optional[float] = None,
+        user_lat: Optional[float] = None,
+        user_lng: Optional[float] = None,
+        sort_by: str = "distance",
+        limit: int = 50,
+        date_from: Optional[date] = None,
+        date_to: Optional[date] = None,
+        upcoming: bool = False,
+        fuzzy: bool = False
+    ) -> List[dict]:
+        """Get events with filters and distance calculation"""
         
-        # Execute query
+        # Build query
+        query = Database.build_event_query(
+            search, category, min_price, max_price, min_rating, date_from, date_to, upcoming, fuzzy
+        )
+        
+        record_query_shape("events", query, EVENT_SORT_FIELDS.get(sort_by))
+        
+        # Execute query, sorting in the database unless ordering by distance
         cursor = events_collection.find(query)
-        events = await cursor.to_list(length=None)
+        db_sort = EVENT_SORT_FIELDS.get(sort_by)
+        filter_distance = user_lat is not None and user_lng is not None and max_distance
+        if db_sort:
+            cursor = cursor.sort(db_sort)
+            if not filter_distance:
+                cursor = cursor.limit(limit)
         
-        # Calculate distances, get organizer data, and filter by max_distance
+        # Calculate distances and filter by max_distance
         result_events = []
         
-        for event in events:
+        async for event in cursor:
             event['_id'] = str(event['_id'])
             
             # Calculate distance if user location provided
@@ -293,29 +470,31 @@ class Database:
                 if max_distance and distance > max_distance:
                     continue
             
-            # Get organizer data
-            organizer = await Database.get_organizer_by_id(event['organizer_id'])
-            if organizer:
-                event['organizer'] = organizer
-            
             result_events.append(event)
+            
+            # Results already arrive in order, so stop once the page is full
+            if db_sort and len(result_events) >= limit:
+                break
         
         # Sort results
         if sort_by == "distance" and user_lat is not None:
             result_events.sort(key=lambda x: x.get('distance', float('inf')))
-        elif sort_by == "date":
-            result_events.sort(key=lambda x: x.get('date', ''))
-        elif sort_by == "rating":
-            result_events.sort(key=lambda x: x.get('rating', 0), reverse=True)
-        elif sort_by == "price":
-            result_events.sort(key=lambda x: x.get('price', {}).get('min', 0))
         
-        return result_events[:limit]
+        # Get organizer data for the returned page only
+        result_events = result_events[:limit]
+        await Database.attach_organizers(result_events)
+        
+        return result_events
 
     @staticmethod
     async def update_event(event_id: str, update_data: dict) -> bool:
         """Update event data"""
         update_data['updated_at'] = datetime.utcnow()
+        if 'date' in update_data and 'time' in update_data:
+            update_data['starts_at'] = Database.parse_start_time(update_data['date'], update_data['time'])
+        if 'location' in update_data:
+            update_data['geo'] = geo_point(update_data['location'])
+            update_data['city_key'] = city_key(update_data['location'])
         result = await events_collection.update_one(
             {"id": event_id},
             {"$set": update_data}
@@ -323,8 +502,53 @@ class Database:
         return result.modified_count > 0
 
     @staticmethod
-    async def add_event_review(event_id: str, review_data: dict) -> bool:
-        """Add a review to an event"""
+    async def increment_event_attendees(event_id: str) -> Optional[int]:
+        """Atomically add an attendee, returning the new count; safe under coalesced reads"""
+        event = await events_collection.find_one_and_update(
+            {"id": event_id},
+            {"$inc": {"attendees": 1}, "$set": {"updated_at": datetime.utcnow()}},
+            projection={"_id": 0, "attendees": 1},
+            return_document=ReturnDocument.AFTER
+        )
+        return event["attendees"] if event else None
+
+    @staticmethod
+    async def record_trending_signal(event_id: str, signal: str, count: int = 1):
+        """Add an RSVP, save, review or view to an event's trending score in one write"""
+        # No updated_at: the score is ranking bookkeeping, not a content change
+        await events_collection.update_one(
+            {"id": event_id},
+            score_update(SIGNAL_WEIGHTS[signal] * count)
+        )
+
+    @staticmethod
+    async def get_trending_events(
+        city: Optional[str] = None,
+        user_lat: Optional[float] = None,
+        user_lng: Optional[float] = None,
+        limit: int = 20
+    ) -> List[dict]:
+        """Get the highest scoring events, overall or in one city, as a single index range read"""
+        query: Dict[str, Any] = {"trending_score": {"$gt": 0}}
+        if city is not None:
+            query["city_key"] = city_key({"city": city})
+
+        cursor = events_collection.find(query, EVENT_LIST_PROJECTION).sort("trending_score", -1).limit(limit)
+        events = await cursor.to_list(length=limit)
+        for event in events:
+            event['_id'] = str(event['_id'])
+            event['trending'] = round(decayed_score(event), 3)
+            if user_lat is not None and user_lng is not None:
+                event['distance'] = Database.calculate_distance(
+                    user_lat, user_lng,
+                    event['location']['lat'], event['location']['lng']
+                )
+        await Database.attach_organizers(events)
+        return events
+
+    @staticmethod
+    async def add_event_review(event_id: str, review_data: dict, recalculate: bool = True) -> bool:
+        """Add a review to an event, optionally recalculating its rating straight away"""
         result = await events_collection.update_one(
             {"id": event_id},
             {
@@ -335,7 +559,8 @@ class Database:
         
         if result.modified_count > 0:
             # Recalculate event rating
-            await Database.recalculate_event_rating(event_id)
+            if recalculate:
+                await Database.recalculate_event_rating(event_id)
             return True
         
         return False
@@ -359,15 +584,190 @@ class Database:
         return False
 
     @staticmethod
-    async def get_events_by_organizer(organizer_id: str) -> List[dict]:
-        """Get all events by organizer"""
-        cursor = events_collection.find({"organizer_id": organizer_id})
-        events = await cursor.to_list(length=None)
+    async def get_event_counters(event_ids: List[str]) -> Dict[str, dict]:
+        """Get the live-updated fields of events: attendees, rating and review count"""
+        projection = {
+            "_id": 0, "id": 1, "attendees": 1, "rating": 1,
+            "reviewCount": {"$size": {"$ifNull": ["$reviews", []]}}
+        }
+        counters = {}
+        async for event in events_collection.find({"id": {"$in": event_ids}}, projection):
+            counters[event.pop("id")] = event
+        return counters
+
+    @staticmethod
+    def encode_cursor(data: dict) -> str:
+        """Encode a pagination position as an opaque string"""
+        return base64.urlsafe_b64encode(json.dumps(data).encode()).decode()
+
+    @staticmethod
+    def decode_cursor(cursor: str) -> dict:
+        """Decode a pagination cursor, raising ValueError if it is malformed"""
+        try:
+            return json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        except Exception:
+            raise ValueError("Invalid cursor")
+
+    @staticmethod
+    def decode_organizer_events_cursor(cursor: str, by_distance: bool) -> dict:
+        """Decode an organizer events cursor for the given ordering, raising ValueError if it is malformed or from the other ordering"""
+        position = Database.decode_cursor(cursor)
+        try:
+            if by_distance:
+                return {"d": float(position["d"]), "id": ObjectId(position["id"])}
+            # A null start time means the page ended among the undated events
+            starts_at = datetime.fromisoformat(position["v"]) if position["v"] is not None else None
+            return {"v": starts_at, "id": ObjectId(position["id"])}
+        except (KeyError, TypeError, ValueError, InvalidId):
+            raise ValueError("Invalid cursor")
+
+    @staticmethod
+    def encode_organizer_events_cursor(event: dict, by_distance: bool) -> str:
+        """Encode the keyset position after an event of an organizer events page"""
+        if by_distance:
+            return Database.encode_cursor({"d": event["distance"], "id": str(event["_id"])})
+        starts_at = event.get("starts_at")
+        return Database.encode_cursor({
+            "v": starts_at.isoformat() if isinstance(starts_at, datetime) else None,
+            "id": str(event["_id"])
+        })
+
+    @staticmethod
+    def build_organizer_events_query(organizer_id: str, when: str = "all") -> dict:
+        """Build the query for an organizer's upcoming, past or (for "all") every event"""
+        query = {"organizer_id": organizer_id}
+        now = datetime.utcnow()
+        if when == "upcoming":
+            query["starts_at"] = {"$gte": now}
+        elif when == "past":
+            query["starts_at"] = {"$lt": now}
+        return query
+
+    @staticmethod
+    async def get_events_by_organizer(
+        organizer_id: str,
+        when: str = "all",
+        order_by: str = "date",
+        cursor: Optional[str] = None,
+        limit: int = 20,
+        user_lat: Optional[float] = None,
+        user_lng: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """Get a page of an organizer's events ordered by start time or distance"""
+        query = Database.build_organizer_events_query(organizer_id, when)
+        by_distance = order_by == "distance" and user_lat is not None and user_lng is not None
+        position = Database.decode_organizer_events_cursor(cursor, by_distance) if cursor else None
+        
+        if by_distance:
+            geo_near = {
+                "near": geo_point({"lat": user_lat, "lng": user_lng}),
+                "distanceField": "distance",
+                "query": query,
+                "spherical": True
+            }
+            pipeline = [{"$geoNear": geo_near}, {"$sort": {"distance": 1, "_id": 1}}]
+            if position:
+                # Events at one venue share a distance, so ties resume on _id
+                geo_near["minDistance"] = position["d"]
+                pipeline.append({"$match": {"$or": [
+                    {"distance": {"$gt": position["d"]}},
+                    {"distance": position["d"], "_id": {"$gt": position["id"]}}
+                ]}})
+            pipeline += [{"$limit": limit + 1}, {"$project": EVENT_LIST_PROJECTION}]
+            events = await events_collection.aggregate(pipeline).to_list(length=limit + 1)
+            has_more = len(events) > limit
+            events = events[:limit]
+            next_cursor = Database.encode_organizer_events_cursor(events[-1], True) if has_more else None
+            
+            for event in events:
+                event['distance'] = round(event['distance'] / METERS_PER_MILE, 1)
+        else:
+            # Past events read newest first, everything else soonest first; "all"
+            # ends with events whose start time is unknown, in _id order
+            direction = -1 if when == "past" else 1
+            events = []
+            if not (position and position["v"] is None):
+                dated = dict(query)
+                if when == "all":
+                    dated["starts_at"] = {"$type": "date"}
+                if position:
+                    op = "$lt" if direction == -1 else "$gt"
+                    dated["$or"] = [
+                        {"starts_at": {op: position["v"]}},
+                        {"starts_at": position["v"], "_id": {op: position["id"]}}
+                    ]
+                db_cursor = events_collection.find(dated, EVENT_LIST_PROJECTION)
+                db_cursor = db_cursor.sort([("starts_at", direction), ("_id", direction)]).limit(limit + 1)
+                events = await db_cursor.to_list(length=limit + 1)
+            
+            if when == "all" and len(events) <= limit:
+                undated = {**query, "starts_at": None}
+                if position and position["v"] is None:
+                    undated["_id"] = {"$gt": position["id"]}
+                db_cursor = events_collection.find(undated, EVENT_LIST_PROJECTION).sort("_id", 1).limit(limit + 1 - len(events))
+                events += await db_cursor.to_list(length=limit + 1 - len(events))
+            
+            has_more = len(events) > limit
+            events = events[:limit]
+            next_cursor = Database.encode_organizer_events_cursor(events[-1], False) if has_more else None
+            
+            if user_lat is not None and user_lng is not None:
+                for event in events:
+                    event['distance'] = Database.calculate_distance(
+                        user_lat, user_lng,
+                        event['location']['lat'], event['location']['lng']
+                    )
         
         for event in events:
             event['_id'] = str(event['_id'])
         
-        return events
+        return {"events": events, "next_cursor": next_cursor, "has_more": has_more}
+
+    @staticmethod
+    async def get_events_by_ids(
+        event_ids: List[str],
+        user_lat: Optional[float] = None,
+        user_lng: Optional[float] = None,
+        projection: Optional[dict] = EVENT_LIST_PROJECTION
+    ) -> List[dict]:
+        """Get events in the order of the given ids, skipping ids that do not exist; the archive is only read for misses"""
+        event_ids = list(dict.fromkeys(event_ids))
+        events = {}
+        for collection in (events_collection, events_archive_collection):
+            missing = [event_id for event_id in event_ids if event_id not in events]
+            if not missing:
+                break
+            async for event in collection.find({"id": {"$in": missing}}, projection):
+                event['_id'] = str(event['_id'])
+                if user_lat is not None and user_lng is not None:
+                    event['distance'] = Database.calculate_distance(
+                        user_lat, user_lng,
+                        event['location']['lat'], event['location']['lng']
+                    )
+                events[event['id']] = event
+        
+        ordered = [events[event_id] for event_id in event_ids if event_id in events]
+        return await Database.attach_organizers(ordered)
+
+    @staticmethod
+    async def get_organizers_by_ids(
+        organizer_ids: List[str],
+        user_lat: Optional[float] = None,
+        user_lng: Optional[float] = None
+    ) -> List[dict]:
+        """Get organizers in the order of the given ids with one query, skipping ids that do not exist"""
+        organizer_ids = list(dict.fromkeys(organizer_ids))
+        organizers = {}
+        async for organizer in organizers_collection.find({"id": {"$in": organizer_ids}}):
+            organizer['_id'] = str(organizer['_id'])
+            if user_lat is not None and user_lng is not None:
+                organizer['distance'] = Database.calculate_distance(
+                    user_lat, user_lng,
+                    organizer['location']['lat'], organizer['location']['lng']
+                )
+            organizers[organizer['id']] = organizer
+        
+        return [organizers[organizer_id] for organizer_id in organizer_ids if organizer_id in organizers]
 
     @staticmethod
     async def get_user_saved_events(user_id: str, user_lat: Optional[float] = None, user_lng: Optional[float] = None) -> List[dict]:
@@ -376,33 +776,30 @@ class Database:
         if not user or not user.get('savedEvents'):
             return []
         
-        saved_event_ids = user['savedEvents']
-        cursor = events_collection.find({"id": {"$in": saved_event_ids}})
-        events = await cursor.to_list(length=None)
-        
-        # Add distance calculation and organizer data
-        result_events = []
-        for event in events:
-            event['_id'] = str(event['_id'])
-            
-            # Calculate distance if user location provided
-            if user_lat is not None and user_lng is not None:
-                distance = Database.calculate_distance(
-                    user_lat, user_lng,
-                    event['location']['lat'], event['location']['lng']
-                )
-                event['distance'] = distance
-            
-            # Get organizer data
-            organizer = await Database.get_organizer_by_id(event['organizer_id'])
-            if organizer:
-                event['organizer'] = organizer
-            
-            result_events.append(event)
-        
-        return result_events
+        return await Database.get_events_by_ids(user['savedEvents'], user_lat, user_lng, projection=None)
+
+class Database(MotorRepository):
+    """Data access used across the API.
+
+    Query helpers live here; storage calls go to the repository chosen with
+    use_repository, MongoDB unless another backend is configured.
+    """
+
+def use_repository(repository: Repository):
+    """Send Database storage calls to a repository"""
+    for name in Repository.__abstractmethods__:
+        setattr(Database, name, staticmethod(getattr(repository, name)))
 
 # Initialize database on import
 async def init_database():
-    """Initialize database indexes"""
-    await Database.create_indexes()
\ No newline at end of file
+    """Start reconciling database indexes in the background"""
+    index_reconciler.start()
+    if query_shape_recorder.enabled:
+        query_shape_recorder.start(db)
+    return index_reconciler
+
+async def close_database():
+    """Stop background database work"""
+    index_reconciler.cancel()
+    if query_shape_recorder.enabled:
+        await query_shape_recorder.stop(db)
@@ -0,0 +1,232 @@
+from typing import Optional, List, Dict, Any
+from datetime import date
+from database import Database, events_collection, organizers_collection
+from geo import geo_point, METERS_PER_MILE
+
+# The result page and the facet counts are computed over at most this many
+# matching documents: the nearest ones when there is an origin, otherwise the
+# first ones in the requested order
+FACET_SCAN_LIMIT = 5000
+
+# Bucket boundaries; each bucket covers [boundary, next boundary)
+PRICE_BOUNDARIES = [0, 0.01, 25, 50, 100]
+PRICE_LABELS = ["Free", "Under $25", "$25 - $50", "$50 - $100", "$100+"]
+RATING_BOUNDARIES = [0, 1, 2, 3, 4, 4.5]
+RATING_LABELS = ["0+", "1+", "2+", "3+", "4+", "4.5+"]
+DISTANCE_RINGS = [1, 5, 10, 25, 50, 100]
+
+EVENT_FACETS = ["category", "price", "rating", "distance"]
+ORGANIZER_FACETS = ["category", "rating", "distance"]
+
+EVENT_SORTS = {
+    "distance": {"distance": 1},
+    "date": {"starts_at": 1},
+    "rating": {"rating": -1},
+    "price": {"price.min": 1},
+    "trending": {"trending_score": -1},
+}
+ORGANIZER_SORTS = {
+    "distance": {"distance": 1},
+    "rating": {"rating": -1},
+    "events": {"totalEvents": -1},
+    "name": {"name": 1},
+}
+
+def parse_facets(facets: Optional[str], allowed: List[str]) -> List[str]:
+    """Parse a comma-separated facet list, raising ValueError for unknown facets"""
+    if not facets:
+        return []
+
+    requested = [facet.strip() for facet in facets.split(",") if facet.strip()]
+    unknown = [facet for facet in requested if facet not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown facets: {', '.join(unknown)}. Allowed: {', '.join(allowed)}")
+    return requested
+
+def bucket_facet(field: str, boundaries: List[float]) -> List[dict]:
+    """Count documents per bucket of a numeric field"""
+    return [{"$bucket": {
+        "groupBy": field,
+        "boundaries": boundaries + [float("inf")],
+        "default": "other",
+        "output": {"count": {"$sum": 1}}
+    }}]
+
+def distance_facet() -> List[dict]:
+    """Count documents within each distance ring (cumulative)"""
+    return [{"$group": {
+        "_id": None,
+        **{
+            f"within_{ring}": {"$sum": {"$cond": [{"$lte": ["$distance", ring]}, 1, 0]}}
+            for ring in DISTANCE_RINGS
+        }
+    }}]
+
+def format_buckets(buckets: List[dict], boundaries: List[float], labels: List[str]) -> List[dict]:
+    """Map $bucket output onto labelled buckets, including empty ones"""
+    counts = {bucket["_id"]: bucket["count"] for bucket in buckets}
+    return [
+        {"label": label, "min": boundary, "count": counts.get(boundary, 0)}
+        for boundary, label in zip(boundaries, labels)
+    ]
+
+def format_distance(groups: List[dict]) -> List[dict]:
+    """Map the distance ring group onto a list of rings"""
+    group = groups[0] if groups else {}
+    return [{"within": ring, "count": group.get(f"within_{ring}", 0)} for ring in DISTANCE_RINGS]
+
+class FacetedSearch:
+    @staticmethod
+    def _pipeline(
+        query: dict,
+        facets: List[str],
+        category_field: str,
+        sort: Optional[dict],
+        limit: int,
+        max_distance: Optional[float],
+        user_lat: Optional[float],
+        user_lng: Optional[float]
+    ) -> List[dict]:
+        """Build one $facet aggregation returning the page, the total and each facet over the same bounded set"""
+        page = []
+        if user_lat is not None and user_lng is not None:
+            # $geoNear reads nearest first through the 2dsphere index, so the
+            # limit keeps the closest matches and a distance sort costs nothing
+            geo_near = {
+                "near": geo_point({"lat": user_lat, "lng": user_lng}),
+                "distanceField": "distance",
+                "distanceMultiplier": 1 / METERS_PER_MILE,
+                "query": query,
+                "spherical": True
+            }
+            if max_distance:
+                geo_near["maxDistance"] = max_distance * METERS_PER_MILE
+            pipeline = [
+                {"$geoNear": geo_near},
+                {"$limit": FACET_SCAN_LIMIT},
+                {"$addFields": {"distance": {"$round": ["$distance", 1]}}}
+            ]
+            if sort and "distance" not in sort:
+                page.append({"$sort": {**sort, "_id": 1}})
+        else:
+            # Sorting before the limit lets an index serve it, so the page is exact even when counts are truncated
+            pipeline = [{"$match": query}]
+            if sort and "distance" not in sort:
+                pipeline.append({"$sort": {**sort, "_id": 1}})
+            pipeline.append({"$limit": FACET_SCAN_LIMIT})
+
+        stages = {
+            "results": page + [{"$limit": limit}],
+            "total": [{"$count": "count"}],
+        }
+        for facet in facets:
+            if facet == "category":
+                category = [{"$unwind": f"${category_field}"}] if category_field == "categories" else []
+                stages["category"] = category + [
+                    {"$group": {"_id": f"${category_field}", "count": {"$sum": 1}}},
+                    {"$sort": {"count": -1, "_id": 1}}
+                ]
+            elif facet == "price":
+                stages["price"] = bucket_facet("$price.min", PRICE_BOUNDARIES)
+            elif facet == "rating":
+                stages["rating"] = bucket_facet("$rating", RATING_BOUNDARIES)
+            elif facet == "distance" and "$geoNear" in pipeline[0]:
+                stages["distance"] = distance_facet()
+
+        pipeline.append({"$facet": stages})
+        return pipeline
+
+    @staticmethod
+    async def _run(
+        collection,
+        query: dict,
+        facets: List[str],
+        category_field: str,
+        sort: Optional[dict],
+        limit: int,
+        max_distance: Optional[float],
+        user_lat: Optional[float],
+        user_lng: Optional[float]
+    ):
+        """Run the faceted aggregation, returning the page and the $facet output"""
+        pipeline = FacetedSearch._pipeline(query, facets, category_field, sort, limit, max_distance, user_lat, user_lng)
+        result = (await collection.aggregate(pipeline).to_list(length=1))[0]
+        documents = result["results"]
+        for document in documents:
+            document['_id'] = str(document['_id'])
+        return documents, result
+
+    @staticmethod
+    def _format(result: dict, facets: List[str]) -> Dict[str, Any]:
+        """Shape the $facet output for the API"""
+        total = result["total"][0]["count"] if result.get("total") else 0
+        formatted = {}
+        for facet in facets:
+            if facet == "category":
+                formatted["category"] = [
+                    {"value": group["_id"], "count": group["count"]} for group in result["category"]
+                ]
+            elif facet == "price":
+                formatted["price"] = format_buckets(result["price"], PRICE_BOUNDARIES, PRICE_LABELS)
+            elif facet == "rating":
+                formatted["rating"] = format_buckets(result["rating"], RATING_BOUNDARIES, RATING_LABELS)
+            elif facet == "distance":
+                formatted["distance"] = format_distance(result.get("distance", []))
+
+        return {
+            "facets": formatted,
+            "total": total,
+            "truncated": total >= FACET_SCAN_LIMIT,
+        }
+
+    @staticmethod
+    async def search_events(
+        facets: List[str],
+        search: Optional[str] = None,
+        category: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        min_rating: Optional[float] = None,
+        max_distance: Optional[float] = None,
+        user_lat: Optional[float] = None,
+        user_lng: Optional[float] = None,
+        sort_by: str = "distance",
+        limit: int = 50,
+        date_from: Optional[date] = None,
+        date_to: Optional[date] = None,
+        upcoming: bool = False,
+        fuzzy: bool = False
+    ) -> Dict[str, Any]:
+        """Get a page of events together with facet counts over the same filtered set"""
+        query = Database.build_event_query(
+            search, category, min_price, max_price, min_rating, date_from, date_to, upcoming, fuzzy
+        )
+        events, result = await FacetedSearch._run(
+            events_collection, query, facets, "category", EVENT_SORTS.get(sort_by),
+            limit, max_distance, user_lat, user_lng
+        )
+        await Database.attach_organizers(events)
+
+        return {"events": events, **FacetedSearch._format(result, facets)}
+
+    @staticmethod
+    async def search_organizers(
+        facets: List[str],
+        search: Optional[str] = None,
+        categories: Optional[List[str]] = None,
+        min_rating: Optional[float] = None,
+        max_distance: Optional[float] = None,
+        user_lat: Optional[float] = None,
+        user_lng: Optional[float] = None,
+        sort_by: str = "distance",
+        limit: int = 50,
+        fuzzy: bool = False
+    ) -> Dict[str, Any]:
+        """Get a page of organizers together with facet counts over the same filtered set"""
+        query = Database.build_organizer_query(search, categories, min_rating, fuzzy)
+        organizers, result = await FacetedSearch._run(
+            organizers_collection, query, facets, "categories", ORGANIZER_SORTS.get(sort_by),
+            limit, max_distance, user_lat, user_lng
+        )
+
+        return {"organizers": organizers, **FacetedSearch._format(result, facets)}
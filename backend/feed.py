@@ -0,0 +1,174 @@
+from typing import Optional, List, Dict, Any
+from datetime import datetime
+import math
+from database import Database, events_collection
+from geo import geo_point, METERS_PER_MILE
+from similarity import EventSimilarity, CATEGORY_WEIGHT, GEO_WEIGHT, DATE_WEIGHT, PRICE_WEIGHT
+from cache import TTLCache
+from metrics import metrics
+
+# Upper bound on candidate events ranked for one feed
+CANDIDATE_LIMIT = 500
+
+# Number of ranked events kept per cached feed
+FEED_SIZE = 100
+
+# Saved events compared against each candidate
+SAVED_EVENTS_LIMIT = 20
+
+# Ranking weights
+PREFERENCE_WEIGHT = 3.0
+DISTANCE_WEIGHT = 2.0
+RATING_WEIGHT = 1.5
+POPULARITY_WEIGHT = 1.0
+SAVED_SIMILARITY_WEIGHT = 2.0
+
+# A cached feed is reused while the user stays within this many degrees of its origin
+ORIGIN_TOLERANCE_DEG = 0.01
+
+# Highest score EventSimilarity.score can return, used for normalisation
+MAX_SIMILARITY = CATEGORY_WEIGHT + GEO_WEIGHT + DATE_WEIGHT + PRICE_WEIGHT
+
+# Fields returned for each feed entry
+LIST_PROJECTION = {"_id": 0, "reviews": 0}
+
+feed_cache = TTLCache(ttl=120, max_entries=10000)
+metrics.register_gauge("feed_cache", feed_cache.stats)
+
+class EventFeed:
+    @staticmethod
+    async def get_candidates(lat: float, lng: float, max_distance: float) -> List[dict]:
+        """Fetch the upcoming events closest to a location, nearest first"""
+        pipeline = [
+            {"$geoNear": {
+                "near": geo_point({"lat": lat, "lng": lng}),
+                "distanceField": "distance",
+                "distanceMultiplier": 1 / METERS_PER_MILE,
+                "maxDistance": max_distance * METERS_PER_MILE,
+                "query": {"starts_at": {"$gte": datetime.utcnow()}},
+                "spherical": True
+            }},
+            {"$limit": CANDIDATE_LIMIT},
+            {"$project": LIST_PROJECTION}
+        ]
+        return await events_collection.aggregate(pipeline).to_list(length=CANDIDATE_LIMIT)
+
+    @staticmethod
+    async def get_saved_events(user: dict) -> List[dict]:
+        """Fetch the most recently saved events of a user"""
+        saved_ids = (user.get("savedEvents") or [])[-SAVED_EVENTS_LIMIT:]
+        if not saved_ids:
+            return []
+
+        cursor = events_collection.find({"id": {"$in": saved_ids}}, LIST_PROJECTION)
+        return await cursor.to_list(length=SAVED_EVENTS_LIMIT)
+
+    @staticmethod
+    def rank(
+        candidates: List[dict],
+        preferences: Dict[str, Any],
+        saved_events: List[dict],
+        lat: float,
+        lng: float,
+        max_distance: float
+    ) -> List[dict]:
+        """Score candidates against the user's preferences and saved events"""
+        categories = set(preferences.get("categories") or [])
+        price_range = preferences.get("priceRange") or {}
+        price_max = price_range.get("max") or 0
+        saved_ids = {event["id"] for event in saved_events}
+        max_attendees = max((event.get("attendees", 0) for event in candidates), default=0)
+
+        ranked = []
+        for event in candidates:
+            if event["id"] in saved_ids:
+                continue
+
+            distance = Database.calculate_distance(lat, lng, event["location"]["lat"], event["location"]["lng"])
+            if distance > max_distance:
+                continue
+
+            # Preference match: preferred category and a price within the preferred range
+            preference = 0.0
+            if not categories or event.get("category") in categories:
+                preference += 0.5
+            event_price = event.get("price", {}).get("min", 0)
+            if not price_max or price_range.get("min", 0) <= event_price <= price_max:
+                preference += 0.5
+
+            popularity = 0.0
+            if max_attendees:
+                popularity = math.log1p(event.get("attendees", 0)) / math.log1p(max_attendees)
+
+            similarity = 0.0
+            if saved_events:
+                similarity = max(EventSimilarity.score(event, saved) for saved in saved_events) / MAX_SIMILARITY
+
+            score = (
+                PREFERENCE_WEIGHT * preference
+                + DISTANCE_WEIGHT * (1 - distance / max_distance)
+                + RATING_WEIGHT * event.get("rating", 0) / 5
+                + POPULARITY_WEIGHT * popularity
+                + SAVED_SIMILARITY_WEIGHT * similarity
+            )
+
+            event["distance"] = distance
+            event["score"] = round(score, 4)
+            ranked.append(event)
+
+        ranked.sort(key=lambda x: x["score"], reverse=True)
+        return ranked[:FEED_SIZE]
+
+    @staticmethod
+    async def get_feed(
+        user: dict,
+        user_lat: Optional[float] = None,
+        user_lng: Optional[float] = None,
+        limit: int = 20
+    ) -> Optional[List[dict]]:
+        """Get the ranked feed of a user, or None if no location is known"""
+        location = user.get("location") or {}
+        lat = user_lat if user_lat is not None else location.get("lat")
+        lng = user_lng if user_lng is not None else location.get("lng")
+        if lat is None or lng is None:
+            return None
+
+        cached = feed_cache.get(user["id"])
+        if (
+            cached is not None
+            and abs(cached["lat"] - lat) <= ORIGIN_TOLERANCE_DEG
+            and abs(cached["lng"] - lng) <= ORIGIN_TOLERANCE_DEG
+        ):
+            return cached["events"][:limit]
+
+        preferences = user.get("preferences") or {}
+        max_distance = preferences.get("maxDistance") or 25
+
+        candidates = await EventFeed.get_candidates(lat, lng, max_distance)
+        saved_events = await EventFeed.get_saved_events(user)
+        events = EventFeed.rank(candidates, preferences, saved_events, lat, lng, max_distance)
+
+        feed_cache.set(user["id"], {"lat": lat, "lng": lng, "max_distance": max_distance, "events": events})
+        return events[:limit]
+
+    @staticmethod
+    def invalidate_user(user_id: str):
+        """Drop the cached feed of a user after their preferences or saved events change"""
+        feed_cache.invalidate(user_id)
+
+    @staticmethod
+    def invalidate_event(event_id: str, location: Optional[dict] = None) -> int:
+        """Drop the cached feeds listing an event, and those whose area now contains it"""
+        def affected(user_id, feed) -> bool:
+            if any(event["id"] == event_id for event in feed["events"]):
+                return True
+            if not location or location.get("lat") is None or location.get("lng") is None:
+                return False
+            distance = Database.calculate_distance(feed["lat"], feed["lng"], location["lat"], location["lng"])
+            return distance <= feed["max_distance"]
+        return feed_cache.invalidate_where(affected)
+
+    @staticmethod
+    def invalidate_all():
+        """Drop every cached feed after the event inventory changes"""
+        feed_cache.clear()
@@ -0,0 +1,234 @@
+import asyncio
+import logging
+import os
+import re
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Set, Tuple
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Vocabulary words per query word that are edit-distance checked, best trigram overlap first
+FUZZY_CANDIDATES = 64
+
+# Most document ids a fuzzy search hands to the database query
+FUZZY_MAX_MATCHES = int(os.environ.get("FUZZY_MAX_MATCHES", 1000))
+
+# Seconds between full rebuilds, which also drop deleted documents
+FUZZY_REBUILD_INTERVAL = float(os.environ.get("FUZZY_REBUILD_INTERVAL", 3600))
+
+_TOKEN_RE = re.compile(r"[^\w]+", re.UNICODE)
+
+def tokenize(text: str) -> List[str]:
+    """Split text into lowercase words, ignoring punctuation"""
+    return _TOKEN_RE.sub(" ", text.lower()).split()
+
+def max_edits(word: str) -> int:
+    """Typos tolerated in a query word; short words must match exactly"""
+    if len(word) <= 3:
+        return 0
+    if len(word) <= 6:
+        return 1
+    return 2
+
+def trigrams(word: str) -> Set[str]:
+    """Return the trigrams of a word padded at both ends, so short words still have some"""
+    padded = f"${word}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Return the edit distance counting adjacent transpositions, or limit + 1 once it exceeds limit"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2: Optional[List[int]] = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if previous2 is not None and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+class FuzzyIndex:
+    """Typo-tolerant word index over a few text fields of one collection.
+
+    Documents are indexed by word, and the vocabulary by trigram. A query word is
+    matched against the vocabulary words sharing the most trigrams with it, so edit
+    distance only runs on a handful of candidates however many documents there are.
+    """
+
+    def __init__(self, name: str, fields: List[str]):
+        self.name = name
+        self.fields = fields
+        # word -> ids of documents containing it
+        self.postings: Dict[str, Set[str]] = {}
+        # trigram -> vocabulary words containing it
+        self.grams: Dict[str, Set[str]] = {}
+        # document id -> its words, for updates and removal
+        self.documents: Dict[str, Set[str]] = {}
+        # Writes made while load() builds a fresh index, replayed onto it before the swap
+        self._pending: Optional[List[Tuple[Callable, tuple]]] = None
+        self.ready = False
+        self._task: Optional[asyncio.Task] = None
+
+    def words_of(self, document: dict) -> Set[str]:
+        words = set()
+        for field in self.fields:
+            value = document
+            for part in field.split("."):
+                value = value.get(part) if isinstance(value, dict) else None
+            if isinstance(value, str):
+                words.update(tokenize(value))
+        return words
+
+    def index(self, document: dict):
+        """Add or update a document"""
+        if self._pending is not None:
+            self._pending.append((FuzzyIndex.index, (document,)))
+        self._remove(document["id"])
+        words = self.words_of(document)
+        self.documents[document["id"]] = words
+        for word in words:
+            postings = self.postings.get(word)
+            if postings is None:
+                postings = self.postings[word] = set()
+                for gram in trigrams(word):
+                    self.grams.setdefault(gram, set()).add(word)
+            postings.add(document["id"])
+
+    def remove(self, document_id: str):
+        """Drop a document, and any words only it used"""
+        if self._pending is not None:
+            self._pending.append((FuzzyIndex.remove, (document_id,)))
+        self._remove(document_id)
+
+    def _remove(self, document_id: str):
+        for word in self.documents.pop(document_id, ()):
+            postings = self.postings[word]
+            postings.discard(document_id)
+            if postings:
+                continue
+            del self.postings[word]
+            for gram in trigrams(word):
+                words = self.grams[gram]
+                words.discard(word)
+                if not words:
+                    del self.grams[gram]
+
+    def similar_words(self, word: str) -> Dict[str, int]:
+        """Return vocabulary words within the tolerated edit distance of a query word, with their distances"""
+        limit = max_edits(word)
+        matches = {word: 0} if word in self.postings else {}
+        if limit == 0:
+            return matches
+
+        # A word within k edits of the query keeps all but at most 3k of its trigrams
+        grams = trigrams(word)
+        shared = Counter()
+        for gram in grams:
+            shared.update(self.grams.get(gram, ()))
+        needed = max(1, len(grams) - 3 * limit)
+        for candidate, count in shared.most_common(FUZZY_CANDIDATES):
+            if count < needed:
+                break
+            if candidate in matches:
+                continue
+            distance = edit_distance(word, candidate, limit)
+            if distance <= limit:
+                matches[candidate] = distance
+        return matches
+
+    def search(self, text: str, limit: int = FUZZY_MAX_MATCHES) -> List[str]:
+        """Return ids of documents matching every query word, closest matches first"""
+        words = tokenize(text)
+        if not words:
+            return []
+
+        matched = [self.similar_words(word) for word in words]
+        if not all(matched):
+            return []
+
+        metrics.inc(f"fuzzy.{self.name}.searches")
+        # Widen the tolerance one edit at a time, so exact matches fill the result first
+        results: List[str] = []
+        seen: Set[str] = set()
+        for tolerance in range(max(max_edits(word) for word in words) + 1):
+            # Posting sets per query word; a document must be in one set of every group
+            groups = [
+                [self.postings[word] for word, distance in matches.items() if distance <= tolerance]
+                for matches in matched
+            ]
+            if not all(groups):
+                continue
+            # Walk the rarest query word's documents and stop once the page is full,
+            # rather than materialising unions of common words
+            groups.sort(key=lambda postings: sum(map(len, postings)))
+            rarest, others = groups[0], groups[1:]
+            for postings in rarest:
+                for document_id in postings:
+                    if document_id in seen:
+                        continue
+                    if all(any(document_id in other for other in group) for group in others):
+                        seen.add(document_id)
+                        results.append(document_id)
+                        if len(results) >= limit:
+                            return results
+        return results
+
+    async def load(self, collection):
+        """Build the index from a collection, then swap it in"""
+        # Writes made meanwhile still reach the current index and are replayed onto the fresh one
+        fresh = FuzzyIndex(self.name, self.fields)
+        self._pending = []
+        try:
+            projection = {"_id": 0, "id": 1, **{field: 1 for field in self.fields}}
+            async for document in collection.find({}, projection):
+                fresh.index(document)
+
+            for method, args in self._pending:
+                method(fresh, *args)
+        finally:
+            self._pending = None
+
+        self.postings = fresh.postings
+        self.grams = fresh.grams
+        self.documents = fresh.documents
+        self.ready = True
+        logger.info("Fuzzy %s index built with %d documents and %d words", self.name, len(self.documents), len(self.postings))
+
+    async def _rebuild_forever(self, collection):
+        while True:
+            try:
+                await self.load(collection)
+            except Exception as e:
+                logger.error("Fuzzy %s index build failed: %s", self.name, e)
+            await asyncio.sleep(FUZZY_REBUILD_INTERVAL)
+
+    def start(self, collection) -> asyncio.Task:
+        """Build the index in the background and rebuild it periodically"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._rebuild_forever(collection))
+        return self._task
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "ready": self.ready,
+            "documents": len(self.documents),
+            "words": len(self.postings),
+            "trigrams": len(self.grams),
+        }
+
+event_fuzzy = FuzzyIndex("events", ["title", "location.name"])
+organizer_fuzzy = FuzzyIndex("organizers", ["name", "location.name"])
+metrics.register_gauge("fuzzy.events", event_fuzzy.stats)
+metrics.register_gauge("fuzzy.organizers", organizer_fuzzy.stats)
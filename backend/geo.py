@@ -0,0 +1,45 @@
+import math
+from typing import Optional, List, Tuple
+
+METERS_PER_MILE = 1609.344
+
+# Miles per degree of latitude
+MILES_PER_DEGREE = 69.0
+
+def geo_point(location: Optional[dict]) -> Optional[dict]:
+    """Build a GeoJSON point from a location with lat/lng"""
+    if not location or location.get("lat") is None or location.get("lng") is None:
+        return None
+    return {"type": "Point", "coordinates": [location["lng"], location["lat"]]}
+
+def cell_of(lat: float, lng: float, size: float) -> Tuple[int, int]:
+    """Return the grid cell containing a point"""
+    return (math.floor(lat / size), math.floor(lng / size))
+
+def cell_key(cell: Tuple[int, int]) -> str:
+    """Serialise a grid cell as a string key"""
+    return f"{cell[0]}:{cell[1]}"
+
+def cell_center(cell: Tuple[int, int], size: float) -> Tuple[float, float]:
+    """Return the lat/lng at the centre of a grid cell"""
+    return ((cell[0] + 0.5) * size, (cell[1] + 0.5) * size)
+
+def cell_half_diagonal(cell: Tuple[int, int], size: float) -> float:
+    """Return the distance in miles from the centre of a cell to its farthest corner"""
+    # Cells are widest on the edge nearest the equator
+    lat = max(abs(cell_center(cell, size)[0]) - size / 2, 0)
+    lat_miles = size / 2 * MILES_PER_DEGREE
+    lng_miles = size / 2 * MILES_PER_DEGREE * math.cos(math.radians(min(lat, 89.9)))
+    return math.hypot(lat_miles, lng_miles)
+
+def cells_within(lat: float, lng: float, radius_miles: float, size: float) -> List[Tuple[int, int]]:
+    """Return the grid cells overlapping a bounding box of the given radius around a point"""
+    lat_delta = radius_miles / MILES_PER_DEGREE
+    lng_delta = radius_miles / (MILES_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01))
+    min_cell = cell_of(lat - lat_delta, lng - lng_delta, size)
+    max_cell = cell_of(lat + lat_delta, lng + lng_delta, size)
+    return [
+        (i, j)
+        for i in range(min_cell[0], max_cell[0] + 1)
+        for j in range(min_cell[1], max_cell[1] + 1)
+    ]
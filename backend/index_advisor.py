@@ -0,0 +1,142 @@
+"""Replay recorded query shapes against explain() and report index usage.
+
+Usage:
+    python index_advisor.py [--collection events] [--min-count 1] [--json]
+"""
+import argparse
+import asyncio
+import json
+from typing import List, Dict, Any
+from bson import json_util
+from database import db
+from indexes import INDEX_SPECS, index_name, matching_index
+
+def plan_stages(plan: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Flatten a winning plan tree into its list of stages"""
+    stages = [plan]
+    for child_key in ("inputStage", "queryPlan"):
+        if child_key in plan:
+            stages.extend(plan_stages(plan[child_key]))
+    for child in plan.get("inputStages", []):
+        stages.extend(plan_stages(child))
+    return stages
+
+async def explain_shape(entry: Dict[str, Any]) -> Dict[str, Any]:
+    """Explain the stored example of a query shape and summarise its plan"""
+    summary = {
+        "collection": entry["collection"],
+        "shape": entry["shape"],
+        "sort": entry.get("sort", []),
+        "count": entry.get("count", 0),
+    }
+    if entry.get("example_truncated"):
+        return {**summary, "indexes": [], "stages": [], "docs_examined": None, "problems": ["example truncated, not replayed"]}
+
+    example = entry["example"]
+    # Shapes recorded before examples were serialised hold the query itself
+    if isinstance(example, str):
+        example = json_util.loads(example)
+    collection = db[entry["collection"]]
+    cursor = collection.find(example)
+    if entry.get("sort"):
+        cursor = cursor.sort([tuple(field) for field in entry["sort"]])
+
+    explanation = await cursor.explain()
+    winning_plan = explanation["queryPlanner"]["winningPlan"]
+    stages = plan_stages(winning_plan)
+    stage_names = [stage["stage"] for stage in stages]
+    indexes = [stage["indexName"] for stage in stages if stage.get("indexName")]
+
+    execution = explanation.get("executionStats", {})
+    problems = []
+    if "COLLSCAN" in stage_names:
+        problems.append("collection scan")
+    if "SORT" in stage_names:
+        problems.append("in-memory sort")
+
+    return {
+        **summary,
+        "indexes": indexes,
+        "stages": stage_names,
+        "docs_examined": execution.get("totalDocsExamined"),
+        "problems": problems,
+    }
+
+async def index_usage(collection: str) -> Dict[str, int]:
+    """Return the number of operations served by each index since server start"""
+    usage = {}
+    async for stat in db[collection].aggregate([{"$indexStats": {}}]):
+        usage[stat["name"]] = stat["accesses"]["ops"]
+    return usage
+
+async def build_report(collections: List[str], min_count: int) -> Dict[str, Any]:
+    """Replay recorded shapes and compare index usage against the managed index set"""
+    query = {"collection": {"$in": collections}, "count": {"$gte": min_count}}
+    shapes = await db.query_shapes.find(query).sort("count", -1).to_list(length=None)
+    plans = [await explain_shape(entry) for entry in shapes]
+
+    report = {"shapes": plans, "collections": {}}
+    for collection in collections:
+        # Specs are matched by key pattern, so indexes the reconciler adopted under other names count as managed
+        specs = INDEX_SPECS.get(collection, [])
+        existing = [index async for index in db[collection].list_indexes()]
+        managed = set()
+        missing = []
+        for spec in specs:
+            index = matching_index(existing, spec["keys"])
+            if index is None:
+                missing.append(index_name(spec["keys"]))
+            else:
+                managed.add(index["name"])
+        usage = await index_usage(collection)
+        used_by_shapes = {
+            index for plan in plans if plan["collection"] == collection for index in plan["indexes"]
+        }
+
+        report["collections"][collection] = {
+            "missing": sorted(missing),
+            "unmanaged": sorted({index["name"] for index in existing} - managed - {"_id_"}),
+            "unused": sorted(
+                name for name, ops in usage.items()
+                if name != "_id_" and ops == 0 and name not in used_by_shapes
+            ),
+            "usage": usage,
+        }
+
+    return report
+
+def print_report(report: Dict[str, Any]):
+    """Print a human-readable advisor report"""
+    print("📊 Query shapes")
+    for plan in report["shapes"]:
+        status = "⚠️  " + ", ".join(plan["problems"]) if plan["problems"] else "✅"
+        print(f"  {status} {plan['collection']} x{plan['count']}")
+        print(f"      filter: {json.dumps(plan['shape'], sort_keys=True)}")
+        if plan["sort"]:
+            print(f"      sort:   {plan['sort']}")
+        print(f"      plan:   {' <- '.join(plan['stages'])} via {plan['indexes'] or 'no index'}")
+        print(f"      docs examined: {plan['docs_examined']}")
+
+    for collection, details in report["collections"].items():
+        print(f"\n🗂️  {collection}")
+        print(f"  missing (managed but not built): {details['missing'] or 'none'}")
+        print(f"  unmanaged (built but not in INDEX_SPECS): {details['unmanaged'] or 'none'}")
+        print(f"  unused (no ops and no recorded shape): {details['unused'] or 'none'}")
+
+async def main():
+    parser = argparse.ArgumentParser(description="Report unused and missing indexes from recorded query shapes")
+    parser.add_argument("--collection", action="append", help="Collection to analyse (repeatable)")
+    parser.add_argument("--min-count", type=int, default=1, help="Ignore shapes seen fewer times than this")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    collections = args.collection or ["events", "organizers"]
+    report = await build_report(collections, args.min_count)
+
+    if args.json:
+        print(json.dumps(report, indent=2, default=str))
+    else:
+        print_report(report)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,301 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Dict, List, Optional, Any
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+# Index definitions per collection. "hot" indexes back the request paths the
+# API serves constantly; the server reports ready once all of them exist.
+# updated_at indexes back the invalidation bus when it has to poll for changes.
+INDEX_SPECS: Dict[str, List[Dict[str, Any]]] = {
+    "users": [
+        {"keys": [("email", 1)], "unique": True, "hot": True},
+        {"keys": [("id", 1)], "hot": True},
+        {"keys": [("updated_at", 1)]},
+    ],
+    # Event list queries filter on category (equality), rating, price and
+    # starts_at (ranges) and sort by starts_at, rating, price.min or
+    # trending_score. Each index puts the equality field first, then the sort
+    # field, then range fields.
+    "events": [
+        {"keys": [("id", 1)], "hot": True},
+        {"keys": [("location.lat", 1), ("location.lng", 1), ("starts_at", 1)], "hot": True},
+        # Organizer pages sort on (starts_at, _id) so keyset cursors resume exactly
+        {"keys": [("organizer_id", 1), ("starts_at", 1), ("_id", 1)], "hot": True},
+        # $geoNear needs it: similar-event and feed candidates are read nearest first
+        {"keys": [("geo", "2dsphere")], "hot": True},
+        {"keys": [("category", 1), ("starts_at", 1), ("rating", -1)], "hot": True},
+        {"keys": [("category", 1), ("rating", -1), ("starts_at", 1)], "hot": True},
+        {"keys": [("category", 1), ("price.min", 1), ("price.max", 1)]},
+        {"keys": [("starts_at", 1), ("rating", -1)], "hot": True},
+        {"keys": [("rating", -1), ("starts_at", 1)]},
+        {"keys": [("price.min", 1), ("price.max", 1)]},
+        {"keys": [("updated_at", 1)]},
+        # Trending lists read one range of these, overall or for a single city
+        {"keys": [("trending_score", -1)], "hot": True},
+        {"keys": [("city_key", 1), ("trending_score", -1)], "hot": True},
+        {"keys": [("category", 1), ("trending_score", -1)]},
+        # Finds scores left on an old epoch
+        {"keys": [("trending_epoch", 1)]},
+        {"keys": [("title", "text"), ("description", "text")]},
+    ],
+    # Organizer list queries filter on categories ($in) and rating and sort by
+    # rating, totalEvents or name.
+    "organizers": [
+        {"keys": [("id", 1)], "hot": True},
+        {"keys": [("geo", "2dsphere")], "hot": True},
+        {"keys": [("categories", 1), ("rating", -1)], "hot": True},
+        {"keys": [("categories", 1), ("totalEvents", -1)]},
+        {"keys": [("rating", -1)], "hot": True},
+        {"keys": [("totalEvents", -1)]},
+        {"keys": [("name", 1)]},
+        {"keys": [("stats_reconciled_at", 1)]},
+        {"keys": [("updated_at", 1)]},
+        {"keys": [("name", "text"), ("description", "text")]},
+    ],
+    # Archived events are looked up by id, counted into organizer stats, and
+    # polled by archived_at when the invalidation bus cannot watch deletes
+    "events_archive": [
+        {"keys": [("id", 1)], "hot": True},
+        {"keys": [("organizer_id", 1), ("created_at", -1)]},
+        {"keys": [("archived_at", 1)]},
+    ],
+    # neighbors.id finds the lists that still point at an archived event
+    "event_neighbors": [
+        {"keys": [("event_id", 1)], "unique": True, "hot": True},
+        {"keys": [("neighbors.id", 1)]},
+    ],
+    "organizer_leaderboards": [
+        {"keys": [("cell", 1)], "unique": True, "hot": True},
+        {"keys": [("top.id", 1)]},
+    ],
+    "job_outbox": [
+        {"keys": [("status", 1), ("run_at", 1)], "hot": True},
+        {"keys": [("status", 1), ("locked_at", 1)]},
+        # Finds the pending job a keyed enqueue collapses into
+        {"keys": [("name", 1), ("key", 1), ("status", 1)]},
+    ],
+    "query_shapes": [
+        {"keys": [("collection", 1), ("key", 1)], "unique": True},
+    ],
+}
+
+
+# Seconds between retries of reconciliation while a hot index is missing or failed
+INDEX_RETRY_INTERVAL = float(os.environ.get("INDEX_RETRY_INTERVAL", 60))
+
+# Server errors meaning an index with the same keys exists under another name or options
+INDEX_CONFLICT_CODES = {85, 86}
+
+def index_name(keys: List[tuple]) -> str:
+    """Build the index name MongoDB would generate for a key specification"""
+    return "_".join(f"{field}_{direction}" for field, direction in keys)
+
+def same_keys(index: Dict[str, Any], keys: List[tuple]) -> bool:
+    """Return True if an existing index, as listed by list_indexes, has the given keys"""
+    if list(index["key"].items()) == [tuple(key) for key in keys]:
+        return True
+    # Text indexes are listed as _fts/_ftsx with their fields under weights
+    text_fields = {field for field, direction in keys if direction == "text"}
+    return bool(text_fields) and "weights" in index and set(index["weights"]) == text_fields
+
+def matching_index(existing: List[Dict[str, Any]], keys: List[tuple]) -> Optional[Dict[str, Any]]:
+    """Return the existing index serving a key specification: the one named for it, else one with the same keys"""
+    name = index_name(keys)
+    for index in existing:
+        if index["name"] == name:
+            return index
+    for index in existing:
+        if same_keys(index, keys):
+            return index
+    return None
+
+
+class IndexReconciler:
+    """Create missing indexes in the background and track their progress"""
+
+    def __init__(self, db, specs: Dict[str, List[Dict[str, Any]]], concurrency: Optional[int] = None):
+        self.db = db
+        self.specs = specs
+        self.concurrency = concurrency or int(os.environ.get("INDEX_BUILD_CONCURRENCY", 4))
+        self.state: Dict[str, Dict[str, Any]] = {}
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.error: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+
+        for collection, indexes in specs.items():
+            for spec in indexes:
+                self.state[f"{collection}.{index_name(spec['keys'])}"] = {
+                    "collection": collection,
+                    "spec": spec,
+                    "status": "pending",
+                    "error": None,
+                    # Name of an existing index with the same keys, used instead of building one
+                    "adopted": None,
+                }
+
+    @property
+    def ready(self) -> bool:
+        """True once every hot index exists"""
+        return all(
+            entry["status"] == "ready"
+            for entry in self.state.values()
+            if entry["spec"].get("hot")
+        )
+
+    @property
+    def failed_hot(self) -> List[str]:
+        """Hot indexes whose last build failed; the instance stays not ready until a retry succeeds"""
+        return [
+            key for key, entry in self.state.items()
+            if entry["spec"].get("hot") and entry["status"] == "failed"
+        ]
+
+    @property
+    def complete(self) -> bool:
+        """True once every index has been built or has failed"""
+        return all(entry["status"] in ("ready", "failed") for entry in self.state.values())
+
+    async def plan(self) -> List[str]:
+        """Compare existing indexes with the specs and return the missing ones"""
+        missing = []
+
+        for collection in self.specs:
+            existing = [index async for index in self.db[collection].list_indexes()]
+
+            for key, entry in self.state.items():
+                if entry["collection"] != collection:
+                    continue
+                if self._match(key, entry, existing):
+                    entry["status"] = "ready"
+                elif entry["status"] != "building":
+                    entry["status"] = "pending"
+                    missing.append(key)
+
+        return missing
+
+    def _match(self, key: str, entry: Dict[str, Any], existing: List[Dict[str, Any]]) -> bool:
+        """Find the spec's index among the existing ones, adopting one with the same keys under another name"""
+        index = matching_index(existing, entry["spec"]["keys"])
+        if index is None:
+            return False
+        if index["name"] == index_name(entry["spec"]["keys"]):
+            entry["adopted"] = None
+        else:
+            if entry["adopted"] != index["name"]:
+                logger.info("Index %s exists as %s, using it", key, index["name"])
+            entry["adopted"] = index["name"]
+        return True
+
+    async def _adopt(self, key: str, entry: Dict[str, Any]) -> bool:
+        """Look for a same-key index again after a build conflicted with one"""
+        existing = [index async for index in self.db[entry["collection"]].list_indexes()]
+        return self._match(key, entry, existing)
+
+    async def _build(self, key: str, semaphore: asyncio.Semaphore):
+        """Build a single index, recording its outcome"""
+        entry = self.state[key]
+        spec = entry["spec"]
+        options = {k: v for k, v in spec.items() if k not in ("keys", "hot")}
+
+        async with semaphore:
+            entry["status"] = "building"
+            started = time.monotonic()
+            try:
+                await self.db[entry["collection"]].create_index(
+                    spec["keys"], name=index_name(spec["keys"]), **options
+                )
+                entry["status"] = "ready"
+                entry["error"] = None
+                logger.info("Index %s built in %.1fs", key, time.monotonic() - started)
+            except OperationFailure as e:
+                # Created meanwhile under another name, or by another instance with other options
+                if e.code in INDEX_CONFLICT_CODES and await self._adopt(key, entry):
+                    entry["status"] = "ready"
+                    entry["error"] = None
+                else:
+                    entry["status"] = "failed"
+                    entry["error"] = str(e)
+                    logger.error("Index %s failed: %s", key, e)
+            except Exception as e:
+                entry["status"] = "failed"
+                entry["error"] = str(e)
+                logger.error("Index %s failed: %s", key, e)
+
+        if self.ready and not any(e["status"] == "building" for e in self.state.values()):
+            logger.info("Hot indexes ready")
+
+    async def run(self) -> Dict[str, Any]:
+        """Create all missing indexes concurrently and return the final status"""
+        self.started_at = time.time()
+        self.finished_at = None
+        self.error = None
+
+        try:
+            missing = await self.plan()
+        except Exception as e:
+            self.error = str(e)
+            self.finished_at = time.time()
+            logger.error("Index reconciliation failed: %s", e)
+            return self.status()
+
+        if missing:
+            logger.info("Building %d missing indexes: %s", len(missing), ", ".join(missing))
+
+        # Hot indexes are queued first so readiness is reached as early as possible
+        missing.sort(key=lambda key: not self.state[key]["spec"].get("hot"))
+        semaphore = asyncio.Semaphore(self.concurrency)
+        await asyncio.gather(*(self._build(key, semaphore) for key in missing))
+
+        self.finished_at = time.time()
+        return self.status()
+
+    async def _run_until_ready(self):
+        """Reconcile, retrying while a hot index is missing, e.g. after a failed build"""
+        await self.run()
+        while not self.ready:
+            await asyncio.sleep(INDEX_RETRY_INTERVAL)
+            await self.run()
+
+    def start(self) -> asyncio.Task:
+        """Start reconciliation in the background without blocking the caller"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run_until_ready())
+        return self._task
+
+    def cancel(self):
+        """Stop waiting on any index builds still in progress"""
+        if self._task and not self._task.done():
+            self._task.cancel()
+
+    def status(self) -> Dict[str, Any]:
+        """Summarise index build progress"""
+        counts: Dict[str, int] = {}
+        for entry in self.state.values():
+            counts[entry["status"]] = counts.get(entry["status"], 0) + 1
+
+        return {
+            "ready": self.ready,
+            "failed_hot": self.failed_hot,
+            "complete": self.complete,
+            "total": len(self.state),
+            "counts": counts,
+            "failed": {
+                key: entry["error"]
+                for key, entry in self.state.items()
+                if entry["status"] == "failed"
+            },
+            "building": [key for key, entry in self.state.items() if entry["status"] == "building"],
+            "adopted": {
+                key: entry["adopted"]
+                for key, entry in self.state.items()
+                if entry["adopted"]
+            },
+            "error": self.error,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
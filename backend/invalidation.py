@@ -0,0 +1,243 @@
+import asyncio
+import inspect
+import logging
+import os
+import socket
+from datetime import datetime
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+from pymongo.errors import OperationFailure, PyMongoError
+from database import db, change_stream_state_collection
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Collections whose changes are published
+WATCHED_COLLECTIONS = ["events", "organizers", "users"]
+
+# Collections whose deleted documents are moved to an archive first: a delete
+# is resolved to its application id by looking up the archived copy by _id
+ARCHIVE_COLLECTIONS = {"events": "events_archive"}
+
+# Seconds between updated_at polls when change streams are unavailable
+INVALIDATION_POLL_INTERVAL = float(os.environ.get("INVALIDATION_POLL_INTERVAL", 5))
+
+# Documents read per collection per poll
+POLL_BATCH_SIZE = 1000
+
+# Seconds between resume token saves while the stream is busy
+TOKEN_SAVE_INTERVAL = 5
+
+# Resume tokens are stored per consumer, since every instance runs its own stream
+CONSUMER_ID = os.environ.get("INVALIDATION_CONSUMER", socket.gethostname())
+
+# Server errors meaning change streams are unsupported (standalone mongod)
+CHANGE_STREAMS_UNSUPPORTED = {40573, 40415}
+
+# Server error meaning the stored resume token has fallen off the oplog
+CHANGE_STREAM_HISTORY_LOST = 286
+
+class Invalidation:
+    """A changed document: fields is None when the change may touch any field"""
+
+    __slots__ = ("collection", "document_id", "operation", "fields", "key")
+
+    def __init__(
+        self,
+        collection: str,
+        document_id: Optional[str],
+        operation: str,
+        fields: Optional[FrozenSet[str]] = None,
+        key: Any = None
+    ):
+        self.collection = collection
+        self.document_id = document_id
+        self.operation = operation
+        self.fields = fields
+        # The document's _id, from the change stream's documentKey
+        self.key = key
+
+    def touches(self, fields: Optional[Iterable[str]]) -> bool:
+        """Return True if the change may affect any of the fields, or their parents and children"""
+        if fields is None or self.fields is None:
+            return True
+        return any(
+            changed == field or changed.startswith(field + ".") or field.startswith(changed + ".")
+            for changed in self.fields for field in fields
+        )
+
+    def __repr__(self) -> str:
+        return f"Invalidation({self.collection}, {self.document_id}, {self.operation}, {self.fields})"
+
+Callback = Callable[[Invalidation], object]
+
+class InvalidationBus:
+    """Publishes document changes from a change stream, or from updated_at polling, to in-process subscribers"""
+
+    def __init__(self, collections: List[str] = WATCHED_COLLECTIONS):
+        self.collections = collections
+        self._subscribers: Dict[str, List[Tuple[Optional[FrozenSet[str]], Callback]]] = {}
+        self._task: Optional[asyncio.Task] = None
+        # Async callbacks in flight, referenced so they are not garbage collected
+        self._callbacks: Set[asyncio.Future] = set()
+        self._token = None
+        self._token_saved_at = 0.0
+        self.mode = "stopped"
+        self.published = 0
+        self.last_change_at: Optional[datetime] = None
+
+        metrics.register_gauge("invalidation", self.stats)
+
+    def subscribe(self, collection: str, callback: Callback, fields: Optional[Iterable[str]] = None):
+        """Call back on changes to a collection, optionally only when given fields change"""
+        watched = frozenset(fields) if fields is not None else None
+        self._subscribers.setdefault(collection, []).append((watched, callback))
+
+    def publish(self, invalidation: Invalidation):
+        """Deliver an invalidation to matching subscribers; async callbacks run as tasks"""
+        self.published += 1
+        metrics.inc(f"invalidation.{invalidation.collection}")
+        for fields, callback in self._subscribers.get(invalidation.collection, []):
+            if not invalidation.touches(fields):
+                continue
+            try:
+                result = callback(invalidation)
+                if inspect.isawaitable(result):
+                    task = asyncio.ensure_future(result)
+                    self._callbacks.add(task)
+                    task.add_done_callback(self._callbacks.discard)
+            except Exception as e:
+                logger.error("Invalidation subscriber failed on %r: %s", invalidation, e)
+
+    def reset(self):
+        """Tell every subscriber that changes may have been missed"""
+        for collection in self.collections:
+            self.publish(Invalidation(collection, None, "reset"))
+
+    @staticmethod
+    def from_change(change: dict) -> Invalidation:
+        """Build an invalidation from a change stream event"""
+        operation = change["operationType"]
+        fields = None
+        if operation == "update":
+            description = change.get("updateDescription", {})
+            fields = frozenset(description.get("updatedFields", {})) | frozenset(description.get("removedFields", []))
+        document = change.get("fullDocument") or {}
+        key = (change.get("documentKey") or {}).get("_id")
+        return Invalidation(change["ns"]["coll"], document.get("id"), operation, fields, key)
+
+    async def resolve(self, invalidation: Invalidation) -> Invalidation:
+        """Fill in the application id of a delete from the archived copy of the document"""
+        archive = ARCHIVE_COLLECTIONS.get(invalidation.collection)
+        if invalidation.operation == "delete" and invalidation.document_id is None and archive and invalidation.key is not None:
+            document = await db[archive].find_one({"_id": invalidation.key}, {"_id": 0, "id": 1})
+            if document:
+                invalidation.document_id = document.get("id")
+        return invalidation
+
+    async def _load_token(self):
+        state = await change_stream_state_collection.find_one({"_id": CONSUMER_ID})
+        return state.get("token") if state else None
+
+    async def _save_token(self, force: bool = False):
+        loop = asyncio.get_running_loop()
+        if self._token is None or (not force and loop.time() - self._token_saved_at < TOKEN_SAVE_INTERVAL):
+            return
+        self._token_saved_at = loop.time()
+        await change_stream_state_collection.update_one(
+            {"_id": CONSUMER_ID},
+            {"$set": {"token": self._token, "updated_at": datetime.utcnow()}},
+            upsert=True
+        )
+
+    async def _watch(self):
+        """Follow the change stream, resuming from the stored token"""
+        self._token = await self._load_token()
+        pipeline = [
+            {"$match": {"ns.coll": {"$in": self.collections}}},
+            # Only the application id is needed from the looked-up document
+            {"$project": {"operationType": 1, "ns": 1, "documentKey": 1, "updateDescription": 1, "fullDocument.id": 1}},
+        ]
+        while True:
+            try:
+                async with db.watch(pipeline, full_document="updateLookup", resume_after=self._token) as stream:
+                    self.mode = "change_stream"
+                    async for change in stream:
+                        self._token = stream.resume_token
+                        self.last_change_at = datetime.utcnow()
+                        self.publish(await self.resolve(self.from_change(change)))
+                        await self._save_token()
+            except OperationFailure as e:
+                if e.code in CHANGE_STREAMS_UNSUPPORTED:
+                    raise
+                if e.code == CHANGE_STREAM_HISTORY_LOST:
+                    logger.warning("Change stream resume token expired; starting from now")
+                    self._token = None
+                    self.reset()
+                    continue
+                logger.error("Change stream failed, reconnecting: %s", e)
+            except PyMongoError as e:
+                logger.error("Change stream failed, reconnecting: %s", e)
+            await asyncio.sleep(1)
+
+    async def _poll(self):
+        """Publish documents whose updated_at moved since the last poll, and archived documents as deletes"""
+        self.mode = "polling"
+        since = {collection: datetime.utcnow() for collection in self.collections}
+        archived_since = {collection: datetime.utcnow() for collection in self.collections if collection in ARCHIVE_COLLECTIONS}
+        while True:
+            await asyncio.sleep(INVALIDATION_POLL_INTERVAL)
+            for collection in self.collections:
+                try:
+                    cursor = db[collection].find(
+                        {"updated_at": {"$gt": since[collection]}},
+                        {"_id": 0, "id": 1, "updated_at": 1}
+                    ).sort("updated_at", 1).limit(POLL_BATCH_SIZE)
+                    async for document in cursor:
+                        since[collection] = document["updated_at"]
+                        self.last_change_at = datetime.utcnow()
+                        self.publish(Invalidation(collection, document.get("id"), "update"))
+                except PyMongoError as e:
+                    logger.error("Invalidation poll of %s failed: %s", collection, e)
+            for collection in archived_since:
+                try:
+                    cursor = db[ARCHIVE_COLLECTIONS[collection]].find(
+                        {"archived_at": {"$gt": archived_since[collection]}},
+                        {"_id": 0, "id": 1, "archived_at": 1}
+                    ).sort("archived_at", 1).limit(POLL_BATCH_SIZE)
+                    async for document in cursor:
+                        archived_since[collection] = document["archived_at"]
+                        self.last_change_at = datetime.utcnow()
+                        self.publish(Invalidation(collection, document.get("id"), "delete"))
+                except PyMongoError as e:
+                    logger.error("Invalidation poll of %s failed: %s", ARCHIVE_COLLECTIONS[collection], e)
+
+    async def _run(self):
+        try:
+            await self._watch()
+        except OperationFailure as e:
+            logger.info("Change streams unavailable (%s); polling updated_at instead", e)
+            await self._poll()
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        try:
+            await self._save_token(force=True)
+        except PyMongoError as e:
+            logger.error("Could not save change stream resume token: %s", e)
+        self.mode = "stopped"
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.mode,
+            "published": self.published,
+            "last_change_at": self.last_change_at.isoformat() if self.last_change_at else None,
+            "subscribers": sum(len(subscribers) for subscribers in self._subscribers.values()),
+        }
+
+invalidation_bus = InvalidationBus()
@@ -0,0 +1,139 @@
+from database import events_collection, organizers_collection, Database
+from invalidation import invalidation_bus, Invalidation
+from feed import EventFeed
+from response_cache import invalidate_routes, EVENT_ROUTES, ORGANIZER_ROUTES
+from search_index import suggest_index, EVENT
+from live import live_hub
+from map_clusters import map_index, POINT_PROJECTION
+from fuzzy import FuzzyIndex, event_fuzzy, organizer_fuzzy
+from jobs import job_queue
+from similarity import SNAPSHOT_FIELDS
+
+# Keep in-process caches and indexes in step with writes made anywhere: other
+# instances, seed_data.py or admin scripts. Local writes also invalidate inline,
+# so these handlers only need to be eventually consistent.
+
+# Fields shown in event and organizer responses; bookkeeping-only changes are ignored
+EVENT_FIELDS = [
+    "title", "description", "date", "time", "starts_at", "location", "category",
+    "price", "image", "organizer_id", "attendees", "rating", "reviews"
+]
+# Counters change on every RSVP and review. Live streams get them through
+# push_live_counters; cached lists and feeds show them stale until their TTL.
+COUNTER_FIELDS = ["attendees", "rating", "reviews"]
+LISTED_EVENT_FIELDS = [field for field in EVENT_FIELDS if field not in COUNTER_FIELDS]
+ORGANIZER_FIELDS = [
+    "name", "description", "photo", "location", "categories", "contact",
+    "rating", "totalEvents", "reviewCount", "recentEvents"
+]
+# Organizer lists rank by these stats, but event lists only embed the organizer
+ORGANIZER_STAT_FIELDS = ["rating", "totalEvents", "reviewCount", "recentEvents"]
+EMBEDDED_ORGANIZER_FIELDS = [field for field in ORGANIZER_FIELDS if field not in ORGANIZER_STAT_FIELDS]
+
+def clear_responses(*routes: str):
+    """Build a handler dropping the cached responses of the given routes"""
+    def handler(invalidation: Invalidation):
+        invalidate_routes(routes)
+    return handler
+
+async def clear_feeds(invalidation: Invalidation):
+    """Drop the cached feeds an event appears in, or could now appear in"""
+    if invalidation.operation == "reset" or not invalidation.document_id:
+        EventFeed.invalidate_all()
+        return
+    location = None
+    if invalidation.operation != "delete":
+        event = await events_collection.find_one({"id": invalidation.document_id}, {"_id": 0, "location": 1})
+        location = event.get("location") if event else None
+    EventFeed.invalidate_event(invalidation.document_id, location)
+
+def clear_user_feed(invalidation: Invalidation):
+    """Drop the feed of a user whose location, preferences or saved events changed"""
+    if invalidation.document_id:
+        EventFeed.invalidate_user(invalidation.document_id)
+    else:
+        EventFeed.invalidate_all()
+
+async def reindex_event(invalidation: Invalidation):
+    """Refresh an event's suggestion, or rebuild the index if changes may have been missed"""
+    # With a shared snapshot this overlays the change until the next snapshot includes it
+    if invalidation.operation == "reset":
+        suggest_index.start()
+        return
+    if not invalidation.document_id:
+        return
+    projection = {"_id": 0, "id": 1, "title": 1, "location.name": 1, "rating": 1, "attendees": 1}
+    event = await events_collection.find_one({"id": invalidation.document_id}, projection)
+    if event:
+        suggest_index.index_event(event)
+    else:
+        suggest_index.remove(EVENT, invalidation.document_id)
+
+async def reindex_organizer(invalidation: Invalidation):
+    """Refresh an organizer's suggestion"""
+    if not invalidation.document_id:
+        return
+    projection = {"_id": 0, "id": 1, "name": 1, "location.name": 1, "rating": 1, "totalEvents": 1}
+    organizer = await organizers_collection.find_one({"id": invalidation.document_id}, projection)
+    if organizer:
+        suggest_index.index_organizer(organizer)
+
+async def reindex_map_event(invalidation: Invalidation):
+    """Move, update or drop an event on the map"""
+    if invalidation.operation == "reset":
+        map_index.start()
+        return
+    if not invalidation.document_id:
+        return
+    event = await events_collection.find_one({"id": invalidation.document_id}, POINT_PROJECTION)
+    if event:
+        map_index.index_event(event)
+    else:
+        map_index.remove(invalidation.document_id)
+
+def reindex_fuzzy(index: FuzzyIndex, collection):
+    """Build a handler refreshing one document's words in a fuzzy index"""
+    async def handler(invalidation: Invalidation):
+        if invalidation.operation == "reset":
+            await index.load(collection)
+            return
+        if not invalidation.document_id:
+            return
+        projection = {"_id": 0, "id": 1, **{field: 1 for field in index.fields}}
+        document = await collection.find_one({"id": invalidation.document_id}, projection)
+        if document:
+            index.index(document)
+        else:
+            index.remove(invalidation.document_id)
+    return handler
+
+async def refresh_neighbors(invalidation: Invalidation):
+    """Queue a rescore of an event whose similarity inputs or listed fields changed"""
+    if invalidation.operation in ("reset", "delete") or not invalidation.document_id:
+        return
+    # Every instance sees the change; the job key collapses their enqueues into one job
+    await job_queue.enqueue("refresh_event_neighbors", {"event_id": invalidation.document_id}, key=invalidation.document_id)
+
+async def push_live_counters(invalidation: Invalidation):
+    """Forward attendee and rating changes written elsewhere to live streams in this process"""
+    if not invalidation.document_id or not live_hub.has_subscribers(invalidation.document_id):
+        return
+    counters = await Database.get_event_counters([invalidation.document_id])
+    if invalidation.document_id in counters:
+        live_hub.publish(invalidation.document_id, counters[invalidation.document_id])
+
+invalidation_bus.subscribe("events", clear_responses(*EVENT_ROUTES), LISTED_EVENT_FIELDS)
+invalidation_bus.subscribe("events", clear_responses("suggest"), ["title", "location"])
+invalidation_bus.subscribe("events", clear_feeds, LISTED_EVENT_FIELDS)
+invalidation_bus.subscribe("events", reindex_event, ["title", "location", "rating", "attendees"])
+invalidation_bus.subscribe("events", reindex_map_event, ["title", "category", "starts_at", "rating", "price", "location"])
+invalidation_bus.subscribe("events", reindex_fuzzy(event_fuzzy, events_collection), event_fuzzy.fields)
+# Attendee counts change on every RSVP, so neighbour lists pick them up on the next rescore
+invalidation_bus.subscribe("events", refresh_neighbors, [field for field in SNAPSHOT_FIELDS if field != "attendees"])
+invalidation_bus.subscribe("events", push_live_counters, ["attendees", "rating", "reviews"])
+invalidation_bus.subscribe("organizers", clear_responses("organizers", "top_organizers"), ORGANIZER_FIELDS)
+invalidation_bus.subscribe("organizers", clear_responses(*ORGANIZER_ROUTES), EMBEDDED_ORGANIZER_FIELDS)
+invalidation_bus.subscribe("organizers", clear_responses("suggest"), ["name", "location", "rating", "totalEvents"])
+invalidation_bus.subscribe("organizers", reindex_organizer, ["name", "location", "rating", "totalEvents"])
+invalidation_bus.subscribe("organizers", reindex_fuzzy(organizer_fuzzy, organizers_collection), organizer_fuzzy.fields)
+invalidation_bus.subscribe("users", clear_user_feed, ["location", "preferences", "savedEvents"])
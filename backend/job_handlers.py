@@ -0,0 +1,49 @@
+from database import Database, events_collection, organizers_collection
+from jobs import job_queue
+from similarity import EventSimilarity
+from organizer_stats import OrganizerStats
+from leaderboard import OrganizerLeaderboard
+from live import live_hub
+
+# Follow-up writes deferred from request handlers. Each job does one piece of
+# work so a retry never repeats a non-idempotent update that already succeeded.
+
+@job_queue.handler("user_created_event")
+async def user_created_event(payload: dict):
+    """Add a new event to its creator's createdEvents"""
+    await Database.add_user_created_event(payload["user_id"], payload["event_id"])
+
+@job_queue.handler("organizer_event_created")
+async def organizer_event_created(payload: dict):
+    """Count a new event on its organizer and queue a refresh of the organizer's leaderboard cells"""
+    await OrganizerStats.record_event_created(payload["organizer_id"], payload["event_id"])
+    await job_queue.enqueue("refresh_organizer_leaderboard", {"organizer_id": payload["organizer_id"]})
+
+@job_queue.handler("refresh_event_neighbors")
+async def refresh_event_neighbors(payload: dict):
+    """Rescore an event against its candidates in the similar-events lists"""
+    event = await events_collection.find_one({"id": payload["event_id"]}, {"_id": 0, "reviews": 0})
+    if event:
+        await EventSimilarity.refresh_event(event)
+
+@job_queue.handler("recalculate_event_rating")
+async def recalculate_event_rating(payload: dict):
+    """Recompute an event's rating from its reviews, push it to live viewers and queue a rescore of its neighbours"""
+    await Database.recalculate_event_rating(payload["event_id"])
+    await job_queue.enqueue("refresh_event_neighbors", {"event_id": payload["event_id"]}, key=payload["event_id"])
+    counters = await Database.get_event_counters([payload["event_id"]])
+    if payload["event_id"] in counters:
+        live_hub.publish(payload["event_id"], counters[payload["event_id"]])
+
+@job_queue.handler("organizer_review")
+async def organizer_review(payload: dict):
+    """Fold a review into its organizer's rating and queue a refresh of the organizer's leaderboard cells"""
+    await OrganizerStats.record_review(payload["organizer_id"], payload["review_id"], payload["rating"])
+    await job_queue.enqueue("refresh_organizer_leaderboard", {"organizer_id": payload["organizer_id"]})
+
+@job_queue.handler("refresh_organizer_leaderboard")
+async def refresh_organizer_leaderboard(payload: dict):
+    """Rebuild the leaderboard cells an organizer belongs to from its current stats"""
+    organizer = await organizers_collection.find_one({"id": payload["organizer_id"]}, {"_id": 0})
+    if organizer:
+        await OrganizerLeaderboard.refresh_organizer(organizer)
@@ -0,0 +1,190 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+from bson import ObjectId
+from pymongo import ReturnDocument
+from database import job_outbox_collection
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Handlers run concurrently up to this many at a time per process
+JOB_CONCURRENCY = int(os.environ.get("JOB_CONCURRENCY", 8))
+
+# Attempts before a job is marked failed, and the base retry delay in seconds
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", 5))
+JOB_RETRY_DELAY = float(os.environ.get("JOB_RETRY_DELAY", 2))
+
+# Seconds between outbox polls for due, retried or abandoned jobs
+JOB_POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL", 5))
+
+# A running job whose lock is older than this is assumed abandoned and re-run
+JOB_LOCK_TIMEOUT = timedelta(seconds=int(os.environ.get("JOB_LOCK_TIMEOUT", 300)))
+
+Handler = Callable[[Dict[str, Any]], Awaitable[None]]
+
+class JobQueue:
+    """Asyncio job queue backed by a MongoDB outbox so queued work survives restarts"""
+
+    def __init__(self, collection, concurrency: int = JOB_CONCURRENCY):
+        self.collection = collection
+        self.concurrency = concurrency
+        self.handlers: Dict[str, Handler] = {}
+        self._queue: "asyncio.Queue[ObjectId]" = asyncio.Queue()
+        self._queued: Set[ObjectId] = set()
+        self._tasks = []
+        self._pending_in_outbox = 0
+        self._last_lag = 0.0
+
+        metrics.register_gauge("jobs.queue_depth", lambda: self._queue.qsize())
+        metrics.register_gauge("jobs.outbox_pending", lambda: self._pending_in_outbox)
+        metrics.register_gauge("jobs.lag_seconds", lambda: round(self._last_lag, 3))
+
+    def handler(self, name: str):
+        """Register an async handler for a job name"""
+        def register(func: Handler) -> Handler:
+            self.handlers[name] = func
+            return func
+        return register
+
+    async def enqueue(self, name: str, payload: Dict[str, Any], key: Optional[str] = None) -> ObjectId:
+        """Persist a job to the outbox and schedule it to run in this process; jobs sharing a key collapse into one pending job"""
+        if name not in self.handlers:
+            raise ValueError(f"No handler registered for job {name}")
+
+        now = datetime.utcnow()
+        job = {
+            "payload": payload,
+            "attempts": 0,
+            "run_at": now,
+            "created_at": now,
+        }
+        if key is None:
+            result = await self.collection.insert_one({"name": name, "status": "pending", **job})
+            job_id = result.inserted_id
+        else:
+            # A pending job with the same name and key has not read its inputs yet, so it covers this one
+            existing = await self.collection.find_one_and_update(
+                {"name": name, "key": key, "status": "pending"},
+                {"$setOnInsert": job},
+                projection={"_id": 1},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+            job_id = existing["_id"]
+        metrics.inc("jobs.enqueued")
+        self._schedule(job_id)
+        return job_id
+
+    def _schedule(self, job_id: ObjectId):
+        if job_id not in self._queued:
+            self._queued.add(job_id)
+            self._queue.put_nowait(job_id)
+
+    async def _claim(self, job_id: ObjectId) -> Optional[dict]:
+        """Mark a due job as running so no other worker or instance picks it up"""
+        now = datetime.utcnow()
+        return await self.collection.find_one_and_update(
+            {"_id": job_id, "status": "pending", "run_at": {"$lte": now}},
+            {"$set": {"status": "running", "locked_at": now}, "$inc": {"attempts": 1}},
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def _run(self, job_id: ObjectId):
+        """Claim and execute one job, scheduling a retry or marking it failed on error"""
+        job = await self._claim(job_id)
+        if job is None:
+            return
+
+        self._last_lag = (datetime.utcnow() - job["created_at"]).total_seconds()
+        started = time.monotonic()
+        try:
+            await self.handlers[job["name"]](job["payload"])
+        except Exception as e:
+            if job["attempts"] >= JOB_MAX_ATTEMPTS:
+                await self.collection.update_one(
+                    {"_id": job_id},
+                    {"$set": {"status": "failed", "error": str(e), "failed_at": datetime.utcnow()}}
+                )
+                metrics.inc("jobs.failed")
+                logger.error("Job %s (%s) failed permanently: %s", job["name"], job_id, e)
+                return
+
+            delay = JOB_RETRY_DELAY * 2 ** (job["attempts"] - 1)
+            await self.collection.update_one(
+                {"_id": job_id},
+                {"$set": {
+                    "status": "pending",
+                    "error": str(e),
+                    "run_at": datetime.utcnow() + timedelta(seconds=delay)
+                }}
+            )
+            metrics.inc("jobs.retried")
+            logger.warning("Job %s (%s) failed, retrying in %.0fs: %s", job["name"], job_id, delay, e)
+            asyncio.get_running_loop().call_later(delay, self._schedule, job_id)
+            return
+
+        await self.collection.delete_one({"_id": job_id})
+        metrics.inc("jobs.completed")
+        metrics.inc("jobs.run_seconds", time.monotonic() - started)
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            self._queued.discard(job_id)
+            try:
+                await self._run(job_id)
+            except Exception as e:
+                logger.error("Job worker error on %s: %s", job_id, e)
+            finally:
+                self._queue.task_done()
+
+    async def poll(self) -> int:
+        """Requeue abandoned jobs and schedule due jobs from the outbox"""
+        now = datetime.utcnow()
+        await self.collection.update_many(
+            {"status": "running", "locked_at": {"$lt": now - JOB_LOCK_TIMEOUT}},
+            {"$set": {"status": "pending", "run_at": now}}
+        )
+
+        self._pending_in_outbox = await self.collection.count_documents({"status": "pending"})
+        cursor = self.collection.find(
+            {"status": "pending", "run_at": {"$lte": now}}, {"_id": 1}
+        ).sort("run_at", 1).limit(self.concurrency * 10)
+
+        scheduled = 0
+        async for job in cursor:
+            if job["_id"] not in self._queued:
+                self._schedule(job["_id"])
+                scheduled += 1
+        return scheduled
+
+    async def _poller(self):
+        while True:
+            try:
+                await self.poll()
+            except Exception as e:
+                logger.error("Job outbox poll failed: %s", e)
+            await asyncio.sleep(JOB_POLL_INTERVAL)
+
+    def start(self):
+        """Start the workers and the outbox poller"""
+        if self._tasks:
+            return
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+        self._tasks.append(asyncio.create_task(self._poller()))
+
+    async def stop(self, timeout: float = 5):
+        """Give in-flight jobs a moment to finish, then stop; unfinished jobs stay in the outbox"""
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+job_queue = JobQueue(job_outbox_collection)
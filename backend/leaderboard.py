@@ -0,0 +1,144 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import Optional, List
+from pymongo import ReplaceOne
+from database import Database, organizers_collection, organizer_leaderboards_collection
+from migrations import migration_runner
+from geo import geo_point, cell_of, cell_key, cell_center, cell_half_diagonal, cells_within, METERS_PER_MILE
+
+logger = logging.getLogger(__name__)
+
+# Grid cell size in degrees
+CELL_SIZE = 0.25
+
+# Largest max_distance the leaderboard can answer; larger radii fall back to $geoNear
+LEADERBOARD_RADIUS = 25
+
+# Organizers kept per cell and the minimum rating to be listed
+LEADERBOARD_SIZE = 50
+MIN_RATING = 4.0
+
+class OrganizerLeaderboard:
+    @staticmethod
+    def coverage(cell) -> float:
+        """Radius around a cell centre that contains every organizer a user in the cell can see"""
+        return LEADERBOARD_RADIUS + cell_half_diagonal(cell, CELL_SIZE)
+
+    @staticmethod
+    def cells_for(location: dict) -> set:
+        """Return every cell whose leaderboard may include an organizer at this location"""
+        cell = cell_of(location["lat"], location["lng"], CELL_SIZE)
+        radius = OrganizerLeaderboard.coverage(cell)
+        return set(cells_within(location["lat"], location["lng"], radius, CELL_SIZE))
+
+    @staticmethod
+    async def build_cell(cell) -> List[dict]:
+        """Compute the top-rated organizers around a cell with one $geoNear query"""
+        lat, lng = cell_center(cell, CELL_SIZE)
+        pipeline = [
+            {"$geoNear": {
+                "near": geo_point({"lat": lat, "lng": lng}),
+                "distanceField": "center_distance",
+                "maxDistance": OrganizerLeaderboard.coverage(cell) * METERS_PER_MILE,
+                "query": {"rating": {"$gte": MIN_RATING}},
+                "spherical": True
+            }},
+            {"$sort": {"rating": -1, "totalEvents": -1, "id": 1}},
+            {"$limit": LEADERBOARD_SIZE},
+            {"$project": {"_id": 0, "center_distance": 0}}
+        ]
+        return await organizers_collection.aggregate(pipeline).to_list(length=LEADERBOARD_SIZE)
+
+    @staticmethod
+    async def refresh_cells(cells) -> int:
+        """Rebuild and store the leaderboards of the given cells"""
+        operations = []
+        for cell in cells:
+            top = await OrganizerLeaderboard.build_cell(cell)
+            operations.append(ReplaceOne(
+                {"cell": cell_key(cell)},
+                {"cell": cell_key(cell), "top": top, "updated_at": datetime.utcnow()},
+                upsert=True
+            ))
+
+        if operations:
+            await organizer_leaderboards_collection.bulk_write(operations, ordered=False)
+        return len(operations)
+
+    @staticmethod
+    async def refresh_organizer(organizer: dict, previous_location: Optional[dict] = None) -> int:
+        """Rebuild the cells an organizer belongs to after its rating, event count or location changed"""
+        cells = set()
+        for location in (organizer.get("location"), previous_location):
+            if location:
+                cells.update(OrganizerLeaderboard.cells_for(location))
+
+        # Cells that currently list the organizer must drop or update it too
+        async for doc in organizer_leaderboards_collection.find({"top.id": organizer["id"]}, {"cell": 1}):
+            i, j = doc["cell"].split(":")
+            cells.add((int(i), int(j)))
+
+        return await OrganizerLeaderboard.refresh_cells(cells)
+
+    @staticmethod
+    async def rebuild_all() -> int:
+        """Build the leaderboard of every cell that has organizers nearby"""
+        cells = set()
+        async for organizer in organizers_collection.find({}, {"_id": 0, "location": 1}):
+            location = organizer.get("location")
+            if location:
+                cells.update(OrganizerLeaderboard.cells_for(location))
+
+        count = await OrganizerLeaderboard.refresh_cells(cells)
+        logger.info("Built organizer leaderboards for %d cells", count)
+        return count
+
+    @staticmethod
+    async def get_top_nearby(
+        user_lat: float,
+        user_lng: float,
+        max_distance: float,
+        limit: int
+    ) -> Optional[List[dict]]:
+        """Answer a nearby-top query from the user's cell, or None if the leaderboard cannot"""
+        if max_distance > LEADERBOARD_RADIUS or limit > LEADERBOARD_SIZE:
+            return None
+
+        doc = await organizer_leaderboards_collection.find_one(
+            {"cell": cell_key(cell_of(user_lat, user_lng, CELL_SIZE))}, {"_id": 0, "top": 1}
+        )
+        if doc is None:
+            return None
+
+        organizers = []
+        for organizer in doc["top"]:
+            distance = Database.calculate_distance(
+                user_lat, user_lng,
+                organizer['location']['lat'], organizer['location']['lng']
+            )
+            if distance <= max_distance:
+                organizer['distance'] = distance
+                organizers.append(organizer)
+                if len(organizers) >= limit:
+                    return organizers
+
+        # A full list may have cut off organizers that would qualify at this distance
+        if len(doc["top"]) >= LEADERBOARD_SIZE:
+            return None
+        return organizers
+
+    @staticmethod
+    def start_rebuild_if_empty() -> asyncio.Task:
+        """Build all leaderboards in the background when none exist yet"""
+        return asyncio.create_task(OrganizerLeaderboard._rebuild_if_empty())
+
+    @staticmethod
+    async def _rebuild_if_empty():
+        try:
+            if await organizer_leaderboards_collection.find_one({}) is None:
+                # Leaderboards are built from the organizers' GeoJSON points
+                await migration_runner.wait_for("organizer_geo_points")
+                await OrganizerLeaderboard.rebuild_all()
+        except Exception as e:
+            logger.error("Organizer leaderboard rebuild failed: %s", e)
@@ -0,0 +1,147 @@
+import asyncio
+import json
+import logging
+import os
+from typing import Any, Dict, Iterable, List, Optional, Set
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Updates to a topic are merged and delivered at most once per interval
+LIVE_FLUSH_INTERVAL = float(os.environ.get("LIVE_FLUSH_INTERVAL", 1))
+
+# Idle streams get a comment line this often so proxies keep them open
+LIVE_KEEPALIVE_INTERVAL = float(os.environ.get("LIVE_KEEPALIVE_INTERVAL", 15))
+
+# Messages buffered per subscriber; older ones are dropped since each carries the latest state
+LIVE_QUEUE_SIZE = 4
+
+KEEPALIVE = b": keepalive\n\n"
+
+class Subscriber:
+    """One open stream and the topics it follows"""
+
+    __slots__ = ("topics", "queue")
+
+    def __init__(self, topics: Set[str]):
+        self.topics = topics
+        self.queue: "asyncio.Queue[bytes]" = asyncio.Queue(LIVE_QUEUE_SIZE)
+
+    def offer(self, message: bytes):
+        """Queue a message without blocking, dropping the oldest if the client is slow"""
+        if self.queue.full():
+            self.queue.get_nowait()
+            metrics.inc("live.dropped")
+        self.queue.put_nowait(message)
+
+class LiveHub:
+    """In-process pub/sub that batches updates into at most one message per subscriber per interval"""
+
+    def __init__(self, interval: float = LIVE_FLUSH_INTERVAL):
+        self.interval = interval
+        self._subscribers: Dict[str, Set[Subscriber]] = {}
+        # Fields changed since the last flush, per topic
+        self._dirty: Dict[str, Dict[str, Any]] = {}
+        self._sequence = 0
+        self._task: Optional[asyncio.Task] = None
+
+        metrics.register_gauge("live", self.stats)
+
+    def subscribe(self, topics: Iterable[str]) -> Subscriber:
+        subscriber = Subscriber(set(topics))
+        for topic in subscriber.topics:
+            self._subscribers.setdefault(topic, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        for topic in subscriber.topics:
+            subscribers = self._subscribers.get(topic)
+            if subscribers is None:
+                continue
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self._subscribers[topic]
+                self._dirty.pop(topic, None)
+
+    def has_subscribers(self, topic: str) -> bool:
+        return topic in self._subscribers
+
+    def publish(self, topic: str, fields: Dict[str, Any]):
+        """Record changed fields; nothing is sent until the next flush"""
+        if topic not in self._subscribers:
+            return
+        metrics.inc("live.published")
+        if topic in self._dirty:
+            metrics.inc("live.coalesced")
+        self._dirty.setdefault(topic, {}).update(fields)
+
+    @staticmethod
+    def fragment(topic: str, fields: Dict[str, Any]) -> str:
+        """Serialise one topic's update"""
+        return json.dumps({"id": topic, **fields}, default=str)
+
+    @staticmethod
+    def message(fragments: List[str], sequence: Optional[int] = None) -> bytes:
+        """Wrap topic updates into one server-sent event"""
+        head = f"id: {sequence}\n" if sequence is not None else ""
+        return f"{head}event: update\ndata: [{','.join(fragments)}]\n\n".encode()
+
+    def flush(self) -> int:
+        """Send each subscriber one message with every dirty topic it follows"""
+        dirty, self._dirty = self._dirty, {}
+        if not dirty:
+            return 0
+
+        # Each topic is serialised once, however many streams follow it
+        batches: Dict[Subscriber, List[str]] = {}
+        for topic, fields in dirty.items():
+            fragment = self.fragment(topic, fields)
+            for subscriber in self._subscribers.get(topic, ()):
+                batches.setdefault(subscriber, []).append(fragment)
+
+        self._sequence += 1
+        for subscriber, fragments in batches.items():
+            subscriber.offer(self.message(fragments, self._sequence))
+        metrics.inc("live.delivered", len(batches))
+        return len(batches)
+
+    def keepalive(self):
+        """Nudge idle streams so intermediaries do not time them out"""
+        seen = set()
+        for subscribers in self._subscribers.values():
+            for subscriber in subscribers:
+                if subscriber not in seen and subscriber.queue.empty():
+                    subscriber.offer(KEEPALIVE)
+                seen.add(subscriber)
+
+    async def _run(self):
+        # One timer for the whole hub; connections only wait on their own queue
+        loop = asyncio.get_running_loop()
+        next_keepalive = loop.time() + LIVE_KEEPALIVE_INTERVAL
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.flush()
+                if loop.time() >= next_keepalive:
+                    self.keepalive()
+                    next_keepalive = loop.time() + LIVE_KEEPALIVE_INTERVAL
+            except Exception as e:
+                logger.error("Live update flush failed: %s", e)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "topics": len(self._subscribers),
+            "subscriptions": sum(len(subscribers) for subscribers in self._subscribers.values()),
+            "pending_topics": len(self._dirty),
+        }
+
+live_hub = LiveHub()
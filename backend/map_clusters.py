@@ -0,0 +1,270 @@
+import asyncio
+import logging
+import math
+import os
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Set, Tuple
+from database import events_collection
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Deepest zoom level with its own clusters; beyond it small clusters are expanded
+MAX_ZOOM = 16
+
+# Cluster cells per tile edge at every zoom, i.e. 64 pixel cells on 256 pixel tiles
+CELLS_PER_TILE = 4
+
+# Leaf clusters up to this size are returned as individual events at MAX_ZOOM
+LEAF_EXPAND = 20
+
+# Default and largest number of items in one map response
+MAP_LIMIT = 300
+MAP_MAX_LIMIT = 1000
+
+# Seconds between full rebuilds, which also drop events that have ended
+MAP_REBUILD_INTERVAL = float(os.environ.get("MAP_REBUILD_INTERVAL", 3600))
+
+MAX_LATITUDE = 85.05112878
+
+# Event fields carried by individual points
+POINT_PROJECTION = {
+    "_id": 0, "id": 1, "title": 1, "category": 1, "starts_at": 1, "rating": 1,
+    "price.min": 1, "location.lat": 1, "location.lng": 1
+}
+
+def mercator(lat: float, lng: float) -> Tuple[float, float]:
+    """Project a point to Web Mercator coordinates in [0, 1)"""
+    lat = max(min(lat, MAX_LATITUDE), -MAX_LATITUDE)
+    x = (lng + 180) / 360
+    sin = math.sin(math.radians(lat))
+    y = 0.5 - math.log((1 + sin) / (1 - sin)) / (4 * math.pi)
+    return min(max(x, 0.0), 1 - 1e-12), min(max(y, 0.0), 1 - 1e-12)
+
+def cells_per_axis(zoom: int) -> int:
+    return CELLS_PER_TILE << zoom
+
+class Cluster:
+    """Count and coordinate sums of the events in one cell"""
+
+    __slots__ = ("count", "lat_sum", "lng_sum")
+
+    def __init__(self):
+        self.count = 0
+        self.lat_sum = 0.0
+        self.lng_sum = 0.0
+
+class MapClusterIndex:
+    """Grid clusters of upcoming events at every zoom level, maintained point by point"""
+
+    def __init__(self):
+        # levels[z][(x, y)] -> Cluster; a cell at zoom z contains four cells at z + 1
+        self.levels: List[Dict[Tuple[int, int], Cluster]] = [{} for _ in range(MAX_ZOOM + 1)]
+        # Event ids per cell at MAX_ZOOM, for expanding small clusters
+        self.leaves: Dict[Tuple[int, int], Set[str]] = {}
+        # event id -> (leaf cell, lat, lng, point)
+        self.points: Dict[str, Tuple[Tuple[int, int], float, float, dict]] = {}
+        # Writes made while load() builds a fresh index, replayed onto it before the swap
+        self._pending: Optional[List[Tuple[Callable, tuple]]] = None
+        self.ready = False
+        self._task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def leaf_cell(lat: float, lng: float) -> Tuple[int, int]:
+        x, y = mercator(lat, lng)
+        size = cells_per_axis(MAX_ZOOM)
+        return int(x * size), int(y * size)
+
+    @staticmethod
+    def point(event: dict) -> dict:
+        """Build the map entry of an event"""
+        return {
+            "type": "event",
+            "id": event["id"],
+            "lat": event["location"]["lat"],
+            "lng": event["location"]["lng"],
+            "title": event.get("title"),
+            "category": event.get("category"),
+            "starts_at": event.get("starts_at"),
+            "rating": event.get("rating"),
+            "price": (event.get("price") or {}).get("min"),
+        }
+
+    def _apply(self, leaf: Tuple[int, int], lat: float, lng: float, sign: int):
+        """Add or remove one point from its cell at every zoom level"""
+        for zoom in range(MAX_ZOOM, -1, -1):
+            shift = MAX_ZOOM - zoom
+            cell = (leaf[0] >> shift, leaf[1] >> shift)
+            level = self.levels[zoom]
+            cluster = level.get(cell)
+            if cluster is None:
+                cluster = level[cell] = Cluster()
+            cluster.count += sign
+            cluster.lat_sum += sign * lat
+            cluster.lng_sum += sign * lng
+            if cluster.count <= 0:
+                del level[cell]
+
+    def remove(self, event_id: str):
+        """Drop an event from the index"""
+        if self._pending is not None:
+            self._pending.append((MapClusterIndex.remove, (event_id,)))
+        self._remove(event_id)
+
+    def _remove(self, event_id: str):
+        existing = self.points.pop(event_id, None)
+        if existing is None:
+            return
+        leaf, lat, lng, _ = existing
+        self._apply(leaf, lat, lng, -1)
+        ids = self.leaves.get(leaf)
+        if ids is not None:
+            ids.discard(event_id)
+            if not ids:
+                del self.leaves[leaf]
+
+    def index_event(self, event: dict):
+        """Add or move an event; events without coordinates or already over are dropped"""
+        if self._pending is not None:
+            self._pending.append((MapClusterIndex.index_event, (event,)))
+        self._remove(event["id"])
+        location = event.get("location") or {}
+        if location.get("lat") is None or location.get("lng") is None:
+            return
+        starts_at = event.get("starts_at")
+        if starts_at is not None and starts_at < self.cutoff():
+            return
+
+        lat, lng = location["lat"], location["lng"]
+        leaf = self.leaf_cell(lat, lng)
+        self.points[event["id"]] = (leaf, lat, lng, self.point(event))
+        self._apply(leaf, lat, lng, 1)
+        self.leaves.setdefault(leaf, set()).add(event["id"])
+
+    @staticmethod
+    def cutoff() -> datetime:
+        """Events starting before this are no longer shown"""
+        return datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=1)
+
+    @staticmethod
+    def cell_ranges(bbox: Tuple[float, float, float, float], zoom: int) -> List[Tuple[int, int, int, int]]:
+        """Return inclusive (x0, x1, y0, y1) cell ranges covering a bounding box, split at the antimeridian"""
+        min_lng, min_lat, max_lng, max_lat = bbox
+        if min_lng > max_lng:
+            return (
+                MapClusterIndex.cell_ranges((min_lng, min_lat, 180.0, max_lat), zoom)
+                + MapClusterIndex.cell_ranges((-180.0, min_lat, max_lng, max_lat), zoom)
+            )
+        size = cells_per_axis(zoom)
+        x0, y1 = mercator(min_lat, min_lng)
+        x1, y0 = mercator(max_lat, max_lng)
+        return [(int(x0 * size), int(x1 * size), int(y0 * size), int(y1 * size))]
+
+    def cells_in(self, bbox: Tuple[float, float, float, float], zoom: int) -> List[Tuple[int, int]]:
+        """Return the occupied cells of a zoom level inside a bounding box"""
+        level = self.levels[zoom]
+        cells = []
+        for x0, x1, y0, y1 in self.cell_ranges(bbox, zoom):
+            if (x1 - x0 + 1) * (y1 - y0 + 1) <= len(level):
+                cells.extend(
+                    (x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1) if (x, y) in level
+                )
+            else:
+                cells.extend(cell for cell in level if x0 <= cell[0] <= x1 and y0 <= cell[1] <= y1)
+        return cells
+
+    def query(self, bbox: Tuple[float, float, float, float], zoom: float, limit: int = MAP_LIMIT) -> dict:
+        """Return clusters and individual events in a bounding box, never more than limit items"""
+        zoom = max(0, min(int(zoom), MAX_ZOOM))
+        cells = self.cells_in(bbox, zoom)
+        # Coarsen until the viewport fits, so a mismatched bbox and zoom cannot blow up the response
+        while len(cells) > limit and zoom > 0:
+            zoom -= 1
+            cells = self.cells_in(bbox, zoom)
+
+        level = self.levels[zoom]
+        items = []
+        for cell in cells:
+            cluster = level[cell]
+            if zoom == MAX_ZOOM and cluster.count <= LEAF_EXPAND and len(items) + cluster.count <= limit:
+                items.extend(self.points[event_id][3] for event_id in self.leaves.get(cell, ()))
+            elif cluster.count == 1:
+                items.append(self._single(zoom, cell))
+            else:
+                items.append({
+                    "type": "cluster",
+                    "id": f"{zoom}:{cell[0]}:{cell[1]}",
+                    "count": cluster.count,
+                    "lat": round(cluster.lat_sum / cluster.count, 6),
+                    "lng": round(cluster.lng_sum / cluster.count, 6),
+                    # Zoom at which the cluster starts to break apart
+                    "expansion_zoom": min(zoom + 1, MAX_ZOOM),
+                })
+
+        return {
+            "zoom": zoom,
+            "items": items[:limit],
+            "total": sum(level[cell].count for cell in cells),
+        }
+
+    def _single(self, zoom: int, cell: Tuple[int, int]) -> dict:
+        """Find the only event in a cell by descending to its leaf"""
+        x, y = cell
+        for child_zoom in range(zoom + 1, MAX_ZOOM + 1):
+            level = self.levels[child_zoom]
+            x, y = next(
+                child for child in ((2 * x, 2 * y), (2 * x + 1, 2 * y), (2 * x, 2 * y + 1), (2 * x + 1, 2 * y + 1))
+                if child in level
+            )
+        event_id = next(iter(self.leaves[(x, y)]))
+        return self.points[event_id][3]
+
+    async def load(self):
+        """Build the index from upcoming events, then swap it in"""
+        # Writes made meanwhile still reach the current index and are replayed onto the fresh one
+        fresh = MapClusterIndex()
+        self._pending = []
+        try:
+            query = {"$or": [{"starts_at": {"$gte": self.cutoff()}}, {"starts_at": None}]}
+            async for event in events_collection.find(query, POINT_PROJECTION):
+                fresh.index_event(event)
+
+            for method, args in self._pending:
+                method(fresh, *args)
+        finally:
+            self._pending = None
+
+        self.levels = fresh.levels
+        self.leaves = fresh.leaves
+        self.points = fresh.points
+        self.ready = True
+        logger.info("Map cluster index built with %d events", len(self.points))
+
+    async def _rebuild_forever(self):
+        while True:
+            try:
+                await self.load()
+            except Exception as e:
+                logger.error("Map cluster index build failed: %s", e)
+            await asyncio.sleep(MAP_REBUILD_INTERVAL)
+
+    def start(self) -> asyncio.Task:
+        """Build the index in the background and rebuild it periodically"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._rebuild_forever())
+        return self._task
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "ready": self.ready,
+            "events": len(self.points),
+            "clusters": sum(len(level) for level in self.levels),
+        }
+
+map_index = MapClusterIndex()
+metrics.register_gauge("map_index", map_index.stats)
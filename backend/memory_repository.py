@@ -0,0 +1,403 @@
+import copy
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional
+from database import Database, EVENT_LIST_PROJECTION, EVENT_SORT_FIELDS, ORGANIZER_SORT_FIELDS
+from geo import geo_point, METERS_PER_MILE
+from memory_store import MemoryCollection, MemoryDatabase, point_of, project, set_path, sort_documents, spherical_meters
+from repository import Repository
+from trending import SIGNAL_WEIGHTS, HALF_LIFE_MS, city_key, current_epoch, decayed_score, growth
+
+class MemoryRepository(Repository):
+    """Repository over the collections of a MemoryDatabase, answering list queries from its hash indexes and geo grid"""
+
+    def __init__(self, database: MemoryDatabase):
+        self.database = database
+        self.users = database.users
+        self.organizers = database.organizers
+        self.events = database.events
+        self.events_archive = database.events_archive
+
+    def seed(self, collection: str, documents: Iterable[dict]) -> int:
+        """Store documents as they would be stored in a collection, without derived fields"""
+        count = 0
+        for document in documents:
+            self.database[collection].insert_document(document)
+            count += 1
+        return count
+
+    @staticmethod
+    def _get(collection: MemoryCollection, doc_id: Optional[str]) -> Optional[dict]:
+        return collection.lookup("id", doc_id) if doc_id is not None else None
+
+    @staticmethod
+    def _modify(collection: MemoryCollection, doc_id: str, change: Callable[[dict], Any]) -> Optional[dict]:
+        document = collection.lookup("id", doc_id)
+        return collection.modify(document["_id"], change) if document is not None else None
+
+    @staticmethod
+    def _out(document: Optional[dict], projection: Optional[dict] = None) -> Optional[dict]:
+        if document is None:
+            return None
+        result = project(document, projection)
+        if "_id" in result:
+            result["_id"] = str(result["_id"])
+        return result
+
+    @staticmethod
+    def _set(update_data: dict) -> Callable[[dict], None]:
+        def change(document: dict):
+            for field, value in update_data.items():
+                set_path(document, field, copy.deepcopy(value))
+        return change
+
+    @staticmethod
+    def _with_distance(document: dict, user_lat: Optional[float], user_lng: Optional[float]) -> dict:
+        if user_lat is not None and user_lng is not None:
+            document['distance'] = Database.calculate_distance(
+                user_lat, user_lng,
+                document['location']['lat'], document['location']['lng']
+            )
+        return document
+
+    # User operations
+    async def create_user(self, user_data: dict) -> dict:
+        user_data['created_at'] = datetime.utcnow()
+        user_data['updated_at'] = datetime.utcnow()
+        stored = self.users.insert_document(user_data)
+        user_data['_id'] = str(stored['_id'])
+        return user_data
+
+    async def get_user_by_email(self, email: str) -> Optional[dict]:
+        users = self.users.select({"email": email})
+        return self._out(users[0] if users else None)
+
+    async def get_user_by_id(self, user_id: str) -> Optional[dict]:
+        return self._out(self._get(self.users, user_id))
+
+    async def update_user(self, user_id: str, update_data: dict) -> bool:
+        update_data['updated_at'] = datetime.utcnow()
+        return self._modify(self.users, user_id, self._set(update_data)) is not None
+
+    async def add_user_created_event(self, user_id: str, event_id: str) -> bool:
+        def change(user: dict):
+            created = user.setdefault("createdEvents", [])
+            if event_id not in created:
+                created.append(event_id)
+            user["updated_at"] = datetime.utcnow()
+        return self._modify(self.users, user_id, change) is not None
+
+    async def get_user_saved_events(self, user_id: str, user_lat: Optional[float] = None, user_lng: Optional[float] = None) -> List[dict]:
+        user = self._get(self.users, user_id)
+        if not user or not user.get('savedEvents'):
+            return []
+        return await self.get_events_by_ids(user['savedEvents'], user_lat, user_lng, projection=None)
+
+    # Organizer operations
+    async def create_organizer(self, organizer_data: dict) -> dict:
+        organizer_data['created_at'] = datetime.utcnow()
+        organizer_data['updated_at'] = datetime.utcnow()
+        organizer_data['geo'] = geo_point(organizer_data.get('location'))
+        stored = self.organizers.insert_document(organizer_data)
+        organizer_data['_id'] = str(stored['_id'])
+        return organizer_data
+
+    async def get_organizer_by_id(self, organizer_id: str) -> Optional[dict]:
+        return self._out(self._get(self.organizers, organizer_id))
+
+    async def get_organizers_by_ids(self, organizer_ids: List[str], user_lat: Optional[float] = None, user_lng: Optional[float] = None) -> List[dict]:
+        organizers = []
+        for organizer_id in dict.fromkeys(organizer_ids):
+            organizer = self._out(self._get(self.organizers, organizer_id))
+            if organizer:
+                organizers.append(self._with_distance(organizer, user_lat, user_lng))
+        return organizers
+
+    async def attach_organizers(self, events: List[dict]) -> List[dict]:
+        for event in events:
+            organizer = self._out(self._get(self.organizers, event.get('organizer_id')))
+            if organizer:
+                event['organizer'] = organizer
+        return events
+
+    async def get_organizers_with_filters(
+        self,
+        search: Optional[str] = None,
+        categories: Optional[List[str]] = None,
+        min_rating: Optional[float] = None,
+        max_distance: Optional[float] = None,
+        user_lat: Optional[float] = None,
+        user_lng: Optional[float] = None,
+        sort_by: str = "distance",
+        limit: int = 50,
+        fuzzy: bool = False
+    ) -> List[dict]:
+        query = Database.build_organizer_query(search, categories, min_rating, fuzzy)
+        db_sort = ORGANIZER_SORT_FIELDS.get(sort_by)
+
+        if user_lat is None or user_lng is None:
+            organizers = self.organizers.select(query)
+            if db_sort:
+                organizers = sort_documents(organizers, db_sort)
+            return [self._out(organizer) for organizer in organizers[:limit]]
+
+        # $geoNear: organizers with a location, nearest first, then optionally re-sorted
+        within = self.organizers.near(user_lat, user_lng, max_distance + 1) if max_distance else None
+        nearby = []
+        for organizer in self.organizers.select(query, within):
+            if point_of(organizer, "geo") is None:
+                continue
+            meters = spherical_meters(user_lat, user_lng, *point_of(organizer, "geo"))
+            if max_distance and meters > max_distance * METERS_PER_MILE:
+                continue
+            nearby.append((meters, organizer))
+        nearby.sort(key=lambda item: item[0])
+
+        results = []
+        for meters, organizer in nearby:
+            organizer = self._out(organizer)
+            organizer['distance'] = meters / METERS_PER_MILE
+            results.append(organizer)
+        if db_sort:
+            results = sort_documents(results, db_sort)
+        results = results[:limit]
+        for organizer in results:
+            organizer['distance'] = round(organizer['distance'], 1)
+        return results
+
+    async def update_organizer(self, organizer_id: str, update_data: dict) -> bool:
+        update_data['updated_at'] = datetime.utcnow()
+        if 'location' in update_data:
+            update_data['geo'] = geo_point(update_data['location'])
+        return self._modify(self.organizers, organizer_id, self._set(update_data)) is not None
+
+    # Event operations
+    async def create_event(self, event_data: dict) -> dict:
+        event_data['created_at'] = datetime.utcnow()
+        event_data['updated_at'] = datetime.utcnow()
+        event_data['starts_at'] = Database.parse_start_time(event_data.get('date'), event_data.get('time'))
+        event_data['geo'] = geo_point(event_data.get('location'))
+        event_data['city_key'] = city_key(event_data.get('location'))
+        stored = self.events.insert_document(event_data)
+        event_data['_id'] = str(stored['_id'])
+        return event_data
+
+    async def find_event(self, event_id: str) -> Optional[dict]:
+        event = self._get(self.events, event_id) or self._get(self.events_archive, event_id)
+        return copy.deepcopy(event) if event is not None else None
+
+    async def get_event_by_id(self, event_id: str, user_lat: Optional[float] = None, user_lng: Optional[float] = None) -> Optional[dict]:
+        event = await self.find_event(event_id)
+        if event:
+            event['_id'] = str(event['_id'])
+            self._with_distance(event, user_lat, user_lng)
+            organizer = await self.get_organizer_by_id(event['organizer_id'])
+            if organizer:
+                event['organizer'] = organizer
+        return event
+
+    async def get_events_by_ids(
+        self,
+        event_ids: List[str],
+        user_lat: Optional[float] = None,
+        user_lng: Optional[float] = None,
+        projection: Optional[dict] = EVENT_LIST_PROJECTION
+    ) -> List[dict]:
+        events = []
+        for event_id in dict.fromkeys(event_ids):
+            event = self._get(self.events, event_id) or self._get(self.events_archive, event_id)
+            if event is not None:
+                events.append(self._with_distance(self._out(event, projection), user_lat, user_lng))
+        return await self.attach_organizers(events)
+
+    async def get_events_with_filters(
+        self,
+        search: Optional[str] = None,
+        category: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        min_rating: Optional[float] = None,
+        max_distance: Optional[float] = None,
+        user_lat: Optional[float] = None,
+        user_lng: Optional[float] = None,
+        sort_by: str = "distance",
+        limit: int = 50,
+        date_from=None,
+        date_to=None,
+        upcoming: bool = False,
+        fuzzy: bool = False
+    ) -> List[dict]:
+        query = Database.build_event_query(
+            search, category, min_price, max_price, min_rating, date_from, date_to, upcoming, fuzzy
+        )
+        has_location = user_lat is not None and user_lng is not None
+        # Distances are rounded before the max_distance check, so pad the grid lookup
+        within = self.events.near(user_lat, user_lng, max_distance + 0.1) if has_location and max_distance else None
+        events = self.events.select(query, within)
+
+        db_sort = EVENT_SORT_FIELDS.get(sort_by)
+        if db_sort:
+            events = sort_documents(events, db_sort)
+        sort_by_distance = sort_by == "distance" and user_lat is not None
+
+        results = []
+        for stored in events:
+            if has_location:
+                distance = Database.calculate_distance(
+                    user_lat, user_lng,
+                    stored['location']['lat'], stored['location']['lng']
+                )
+                if max_distance and distance > max_distance:
+                    continue
+            event = self._with_distance(self._out(stored), user_lat, user_lng)
+            results.append(event)
+            if not sort_by_distance and len(results) >= limit:
+                break
+
+        if sort_by_distance:
+            results.sort(key=lambda x: x.get('distance', float('inf')))
+        return await self.attach_organizers(results[:limit])
+
+    async def get_events_by_organizer(
+        self,
+        organizer_id: str,
+        when: str = "all",
+        order_by: str = "date",
+        cursor: Optional[str] = None,
+        limit: int = 20,
+        user_lat: Optional[float] = None,
+        user_lng: Optional[float] = None
+    ) -> Dict[str, Any]:
+        query = Database.build_organizer_events_query(organizer_id, when)
+        by_distance = order_by == "distance" and user_lat is not None and user_lng is not None
+        position = Database.decode_organizer_events_cursor(cursor, by_distance) if cursor else None
+
+        if by_distance:
+            nearby = []
+            for stored in self.events.select(query):
+                if point_of(stored, "geo") is None:
+                    continue
+                meters = spherical_meters(user_lat, user_lng, *point_of(stored, "geo"))
+                # Events at one venue share a distance, so ties resume on _id
+                if position and (meters, stored["_id"]) <= (position["d"], position["id"]):
+                    continue
+                nearby.append((meters, stored))
+            nearby.sort(key=lambda item: (item[0], item[1]["_id"]))
+            page = nearby[:limit + 1]
+            has_more = len(page) > limit
+            page = page[:limit]
+
+            next_cursor = None
+            if has_more:
+                meters, last = page[-1]
+                next_cursor = Database.encode_organizer_events_cursor({"distance": meters, "_id": last["_id"]}, True)
+
+            events = []
+            for meters, stored in page:
+                event = self._out(stored, EVENT_LIST_PROJECTION)
+                event['distance'] = round(meters / METERS_PER_MILE, 1)
+                events.append(event)
+        else:
+            # Past events read newest first, everything else soonest first; "all"
+            # ends with events whose start time is unknown, in _id order
+            direction = -1 if when == "past" else 1
+            page = []
+            if not (position and position["v"] is None):
+                dated = dict(query)
+                if when == "all":
+                    dated["starts_at"] = {"$type": "date"}
+                if position:
+                    op = "$lt" if direction == -1 else "$gt"
+                    dated["$or"] = [
+                        {"starts_at": {op: position["v"]}},
+                        {"starts_at": position["v"], "_id": {op: position["id"]}}
+                    ]
+                page = sort_documents(self.events.select(dated), [("starts_at", direction), ("_id", direction)])[:limit + 1]
+
+            if when == "all" and len(page) <= limit:
+                undated = {**query, "starts_at": None}
+                if position and position["v"] is None:
+                    undated["_id"] = {"$gt": position["id"]}
+                page += sort_documents(self.events.select(undated), [("_id", 1)])[:limit + 1 - len(page)]
+
+            has_more = len(page) > limit
+            page = page[:limit]
+            next_cursor = Database.encode_organizer_events_cursor(page[-1], False) if has_more else None
+
+            events = [self._with_distance(self._out(stored, EVENT_LIST_PROJECTION), user_lat, user_lng) for stored in page]
+
+        return {"events": events, "next_cursor": next_cursor, "has_more": has_more}
+
+    async def get_trending_events(
+        self,
+        city: Optional[str] = None,
+        user_lat: Optional[float] = None,
+        user_lng: Optional[float] = None,
+        limit: int = 20
+    ) -> List[dict]:
+        query: Dict[str, Any] = {"trending_score": {"$gt": 0}}
+        if city is not None:
+            query["city_key"] = city_key({"city": city})
+
+        events = []
+        for stored in sort_documents(self.events.select(query), [("trending_score", -1)])[:limit]:
+            event = self._out(stored, EVENT_LIST_PROJECTION)
+            event['trending'] = round(decayed_score(event), 3)
+            events.append(self._with_distance(event, user_lat, user_lng))
+        return await self.attach_organizers(events)
+
+    async def get_event_counters(self, event_ids: List[str]) -> Dict[str, dict]:
+        counters = {}
+        for event_id in dict.fromkeys(event_ids):
+            event = self._get(self.events, event_id)
+            if event is None:
+                continue
+            counter = {field: event[field] for field in ("attendees", "rating") if field in event}
+            counter["reviewCount"] = len(event.get("reviews") or [])
+            counters[event_id] = counter
+        return counters
+
+    async def update_event(self, event_id: str, update_data: dict) -> bool:
+        update_data['updated_at'] = datetime.utcnow()
+        if 'date' in update_data and 'time' in update_data:
+            update_data['starts_at'] = Database.parse_start_time(update_data['date'], update_data['time'])
+        if 'location' in update_data:
+            update_data['geo'] = geo_point(update_data['location'])
+            update_data['city_key'] = city_key(update_data['location'])
+        return self._modify(self.events, event_id, self._set(update_data)) is not None
+
+    async def increment_event_attendees(self, event_id: str) -> Optional[int]:
+        def change(event: dict):
+            event["attendees"] = event.get("attendees", 0) + 1
+            event["updated_at"] = datetime.utcnow()
+        event = self._modify(self.events, event_id, change)
+        return event["attendees"] if event else None
+
+    async def record_trending_signal(self, event_id: str, signal: str, count: int = 1):
+        # Same arithmetic as trending.score_update, which runs inside MongoDB
+        now = datetime.utcnow()
+        epoch = current_epoch(now)
+        def change(event: dict):
+            stored_epoch = event.get("trending_epoch") or epoch
+            rescale = 2 ** ((stored_epoch - epoch).total_seconds() * 1000 / HALF_LIFE_MS)
+            score = (event.get("trending_score") or 0) * rescale
+            event["trending_score"] = score + SIGNAL_WEIGHTS[signal] * count * growth(now, epoch)
+            event["trending_epoch"] = epoch
+        self._modify(self.events, event_id, change)
+
+    async def add_event_review(self, event_id: str, review_data: dict, recalculate: bool = True) -> bool:
+        def change(event: dict):
+            event.setdefault("reviews", []).append(copy.deepcopy(review_data))
+            event["updated_at"] = datetime.utcnow()
+        if self._modify(self.events, event_id, change) is None:
+            return False
+        if recalculate:
+            await self.recalculate_event_rating(event_id)
+        return True
+
+    async def recalculate_event_rating(self, event_id: str) -> bool:
+        event = self._get(self.events, event_id)
+        if not event or not event.get('reviews'):
+            return False
+        reviews = event['reviews']
+        avg_rating = round(sum(review['rating'] for review in reviews) / len(reviews), 1)
+        return self._modify(self.events, event_id, self._set({"rating": avg_rating, "updated_at": datetime.utcnow()})) is not None
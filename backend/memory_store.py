@@ -0,0 +1,1199 @@
+import asyncio
+import copy
+import itertools
+import math
+import re
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+from bson import ObjectId
+from pymongo import DeleteMany, DeleteOne, InsertOne, ReplaceOne, UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure, WriteError
+from pymongo.results import BulkWriteResult, DeleteResult, InsertManyResult, InsertOneResult, UpdateResult
+from geo import cell_of, cells_within, METERS_PER_MILE
+
+# In-process stand-in for the MongoDB database, selected with STORAGE_BACKEND=memory.
+# Collections implement the part of Motor's API this codebase uses, so every module
+# runs unchanged against it; anything outside that subset raises OperationFailure.
+
+# Degrees per side of a geo grid cell
+GRID_SIZE = 0.25
+
+# Earth radius MongoDB uses for spherical distances
+EARTH_RADIUS_METERS = 6378100
+
+# Server error codes raised for the same conditions MongoDB reports
+DUPLICATE_KEY = 11000
+TYPE_MISMATCH = 14
+INDEX_OPTIONS_CONFLICT = 85
+UNSUPPORTED = 115
+
+MISSING = object()
+
+# Documents
+
+def get_path(document: Any, path: str) -> Any:
+    """Read a dotted field without descending into arrays, returning MISSING when absent"""
+    value = document
+    for part in path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return MISSING
+        value = value[part]
+    return value
+
+def set_path(document: dict, path: str, value: Any):
+    parts = path.split(".")
+    for part in parts[:-1]:
+        if not isinstance(document.get(part), dict):
+            document[part] = {}
+        document = document[part]
+    document[parts[-1]] = value
+
+def unset_path(document: dict, path: str):
+    parts = path.split(".")
+    parent = get_path(document, ".".join(parts[:-1])) if len(parts) > 1 else document
+    if isinstance(parent, dict):
+        parent.pop(parts[-1], None)
+
+def path_values(document: Any, path: str) -> list:
+    """Values a dotted path reaches, descending into arrays of subdocuments as queries do"""
+    values = [document]
+    for part in path.split("."):
+        found = []
+        for value in values:
+            if isinstance(value, dict):
+                if part in value:
+                    found.append(value[part])
+            elif isinstance(value, list):
+                if part.isdigit() and int(part) < len(value):
+                    found.append(value[int(part)])
+                found.extend(element[part] for element in value if isinstance(element, dict) and part in element)
+        values = found
+    return values
+
+def _type_order(value: Any) -> int:
+    """Rank of a value's type in BSON comparison order"""
+    if value is MISSING or value is None:
+        return 0
+    if isinstance(value, bool):
+        return 8
+    if isinstance(value, (int, float)):
+        return 1
+    if isinstance(value, str):
+        return 2
+    if isinstance(value, dict):
+        return 3
+    if isinstance(value, list):
+        return 4
+    if isinstance(value, ObjectId):
+        return 7
+    if isinstance(value, datetime):
+        return 9
+    return 10
+
+def sort_key(value: Any) -> Tuple[int, Any]:
+    """Order values of different types the way BSON does"""
+    order = _type_order(value)
+    if order == 0:
+        return (0, 0)
+    if order in (3, 4, 10):
+        return (order, repr(value))
+    return (order, value)
+
+def _compare(a: Any, b: Any) -> int:
+    a, b = sort_key(a), sort_key(b)
+    return (a > b) - (a < b)
+
+def sort_spec(key_or_list: Any, direction: Optional[int] = None) -> List[Tuple[str, int]]:
+    """Normalise the sort arguments Motor accepts into (field, direction) pairs"""
+    if isinstance(key_or_list, str):
+        return [(key_or_list, direction or 1)]
+    if isinstance(key_or_list, dict):
+        return list(key_or_list.items())
+    return [tuple(item) for item in key_or_list]
+
+def sort_documents(documents: Iterable[dict], spec: List[Tuple[str, int]]) -> List[dict]:
+    """Sort like cursor.sort, keeping natural order between equal keys"""
+    documents = list(documents)
+    for field, direction in reversed(spec):
+        documents.sort(key=lambda document: sort_key(get_path(document, field)), reverse=direction == -1)
+    return documents
+
+# Queries
+
+def _candidates(values: list) -> list:
+    """Values a query predicate is tested against: each value and the elements of arrays"""
+    candidates = []
+    for value in values:
+        candidates.append(value)
+        if isinstance(value, list):
+            candidates.extend(value)
+    return candidates
+
+def _comparable(a: Any, b: Any) -> bool:
+    return _type_order(a) == _type_order(b) and _type_order(a) not in (0, 3, 4)
+
+def _match_operators(values: list, condition: dict) -> bool:
+    candidates = _candidates(values)
+    for op, target in condition.items():
+        if op == "$options":
+            continue
+        if op == "$regex":
+            flags = re.IGNORECASE if "i" in condition.get("$options", "") else 0
+            pattern = re.compile(target, flags)
+            if not any(isinstance(candidate, str) and pattern.search(candidate) for candidate in candidates):
+                return False
+        elif op == "$in":
+            if not values:
+                if None not in target:
+                    return False
+            elif not any(candidate in target for candidate in candidates):
+                return False
+        elif op == "$nin":
+            if _match_operators(values, {"$in": target}):
+                return False
+        elif op == "$exists":
+            if bool(values) != bool(target):
+                return False
+        elif op == "$eq":
+            if not match_values(values, target):
+                return False
+        elif op == "$ne":
+            if match_values(values, target):
+                return False
+        elif op in ("$gt", "$gte", "$lt", "$lte"):
+            if not any(_comparable(candidate, target) and _range(candidate, op, target) for candidate in candidates):
+                return False
+        elif op == "$type":
+            if target != "date":
+                raise OperationFailure(f"Unsupported $type {target}", UNSUPPORTED)
+            if not any(isinstance(candidate, datetime) for candidate in values):
+                return False
+        elif op == "$elemMatch":
+            if not any(isinstance(value, list) and any(
+                matches(element, target) if isinstance(element, dict) else match_values([element], target)
+                for element in value
+            ) for value in values):
+                return False
+        else:
+            raise OperationFailure(f"Unsupported query operator {op}", UNSUPPORTED)
+    return True
+
+def _range(value: Any, op: str, target: Any) -> bool:
+    if op == "$gt":
+        return value > target
+    if op == "$gte":
+        return value >= target
+    if op == "$lt":
+        return value < target
+    return value <= target
+
+def _is_operator_dict(condition: Any) -> bool:
+    return isinstance(condition, dict) and bool(condition) and all(key.startswith("$") for key in condition)
+
+def match_values(values: list, condition: Any) -> bool:
+    """Test the values a field path reached against one query condition"""
+    if _is_operator_dict(condition):
+        return _match_operators(values, condition)
+    if condition is None:
+        return not values or any(candidate is None for candidate in _candidates(values))
+    return any(candidate == condition for candidate in _candidates(values))
+
+def matches(document: dict, query: dict) -> bool:
+    """Evaluate a MongoDB query against a document"""
+    for key, condition in query.items():
+        if key == "$or":
+            if not any(matches(document, clause) for clause in condition):
+                return False
+        elif key == "$and":
+            if not all(matches(document, clause) for clause in condition):
+                return False
+        elif key == "$nor":
+            if any(matches(document, clause) for clause in condition):
+                return False
+        elif key.startswith("$"):
+            raise OperationFailure(f"Unsupported query operator {key}", UNSUPPORTED)
+        elif not match_values(path_values(document, key), condition):
+            return False
+    return True
+
+# Expressions
+
+def _expression_path(document: Any, path: str) -> Any:
+    """Resolve "$a.b" in an expression, mapping over arrays as aggregation does"""
+    value = document
+    parts = path.split(".")
+    for i, part in enumerate(parts):
+        if isinstance(value, list):
+            rest = ".".join(parts[i:])
+            mapped = [_expression_path(element, rest) for element in value if isinstance(element, dict)]
+            return [element for element in mapped if element is not None]
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value
+
+def _arguments(args: Any, document: dict) -> list:
+    if isinstance(args, list):
+        return [evaluate(arg, document) for arg in args]
+    return [evaluate(args, document)]
+
+def _numbers(values: Iterable[Any]) -> List[float]:
+    return [value for value in values if isinstance(value, (int, float)) and not isinstance(value, bool)]
+
+def _ms(value: float) -> timedelta:
+    return timedelta(milliseconds=value)
+
+def _add(args, document):
+    values = _arguments(args, document)
+    if any(value is None for value in values):
+        return None
+    dates = [value for value in values if isinstance(value, datetime)]
+    total = sum(value for value in values if not isinstance(value, datetime))
+    return dates[0] + _ms(total) if dates else total
+
+def _subtract(args, document):
+    a, b = _arguments(args, document)
+    if a is None or b is None:
+        return None
+    if isinstance(a, datetime) and isinstance(b, datetime):
+        return int((a - b) / timedelta(milliseconds=1))
+    if isinstance(a, datetime):
+        return a - _ms(b)
+    return a - b
+
+def _multiply(args, document):
+    values = _arguments(args, document)
+    if any(value is None for value in values):
+        return None
+    return math.prod(values)
+
+def _divide(args, document):
+    a, b = _arguments(args, document)
+    if a is None or b is None:
+        return None
+    if b == 0:
+        raise OperationFailure("can't $divide by zero", 2)
+    return a / b
+
+def _unary(function: Callable[[float], float]):
+    def operator(args, document):
+        (value,) = _arguments(args, document)
+        return None if value is None else function(value)
+    return operator
+
+def _binary(function: Callable[[Any, Any], Any]):
+    def operator(args, document):
+        a, b = _arguments(args, document)
+        return None if a is None or b is None else function(a, b)
+    return operator
+
+def _round(args, document):
+    values = _arguments(args, document)
+    value, places = values[0], (values[1] if len(values) > 1 else 0)
+    if value is None:
+        return None
+    rounded = round(value, places)
+    return int(rounded) if places == 0 and isinstance(value, int) else rounded
+
+def _if_null(args, document):
+    values = _arguments(args, document)
+    for value in values[:-1]:
+        if value is not None:
+            return value
+    return values[-1]
+
+def _truthy(value: Any) -> bool:
+    return value is not None and value is not False and value != 0
+
+def _cond(args, document):
+    if isinstance(args, dict):
+        args = [args["if"], args["then"], args["else"]]
+    condition, then, otherwise = args
+    return evaluate(then if _truthy(evaluate(condition, document)) else otherwise, document)
+
+def _comparison(test: Callable[[int], bool]):
+    def operator(args, document):
+        a, b = _arguments(args, document)
+        return test(_compare(a, b))
+    return operator
+
+def _size(args, document):
+    (value,) = _arguments(args, document)
+    if not isinstance(value, list):
+        raise OperationFailure("The argument to $size must be an array", 17124)
+    return len(value)
+
+def _accumulate(function: Callable[[list], Any]):
+    """Expression form of $sum, $avg, $max and $min: one array argument, or several values"""
+    def operator(args, document):
+        values = _arguments(args, document)
+        if not isinstance(args, list) and isinstance(values[0], list):
+            values = values[0]
+        return function(values)
+    return operator
+
+def _avg(values: list):
+    numbers = _numbers(values)
+    return sum(numbers) / len(numbers) if numbers else None
+
+def _max(values: list):
+    present = [value for value in values if value is not None]
+    return max(present, key=sort_key) if present else None
+
+def _min(values: list):
+    present = [value for value in values if value is not None]
+    return min(present, key=sort_key) if present else None
+
+EXPRESSION_OPERATORS: Dict[str, Callable[[Any, dict], Any]] = {
+    "$add": _add,
+    "$subtract": _subtract,
+    "$multiply": _multiply,
+    "$divide": _divide,
+    "$pow": _binary(lambda a, b: a ** b),
+    "$sqrt": _unary(math.sqrt),
+    "$sin": _unary(math.sin),
+    "$cos": _unary(math.cos),
+    "$atan2": _binary(math.atan2),
+    "$degreesToRadians": _unary(math.radians),
+    "$round": _round,
+    "$ifNull": _if_null,
+    "$cond": _cond,
+    "$eq": _comparison(lambda c: c == 0),
+    "$ne": _comparison(lambda c: c != 0),
+    "$gt": _comparison(lambda c: c > 0),
+    "$gte": _comparison(lambda c: c >= 0),
+    "$lt": _comparison(lambda c: c < 0),
+    "$lte": _comparison(lambda c: c <= 0),
+    "$size": _size,
+    "$sum": _accumulate(lambda values: sum(_numbers(values))),
+    "$avg": _accumulate(_avg),
+    "$max": _accumulate(_max),
+    "$min": _accumulate(_min),
+    "$literal": lambda args, document: args,
+}
+
+def evaluate(expression: Any, document: dict) -> Any:
+    """Evaluate an aggregation expression against a document"""
+    if isinstance(expression, str) and expression.startswith("$"):
+        return _expression_path(document, expression[1:])
+    if isinstance(expression, list):
+        return [evaluate(item, document) for item in expression]
+    if isinstance(expression, dict):
+        if len(expression) == 1:
+            (op, args), = expression.items()
+            if op.startswith("$"):
+                operator = EXPRESSION_OPERATORS.get(op)
+                if operator is None:
+                    raise OperationFailure(f"Unsupported expression operator {op}", UNSUPPORTED)
+                return operator(args, document)
+        return {key: evaluate(value, document) for key, value in expression.items()}
+    return expression
+
+def _is_expression(value: Any) -> bool:
+    return (isinstance(value, str) and value.startswith("$")) or isinstance(value, dict)
+
+def project(document: dict, projection: Optional[dict]) -> dict:
+    """Copy a document through an inclusion or exclusion projection; computed fields are evaluated"""
+    if not projection:
+        return copy.deepcopy(document)
+    fields = {field: value for field, value in projection.items() if field != "_id"}
+    # {"_id": 0} alone excludes, as does a projection of only falsy values
+    excluding = not any(value is True or value == 1 or _is_expression(value) for value in fields.values())
+    if excluding and (fields or not projection.get("_id", 1)):
+        result = copy.deepcopy(document)
+        for field in projection:
+            if not projection[field]:
+                unset_path(result, field)
+        return result
+
+    result = {}
+    if projection.get("_id", 1) and "_id" in document:
+        result["_id"] = copy.deepcopy(document["_id"])
+    for field, value in fields.items():
+        if _is_expression(value):
+            set_path(result, field, evaluate(value, document))
+        elif value:
+            found = get_path(document, field)
+            if found is not MISSING:
+                set_path(result, field, copy.deepcopy(found))
+    return result
+
+# Updates
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def _push(document: dict, field: str, spec: Any):
+    current = get_path(document, field)
+    if current is MISSING:
+        current = []
+    elif not isinstance(current, list):
+        raise WriteError(f"The field '{field}' must be an array", TYPE_MISMATCH)
+    current = list(current)
+    if _is_operator_dict(spec) and "$each" in spec:
+        items = copy.deepcopy(spec["$each"])
+        position = spec.get("$position")
+        if position is None:
+            current.extend(items)
+        else:
+            current[position:position] = items
+        if "$sort" in spec:
+            order = spec["$sort"]
+            if isinstance(order, dict):
+                current = sort_documents(current, list(order.items()))
+            else:
+                current.sort(key=sort_key, reverse=order == -1)
+        if "$slice" in spec:
+            limit = spec["$slice"]
+            current = current[:limit] if limit >= 0 else current[limit:]
+    else:
+        current.append(copy.deepcopy(spec))
+    set_path(document, field, current)
+
+def _pull(document: dict, field: str, condition: Any):
+    current = get_path(document, field)
+    if not isinstance(current, list):
+        return
+    def pulled(element: Any) -> bool:
+        if isinstance(condition, dict) and not _is_operator_dict(condition):
+            return isinstance(element, dict) and matches(element, condition)
+        return match_values([element], condition)
+    set_path(document, field, [element for element in current if not pulled(element)])
+
+def _add_to_set(document: dict, field: str, spec: Any):
+    current = get_path(document, field)
+    current = [] if current is MISSING else list(current)
+    items = spec["$each"] if _is_operator_dict(spec) and "$each" in spec else [spec]
+    for item in items:
+        if item not in current:
+            current.append(copy.deepcopy(item))
+    set_path(document, field, current)
+
+def apply_update(document: dict, update: Any, inserting: bool = False) -> dict:
+    """Return a copy of a document with an update document or update pipeline applied"""
+    result = copy.deepcopy(document)
+    if isinstance(update, list):
+        for stage in update:
+            (name, spec), = stage.items()
+            if name in ("$set", "$addFields"):
+                values = {field: evaluate(value, result) for field, value in spec.items()}
+                for field, value in values.items():
+                    set_path(result, field, value)
+            elif name == "$unset":
+                for field in ([spec] if isinstance(spec, str) else spec):
+                    unset_path(result, field)
+            else:
+                raise OperationFailure(f"Unsupported update stage {name}", UNSUPPORTED)
+        return result
+
+    for op, fields in update.items():
+        for field, value in fields.items():
+            if op == "$set":
+                set_path(result, field, copy.deepcopy(value))
+            elif op == "$setOnInsert":
+                if inserting:
+                    set_path(result, field, copy.deepcopy(value))
+            elif op == "$unset":
+                unset_path(result, field)
+            elif op == "$inc":
+                current = get_path(result, field)
+                if current is MISSING:
+                    current = 0
+                if not _is_number(current):
+                    raise WriteError(f"Cannot apply $inc to a value of non-numeric type in field '{field}'", TYPE_MISMATCH)
+                set_path(result, field, current + value)
+            elif op == "$max":
+                current = get_path(result, field)
+                if current is MISSING or _compare(value, current) > 0:
+                    set_path(result, field, copy.deepcopy(value))
+            elif op == "$min":
+                current = get_path(result, field)
+                if current is MISSING or _compare(value, current) < 0:
+                    set_path(result, field, copy.deepcopy(value))
+            elif op == "$push":
+                _push(result, field, value)
+            elif op == "$pull":
+                _pull(result, field, value)
+            elif op == "$addToSet":
+                _add_to_set(result, field, value)
+            else:
+                raise OperationFailure(f"Unsupported update operator {op}", UNSUPPORTED)
+    return result
+
+def _upsert_base(query: dict) -> dict:
+    """The fields an upsert copies from its query: top-level equality conditions"""
+    document = {}
+    for field, condition in query.items():
+        if field.startswith("$"):
+            continue
+        if _is_operator_dict(condition):
+            if "$eq" in condition:
+                set_path(document, field, copy.deepcopy(condition["$eq"]))
+            continue
+        set_path(document, field, copy.deepcopy(condition))
+    return document
+
+# Aggregation
+
+def spherical_meters(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Great-circle distance in meters, as $geoNear computes it"""
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_METERS * math.asin(min(1.0, math.sqrt(a)))
+
+def point_of(document: dict, field: str) -> Optional[Tuple[float, float]]:
+    """(lat, lng) of a GeoJSON point field"""
+    point = get_path(document, field)
+    if not isinstance(point, dict) or point.get("type") != "Point":
+        return None
+    lng, lat = point["coordinates"]
+    return lat, lng
+
+def _freeze(value: Any) -> Any:
+    if isinstance(value, dict):
+        return tuple((key, _freeze(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+ACCUMULATORS: Dict[str, Callable[[list], Any]] = {
+    "$sum": lambda values: sum(_numbers(values)),
+    "$avg": _avg,
+    "$max": _max,
+    "$min": _min,
+    "$first": lambda values: values[0] if values else None,
+    "$last": lambda values: values[-1] if values else None,
+    "$push": list,
+    "$addToSet": lambda values: list({_freeze(value): value for value in values}.values()),
+}
+
+def _group(documents: List[dict], spec: dict) -> List[dict]:
+    groups: Dict[Any, Tuple[Any, List[dict]]] = {}
+    for document in documents:
+        key = evaluate(spec["_id"], document)
+        groups.setdefault(_freeze(key), (key, []))[1].append(document)
+
+    results = []
+    for key, members in groups.values():
+        result = {"_id": key}
+        for field, accumulator in spec.items():
+            if field == "_id":
+                continue
+            (op, expression), = accumulator.items()
+            if op not in ACCUMULATORS:
+                raise OperationFailure(f"Unsupported accumulator {op}", UNSUPPORTED)
+            values = [evaluate(expression, member) for member in members]
+            if op in ("$sum", "$avg"):
+                values = [value for value in values if not isinstance(value, list)]
+            result[field] = ACCUMULATORS[op](values)
+        results.append(result)
+    return results
+
+def _bucket(documents: List[dict], spec: dict) -> List[dict]:
+    boundaries = spec["boundaries"]
+    output = spec.get("output") or {"count": {"$sum": 1}}
+    members: Dict[Any, List[dict]] = {}
+    for document in documents:
+        value = evaluate(spec["groupBy"], document)
+        bucket = next(
+            (low for low, high in zip(boundaries, boundaries[1:]) if _comparable(value, low) and low <= value < high),
+            MISSING
+        )
+        if bucket is MISSING:
+            if "default" not in spec:
+                raise OperationFailure("$bucket could not find a matching branch for an input", 40066)
+            bucket = spec["default"]
+        members.setdefault(bucket, []).append(document)
+
+    ordered = [low for low in boundaries if low in members]
+    if "default" in spec and spec["default"] in members and spec["default"] not in ordered:
+        ordered.append(spec["default"])
+    results = []
+    for bucket in ordered:
+        result = _group(members[bucket], {"_id": None, **output})[0]
+        result["_id"] = bucket
+        results.append(result)
+    return results
+
+def _unwind(documents: List[dict], spec: Any) -> List[dict]:
+    if isinstance(spec, str):
+        spec = {"path": spec}
+    field = spec["path"][1:]
+    keep_empty = spec.get("preserveNullAndEmptyArrays", False)
+    results = []
+    for document in documents:
+        value = get_path(document, field)
+        if isinstance(value, list) and value:
+            for element in value:
+                unwound = copy.deepcopy(document) if "." in field else dict(document)
+                set_path(unwound, field, element)
+                results.append(unwound)
+        elif isinstance(value, list) or value is MISSING or value is None:
+            if keep_empty:
+                results.append(document)
+        else:
+            results.append(document)
+    return results
+
+def _add_fields(documents: List[dict], spec: dict) -> List[dict]:
+    results = []
+    for document in documents:
+        result = copy.deepcopy(document)
+        for field, expression in spec.items():
+            set_path(result, field, evaluate(expression, document))
+        results.append(result)
+    return results
+
+def run_pipeline(documents: List[dict], pipeline: List[dict]) -> List[dict]:
+    """Run aggregation stages over documents the caller owns"""
+    for stage in pipeline:
+        (name, spec), = stage.items()
+        if name == "$match":
+            documents = [document for document in documents if matches(document, spec)]
+        elif name == "$limit":
+            documents = documents[:spec]
+        elif name == "$skip":
+            documents = documents[spec:]
+        elif name == "$sort":
+            documents = sort_documents(documents, list(spec.items()))
+        elif name == "$project":
+            documents = [project(document, spec) for document in documents]
+        elif name in ("$addFields", "$set"):
+            documents = _add_fields(documents, spec)
+        elif name == "$unset":
+            fields = [spec] if isinstance(spec, str) else spec
+            documents = [project(document, {field: 0 for field in fields}) for document in documents]
+        elif name == "$group":
+            documents = _group(documents, spec)
+        elif name == "$bucket":
+            documents = _bucket(documents, spec)
+        elif name == "$unwind":
+            documents = _unwind(documents, spec)
+        elif name == "$count":
+            documents = [{spec: len(documents)}] if documents else []
+        elif name == "$facet":
+            documents = [{field: run_pipeline(list(documents), stages) for field, stages in spec.items()}]
+        else:
+            raise OperationFailure(f"Unsupported aggregation stage {name}", UNSUPPORTED)
+    return documents
+
+# Cursors
+
+class MemoryCursor:
+    """Lazily evaluated cursor supporting sort, skip, limit, to_list and async iteration"""
+
+    def __init__(self, produce: Callable[["MemoryCursor"], List[dict]]):
+        self._produce = produce
+        self._sort: List[Tuple[str, int]] = []
+        self._skip = 0
+        self._limit = 0
+
+    def sort(self, key_or_list: Any, direction: Optional[int] = None) -> "MemoryCursor":
+        self._sort = sort_spec(key_or_list, direction)
+        return self
+
+    def skip(self, count: int) -> "MemoryCursor":
+        self._skip = count
+        return self
+
+    def limit(self, count: int) -> "MemoryCursor":
+        self._limit = count
+        return self
+
+    async def to_list(self, length: Optional[int] = None) -> List[dict]:
+        documents = self._produce(self)
+        return documents[:length] if length else documents
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for document in await self.to_list(None):
+            yield document
+
+    async def explain(self):
+        raise OperationFailure("explain is not supported by the in-memory store", UNSUPPORTED)
+
+# Collections
+
+class MemoryCollection:
+    """One collection: documents by _id in natural order, hash indexes on the leading
+    field of each created index, and a lat/lng grid over a 2dsphere field"""
+
+    def __init__(self, database: "MemoryDatabase", name: str):
+        self.database = database
+        self.name = name
+        self.documents: Dict[Any, dict] = {}
+        self._sequence: Dict[Any, int] = {}
+        self._counter = itertools.count()
+        # index name -> {"key": [(field, direction)], "unique": bool}
+        self.index_specs: Dict[str, dict] = {"_id_": {"key": [("_id", 1)], "unique": True}}
+        # field -> value -> _ids
+        self.hashes: Dict[str, Dict[Any, Set[Any]]] = {}
+        self.unique: List[List[str]] = []
+        self.geo_field: Optional[str] = None
+        self.grid: Dict[Tuple[int, int], Set[Any]] = {}
+        self._cells: Dict[Any, Tuple[int, int]] = {}
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    # Index maintenance
+
+    @staticmethod
+    def _keys_of(values: list) -> list:
+        keys = []
+        for value in _candidates(values):
+            if value is not None and not isinstance(value, (dict, list)):
+                keys.append(value)
+        return keys
+
+    def _index(self, key: Any, document: dict):
+        for field, table in self.hashes.items():
+            for value in self._keys_of(path_values(document, field)):
+                table.setdefault(value, set()).add(key)
+        if self.geo_field:
+            point = point_of(document, self.geo_field)
+            if point is not None:
+                cell = cell_of(point[0], point[1], GRID_SIZE)
+                self.grid.setdefault(cell, set()).add(key)
+                self._cells[key] = cell
+
+    def _unindex(self, key: Any, document: dict):
+        for field, table in self.hashes.items():
+            for value in self._keys_of(path_values(document, field)):
+                keys = table.get(value)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del table[value]
+        cell = self._cells.pop(key, None)
+        if cell is not None:
+            keys = self.grid[cell]
+            keys.discard(key)
+            if not keys:
+                del self.grid[cell]
+
+    def _reindex(self):
+        for table in self.hashes.values():
+            table.clear()
+        self.grid.clear()
+        self._cells.clear()
+        for key, document in self.documents.items():
+            self._index(key, document)
+
+    def _unique_values(self, document: dict, fields: List[str]) -> tuple:
+        return tuple(_freeze(None if (value := get_path(document, field)) is MISSING else value) for field in fields)
+
+    def _check_unique(self, document: dict, key: Any):
+        for fields in self.unique:
+            values = self._unique_values(document, fields)
+            for other_key in self._lookup_keys({fields[0]: values[0]} if values[0] is not None else {}):
+                if other_key != key and self._unique_values(self.documents[other_key], fields) == values:
+                    raise DuplicateKeyError(
+                        f"E11000 duplicate key error collection: {self.database.name}.{self.name} "
+                        f"index: {'_'.join(fields)} dup key: {dict(zip(fields, values))}",
+                        DUPLICATE_KEY
+                    )
+
+    # Reads
+
+    def _lookup_keys(self, query: dict) -> Iterable[Any]:
+        """_ids worth testing against a query, narrowed by the most selective hash index"""
+        best: Optional[Set[Any]] = None
+        for field, condition in query.items():
+            if field == "_id" and not _is_operator_dict(condition) and not isinstance(condition, (dict, list)):
+                return [condition] if condition in self.documents else []
+            table = self.hashes.get(field)
+            if table is None:
+                continue
+            if _is_operator_dict(condition) and set(condition) == {"$in"}:
+                keys = set()
+                for value in condition["$in"]:
+                    if value is not None and not isinstance(value, (dict, list)):
+                        keys |= table.get(value, set())
+                    else:
+                        keys = None
+                        break
+                if keys is None:
+                    continue
+            elif condition is not None and not isinstance(condition, (dict, list)):
+                keys = table.get(condition, set())
+            else:
+                continue
+            if best is None or len(keys) < len(best):
+                best = keys
+        if best is None:
+            return list(self.documents)
+        return sorted(best, key=self._sequence.__getitem__)
+
+    def select(self, query: Optional[dict] = None, within: Optional[Set[Any]] = None) -> List[dict]:
+        """Stored documents matching a query in natural order; callers must not modify them"""
+        query = query or {}
+        keys = self._lookup_keys(query)
+        if within is not None:
+            keys = [key for key in keys if key in within]
+        return [document for document in (self.documents[key] for key in keys) if matches(document, query)]
+
+    def lookup(self, field: str, value: Any) -> Optional[dict]:
+        """The first stored document whose field equals value"""
+        found = self.select({field: value})
+        return found[0] if found else None
+
+    def near(self, lat: float, lng: float, radius_miles: float) -> Optional[Set[Any]]:
+        """_ids in the grid cells covering a radius, or None without a 2dsphere index"""
+        if self.geo_field is None:
+            return None
+        keys: Set[Any] = set()
+        for cell in cells_within(lat, lng, radius_miles, GRID_SIZE):
+            keys |= self.grid.get(cell, set())
+        return keys
+
+    # Writes
+
+    def insert_document(self, document: dict) -> dict:
+        """Store a copy of a document, assigning an _id on the original like insert_one"""
+        if "_id" not in document:
+            document["_id"] = ObjectId()
+        stored = copy.deepcopy(document)
+        key = stored["_id"]
+        if key in self.documents:
+            raise DuplicateKeyError(
+                f"E11000 duplicate key error collection: {self.database.name}.{self.name} index: _id_ dup key: {key}",
+                DUPLICATE_KEY
+            )
+        self._check_unique(stored, key)
+        self.documents[key] = stored
+        self._sequence[key] = next(self._counter)
+        self._index(key, stored)
+        self.database.emit(self.name, "insert", key, None, stored)
+        return stored
+
+    def store(self, key: Any, updated: dict, operation: str = "update") -> bool:
+        """Replace a stored document with an updated copy, returning whether it changed"""
+        current = self.documents[key]
+        if updated == current:
+            return False
+        updated["_id"] = key
+        self._check_unique(updated, key)
+        self._unindex(key, current)
+        self.documents[key] = updated
+        self._index(key, updated)
+        self.database.emit(self.name, operation, key, current, updated)
+        return True
+
+    def modify(self, key: Any, change: Callable[[dict], Any]) -> Optional[dict]:
+        """Apply an in-place change to a copy of a stored document and save it"""
+        current = self.documents.get(key)
+        if current is None:
+            return None
+        updated = copy.deepcopy(current)
+        change(updated)
+        self.store(key, updated)
+        return self.documents[key]
+
+    def remove(self, key: Any) -> Optional[dict]:
+        document = self.documents.pop(key, None)
+        if document is not None:
+            self._sequence.pop(key)
+            self._unindex(key, document)
+            self.database.emit(self.name, "delete", key, document, None)
+        return document
+
+    def _update(self, query: dict, update: Any, upsert: bool, multi: bool) -> dict:
+        if not update or not (isinstance(update, list) or all(key.startswith("$") for key in update)):
+            raise ValueError("update only works with $ operators")
+        targets = self.select(query)
+        if not multi:
+            targets = targets[:1]
+        modified = 0
+        for document in targets:
+            if self.store(document["_id"], apply_update(document, update)):
+                modified += 1
+        if targets or not upsert:
+            return {"n": len(targets), "nModified": modified}
+        inserted = self.insert_document(apply_update(_upsert_base(query), update, inserting=True))
+        return {"n": 1, "nModified": 0, "upserted": inserted["_id"]}
+
+    def _replace(self, query: dict, replacement: dict, upsert: bool) -> dict:
+        if any(key.startswith("$") for key in replacement):
+            raise ValueError("replacement can not include $ operators")
+        targets = self.select(query)[:1]
+        if targets:
+            key = targets[0]["_id"]
+            changed = self.store(key, {**copy.deepcopy(replacement), "_id": key}, "replace")
+            return {"n": 1, "nModified": int(changed)}
+        if not upsert:
+            return {"n": 0, "nModified": 0}
+        document = {**_upsert_base(query), **copy.deepcopy(replacement)}
+        inserted = self.insert_document(document)
+        return {"n": 1, "nModified": 0, "upserted": inserted["_id"]}
+
+    def _delete(self, query: dict, multi: bool) -> int:
+        targets = self.select(query)
+        if not multi:
+            targets = targets[:1]
+        for document in targets:
+            self.remove(document["_id"])
+        return len(targets)
+
+    # Motor API
+
+    def find(self, filter: Optional[dict] = None, projection: Optional[dict] = None) -> MemoryCursor:
+        def produce(cursor: MemoryCursor) -> List[dict]:
+            documents = self.select(filter)
+            if cursor._sort:
+                documents = sort_documents(documents, cursor._sort)
+            documents = documents[cursor._skip:]
+            if cursor._limit:
+                documents = documents[:cursor._limit]
+            return [project(document, projection) for document in documents]
+        return MemoryCursor(produce)
+
+    async def find_one(self, filter: Optional[dict] = None, projection: Optional[dict] = None) -> Optional[dict]:
+        found = self.select(filter)
+        return project(found[0], projection) if found else None
+
+    async def count_documents(self, filter: dict, **kwargs) -> int:
+        return len(self.select(filter))
+
+    async def estimated_document_count(self) -> int:
+        return len(self.documents)
+
+    async def insert_one(self, document: dict) -> InsertOneResult:
+        return InsertOneResult(self.insert_document(document)["_id"], True)
+
+    async def insert_many(self, documents: Iterable[dict], ordered: bool = True) -> InsertManyResult:
+        return InsertManyResult([self.insert_document(document)["_id"] for document in documents], True)
+
+    async def update_one(self, filter: dict, update: Any, upsert: bool = False) -> UpdateResult:
+        return UpdateResult(self._update(filter, update, upsert, multi=False), True)
+
+    async def update_many(self, filter: dict, update: Any, upsert: bool = False) -> UpdateResult:
+        return UpdateResult(self._update(filter, update, upsert, multi=True), True)
+
+    async def replace_one(self, filter: dict, replacement: dict, upsert: bool = False) -> UpdateResult:
+        return UpdateResult(self._replace(filter, replacement, upsert), True)
+
+    async def find_one_and_update(
+        self,
+        filter: dict,
+        update: Any,
+        projection: Optional[dict] = None,
+        sort: Optional[list] = None,
+        upsert: bool = False,
+        return_document: bool = False
+    ) -> Optional[dict]:
+        found = self.select(filter)
+        if sort:
+            found = sort_documents(found, sort_spec(sort))
+        if found:
+            before = found[0]
+            self.store(before["_id"], apply_update(before, update))
+            return project(self.documents[before["_id"]] if return_document else before, projection)
+        if not upsert:
+            return None
+        inserted = self.insert_document(apply_update(_upsert_base(filter), update, inserting=True))
+        return project(inserted, projection) if return_document else None
+
+    async def delete_one(self, filter: dict) -> DeleteResult:
+        return DeleteResult({"n": self._delete(filter, multi=False)}, True)
+
+    async def delete_many(self, filter: dict) -> DeleteResult:
+        return DeleteResult({"n": self._delete(filter, multi=True)}, True)
+
+    async def bulk_write(self, requests: List[Any], ordered: bool = True) -> BulkWriteResult:
+        counts = {"nInserted": 0, "nUpserted": 0, "nMatched": 0, "nModified": 0, "nRemoved": 0, "upserted": []}
+        errors = []
+        for index, request in enumerate(requests):
+            try:
+                if isinstance(request, InsertOne):
+                    self.insert_document(request._doc)
+                    counts["nInserted"] += 1
+                    continue
+                if isinstance(request, (DeleteOne, DeleteMany)):
+                    counts["nRemoved"] += self._delete(request._filter, multi=isinstance(request, DeleteMany))
+                    continue
+                if isinstance(request, ReplaceOne):
+                    result = self._replace(request._filter, request._doc, request._upsert)
+                elif isinstance(request, (UpdateOne, UpdateMany)):
+                    result = self._update(request._filter, request._doc, request._upsert, multi=isinstance(request, UpdateMany))
+                else:
+                    raise OperationFailure(f"Unsupported bulk operation {type(request).__name__}", UNSUPPORTED)
+                if "upserted" in result:
+                    counts["nUpserted"] += 1
+                    counts["upserted"].append({"index": index, "_id": result["upserted"]})
+                else:
+                    counts["nMatched"] += result["n"]
+                    counts["nModified"] += result["nModified"]
+            except (WriteError, DuplicateKeyError) as e:
+                errors.append({"index": index, "code": e.code, "errmsg": str(e), "op": request})
+                if ordered:
+                    break
+        if errors:
+            raise BulkWriteError({**counts, "writeErrors": errors, "writeConcernErrors": []})
+        return BulkWriteResult(counts, True)
+
+    def aggregate(self, pipeline: List[dict]) -> MemoryCursor:
+        def produce(cursor: MemoryCursor) -> List[dict]:
+            stages = list(pipeline)
+            if stages and "$geoNear" in stages[0]:
+                documents = self._geo_near(stages.pop(0)["$geoNear"])
+            else:
+                documents = [copy.deepcopy(document) for document in self.select({})]
+            return run_pipeline(documents, stages)
+        return MemoryCursor(produce)
+
+    def _geo_near(self, spec: dict) -> List[dict]:
+        if self.geo_field is None:
+            raise OperationFailure("$geoNear requires a 2dsphere index", 291)
+        lng, lat = spec["near"]["coordinates"]
+        max_distance = spec.get("maxDistance")
+        min_distance = spec.get("minDistance", 0)
+        within = self.near(lat, lng, max_distance / METERS_PER_MILE + 1) if max_distance is not None else set(self._cells)
+
+        nearby = []
+        for document in self.select(spec.get("query") or {}, within):
+            point = point_of(document, self.geo_field)
+            if point is None:
+                continue
+            meters = spherical_meters(lat, lng, point[0], point[1])
+            if meters < min_distance or (max_distance is not None and meters > max_distance):
+                continue
+            nearby.append((meters, document))
+        nearby.sort(key=lambda item: item[0])
+
+        results = []
+        for meters, document in nearby:
+            result = copy.deepcopy(document)
+            set_path(result, spec["distanceField"], meters * spec.get("distanceMultiplier", 1))
+            results.append(result)
+        return results
+
+    async def create_index(self, keys: Any, name: Optional[str] = None, unique: bool = False, **options) -> str:
+        keys = sort_spec(keys)
+        name = name or "_".join(f"{field}_{direction}" for field, direction in keys)
+        for existing_name, existing in self.index_specs.items():
+            if existing["key"] == keys:
+                if existing_name != name:
+                    raise OperationFailure(
+                        f"Index already exists with a different name: {existing_name}", INDEX_OPTIONS_CONFLICT
+                    )
+                return name
+
+        field, direction = keys[0]
+        if direction == "2dsphere":
+            self.geo_field = field
+        elif direction in (1, -1) and field not in self.hashes:
+            self.hashes[field] = {}
+        self._reindex()
+        if unique:
+            fields = [field for field, _ in keys]
+            seen = set()
+            for document in self.documents.values():
+                values = self._unique_values(document, fields)
+                if values in seen:
+                    raise DuplicateKeyError(f"E11000 duplicate key error building index {name}", DUPLICATE_KEY)
+                seen.add(values)
+            self.unique.append(fields)
+        self.index_specs[name] = {"key": keys, "unique": unique}
+        return name
+
+    def list_indexes(self) -> MemoryCursor:
+        return MemoryCursor(lambda cursor: [
+            {"name": name, "key": dict(spec["key"]), "unique": spec["unique"]}
+            for name, spec in self.index_specs.items()
+        ])
+
+    async def drop(self):
+        for key in list(self.documents):
+            self.remove(key)
+
+# Change streams
+
+class MemoryChangeStream:
+    """Change events for writes made after the stream opened; there is no history to resume from"""
+
+    def __init__(self, database: "MemoryDatabase", pipeline: Optional[List[dict]], full_document: Optional[str]):
+        self.database = database
+        self.pipeline = pipeline or []
+        self.full_document = full_document
+        self.resume_token = None
+        self._queue: "asyncio.Queue[dict]" = asyncio.Queue()
+
+    async def __aenter__(self) -> "MemoryChangeStream":
+        self.database._streams.add(self)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        self.database._streams.discard(self)
+
+    def deliver(self, change: dict):
+        if self.full_document != "updateLookup" and change["operationType"] == "update":
+            change = {key: value for key, value in change.items() if key != "fullDocument"}
+        for delivered in run_pipeline([change], self.pipeline):
+            self._queue.put_nowait(delivered)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> dict:
+        change = await self._queue.get()
+        self.resume_token = change["_id"]
+        return change
+
+class MemoryDatabase:
+    """In-process database whose collections are created on first access"""
+
+    def __init__(self, name: str = "memory"):
+        self.name = name
+        self._collections: Dict[str, MemoryCollection] = {}
+        self._streams: Set[MemoryChangeStream] = set()
+        self._tokens = itertools.count(1)
+
+    def __getitem__(self, name: str) -> MemoryCollection:
+        collection = self._collections.get(name)
+        if collection is None:
+            collection = self._collections[name] = MemoryCollection(self, name)
+        return collection
+
+    def __getattr__(self, name: str) -> MemoryCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    def list_collection_names(self) -> List[str]:
+        return list(self._collections)
+
+    def clear(self):
+        """Drop every document, keeping collections and their indexes"""
+        for collection in self._collections.values():
+            collection.documents.clear()
+            collection._sequence.clear()
+            collection._reindex()
+
+    def watch(self, pipeline: Optional[List[dict]] = None, full_document: Optional[str] = None, **kwargs) -> MemoryChangeStream:
+        return MemoryChangeStream(self, pipeline, full_document)
+
+    def emit(self, collection: str, operation: str, key: Any, before: Optional[dict], after: Optional[dict]):
+        """Publish a write to open change streams"""
+        if not self._streams:
+            return
+        change = {
+            "_id": {"_data": str(next(self._tokens))},
+            "operationType": operation,
+            "ns": {"db": self.name, "coll": collection},
+            "documentKey": {"_id": key},
+        }
+        if operation == "update":
+            change["updateDescription"] = {
+                "updatedFields": {field: value for field, value in after.items() if before.get(field, MISSING) != value},
+                "removedFields": [field for field in before if field not in after],
+            }
+        if after is not None:
+            change["fullDocument"] = after
+        for stream in list(self._streams):
+            stream.deliver(copy.deepcopy(change))
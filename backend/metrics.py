@@ -0,0 +1,28 @@
+from typing import Any, Callable, Dict
+
+class Metrics:
+    """Process-wide counters and gauges exposed at /api/metrics"""
+
+    def __init__(self):
+        self.counters: Dict[str, float] = {}
+        self.gauges: Dict[str, Callable[[], Any]] = {}
+
+    def inc(self, name: str, value: float = 1):
+        """Increment a counter"""
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def register_gauge(self, name: str, read: Callable[[], Any]):
+        """Register a callable that reports a current value when metrics are read"""
+        self.gauges[name] = read
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return every counter and the current value of every gauge"""
+        gauges = {}
+        for name, read in self.gauges.items():
+            try:
+                gauges[name] = read()
+            except Exception as e:
+                gauges[name] = f"error: {e}"
+        return {"counters": dict(self.counters), "gauges": gauges}
+
+metrics = Metrics()
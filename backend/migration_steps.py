@@ -0,0 +1,38 @@
+from database import Database, events_collection, organizers_collection
+from geo import geo_point
+from migrations import migration_runner
+from organizer_stats import OrganizerStats
+from trending import city_key
+
+# Document reshaping, applied once in version order by the migration runner.
+# Each query matches only documents still needing the change, so a migration
+# that is restarted from its checkpoint never rewrites a document twice.
+
+@migration_runner.migration(1, "event_start_times", events_collection, {"starts_at": {"$exists": False}}, {"date": 1, "time": 1})
+def event_start_times(event: dict) -> dict:
+    """Set starts_at on events created before it was stored"""
+    return {"$set": {"starts_at": Database.parse_start_time(event.get("date"), event.get("time"))}}
+
+@migration_runner.migration(2, "organizer_geo_points", organizers_collection, {"geo": {"$exists": False}}, {"location": 1})
+def organizer_geo_points(organizer: dict) -> dict:
+    """Set the GeoJSON geo field on organizers created before it was stored"""
+    return {"$set": {"geo": geo_point(organizer.get("location"))}}
+
+@migration_runner.migration(3, "event_geo_points", events_collection, {"geo": {"$exists": False}}, {"location": 1})
+def event_geo_points(event: dict) -> dict:
+    """Set the GeoJSON geo field on events created before it was stored"""
+    return {"$set": {"geo": geo_point(event.get("location"))}}
+
+@migration_runner.migration(4, "event_city_keys", events_collection, {"city_key": {"$exists": False}}, {"location": 1})
+def event_city_keys(event: dict) -> dict:
+    """Set the normalised city_key used by per-city trending lists"""
+    return {"$set": {"city_key": city_key(event.get("location"))}}
+
+@migration_runner.migration(5, "organizer_review_totals", organizers_collection, {"ratingSum": {"$exists": False}}, {"id": 1})
+async def organizer_review_totals(organizer: dict) -> dict:
+    """Set ratingSum and reviewCount, which record_review derives the rating from, on organizers created before they were stored"""
+    # recentReviews lets record_review skip jobs for reviews already counted here
+    totals = await OrganizerStats.review_totals(organizer["id"])
+    if totals["reviewCount"]:
+        totals["rating"] = round(totals["ratingSum"] / totals["reviewCount"], 1)
+    return {"$set": totals}
@@ -0,0 +1,236 @@
+import asyncio
+import inspect
+import logging
+import os
+import socket
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional, Union
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+from database import migrations_collection
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Documents read and rewritten per batch
+MIGRATION_BATCH_SIZE = int(os.environ.get("MIGRATION_BATCH_SIZE", 500))
+
+# Share of wall time spent migrating; the rest is left idle for the API
+MIGRATION_DUTY_CYCLE = min(max(float(os.environ.get("MIGRATION_DUTY_CYCLE", 0.5)), 0.05), 1.0)
+
+# Seconds between attempts to run migrations held by another instance
+MIGRATION_POLL_INTERVAL = float(os.environ.get("MIGRATION_POLL_INTERVAL", 30))
+
+# A running migration whose lease is older than this is taken over by another instance
+MIGRATION_LEASE = timedelta(seconds=int(os.environ.get("MIGRATION_LEASE", 120)))
+
+OWNER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+# Builds the update for one document, or None when it needs no change; may be
+# async when the update depends on other collections
+Transform = Callable[[dict], Union[Optional[dict], Awaitable[Optional[dict]]]]
+
+class Migration:
+    """A versioned rewrite of the documents in a collection that match a query"""
+
+    def __init__(self, version: int, name: str, collection, query: dict, projection: dict, transform: Transform):
+        self.version = version
+        self.name = name
+        self.collection = collection
+        self.query = query
+        self.projection = projection
+        self.transform = transform
+
+class MigrationRunner:
+    """Applies migrations in version order in throttled, checkpointed batches while the API serves"""
+
+    def __init__(self, collection, batch_size: int = MIGRATION_BATCH_SIZE, duty_cycle: float = MIGRATION_DUTY_CYCLE):
+        self.collection = collection
+        self.batch_size = batch_size
+        self.duty_cycle = duty_cycle
+        self.migrations: Dict[str, Migration] = {}
+        # Progress of the migration running in this process
+        self.current: Optional[dict] = None
+        self._task: Optional[asyncio.Task] = None
+
+        metrics.register_gauge("migrations", self.stats)
+
+    def migration(self, version: int, name: str, collection, query: dict, projection: Optional[dict] = None):
+        """Register a document transform as a migration"""
+        def register(transform: Transform) -> Transform:
+            if any(existing.version == version for existing in self.migrations.values()):
+                raise ValueError(f"Migration version {version} is already registered")
+            self.migrations[name] = Migration(version, name, collection, query, projection or {}, transform)
+            return transform
+        return register
+
+    def ordered(self) -> List[Migration]:
+        return sorted(self.migrations.values(), key=lambda migration: migration.version)
+
+    async def _claim(self, migration: Migration) -> Optional[dict]:
+        """Take the lease on an unfinished migration, creating its state on first run"""
+        now = datetime.utcnow()
+        try:
+            return await self.collection.find_one_and_update(
+                {
+                    "_id": migration.name,
+                    "status": {"$ne": "done"},
+                    "$or": [{"locked_by": OWNER_ID}, {"locked_until": None}, {"locked_until": {"$lt": now}}],
+                },
+                {
+                    "$set": {"locked_by": OWNER_ID, "locked_until": now + MIGRATION_LEASE, "status": "running"},
+                    "$setOnInsert": {"version": migration.version, "checkpoint": None, "processed": 0, "started_at": now},
+                },
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # Finished, or leased by another instance
+            return None
+
+    def _pause(self, elapsed: float) -> float:
+        """Seconds to idle after a batch so migrating keeps to its duty cycle"""
+        return elapsed * (1 - self.duty_cycle) / self.duty_cycle
+
+    async def apply(self, migration: Migration, state: dict) -> bool:
+        """Run a claimed migration from its checkpoint; False if the lease was lost"""
+        loop = asyncio.get_running_loop()
+        checkpoint = state.get("checkpoint")
+        processed = state.get("processed", 0)
+
+        def batch_query() -> dict:
+            query = dict(migration.query)
+            if checkpoint is not None:
+                query["_id"] = {"$gt": checkpoint}
+            return query
+
+        remaining = await migration.collection.count_documents(batch_query())
+        started = loop.time()
+        done_here = 0
+        self.current = {"name": migration.name, "version": migration.version, "processed": processed, "remaining": remaining}
+        logger.info("Migration %s: %d documents to examine", migration.name, remaining)
+
+        while True:
+            batch_started = loop.time()
+            cursor = migration.collection.find(batch_query(), migration.projection).sort("_id", 1).limit(self.batch_size)
+            documents = await cursor.to_list(length=self.batch_size)
+            if not documents:
+                break
+
+            operations = []
+            for document in documents:
+                update = migration.transform(document)
+                if inspect.isawaitable(update):
+                    update = await update
+                if update:
+                    operations.append(UpdateOne({"_id": document["_id"]}, update))
+            if operations:
+                await migration.collection.bulk_write(operations, ordered=False)
+
+            checkpoint = documents[-1]["_id"]
+            processed += len(documents)
+            done_here += len(documents)
+            rate = done_here / max(loop.time() - started, 1e-6)
+            left = max(remaining - done_here, 0)
+            self.current.update(processed=processed, remaining=left, rate=round(rate, 1), eta_seconds=round(left / rate) if rate else None)
+            metrics.inc("migrations.documents", len(documents))
+
+            # Saving the checkpoint also renews the lease; no match means another instance took over
+            now = datetime.utcnow()
+            result = await self.collection.update_one(
+                {"_id": migration.name, "locked_by": OWNER_ID},
+                {"$set": {
+                    "checkpoint": checkpoint,
+                    "processed": processed,
+                    "rate": self.current["rate"],
+                    "eta_seconds": self.current["eta_seconds"],
+                    "locked_until": now + MIGRATION_LEASE,
+                    "updated_at": now,
+                }}
+            )
+            if not result.matched_count:
+                logger.warning("Migration %s lease lost at %d documents", migration.name, processed)
+                return False
+
+            await asyncio.sleep(self._pause(loop.time() - batch_started))
+
+        await self.collection.update_one(
+            {"_id": migration.name, "locked_by": OWNER_ID},
+            {"$set": {"status": "done", "finished_at": datetime.utcnow(), "eta_seconds": 0, "locked_until": None}}
+        )
+        logger.info("Migration %s done after %d documents", migration.name, processed)
+        return True
+
+    async def run_pending(self) -> bool:
+        """Apply unfinished migrations in order; False if one is held elsewhere and later ones must wait"""
+        for migration in self.ordered():
+            state = await self._claim(migration)
+            if state is None:
+                if await self.collection.find_one({"_id": migration.name, "status": "done"}, {"_id": 1}):
+                    continue
+                return False
+            try:
+                if not await self.apply(migration, state):
+                    return False
+            except Exception:
+                await self.collection.update_one(
+                    {"_id": migration.name, "locked_by": OWNER_ID},
+                    {"$set": {"status": "failed", "locked_until": None}}
+                )
+                raise
+            finally:
+                self.current = None
+        return True
+
+    async def _run(self):
+        while True:
+            try:
+                if await self.run_pending():
+                    return
+            except Exception as e:
+                logger.error("Migration failed, retrying: %s", e)
+            await asyncio.sleep(MIGRATION_POLL_INTERVAL)
+
+    def start(self) -> asyncio.Task:
+        """Apply pending migrations in the background"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        return self._task
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def wait_for(self, name: str):
+        """Return once a migration has finished, wherever it runs"""
+        while not await self.collection.find_one({"_id": name, "status": "done"}, {"_id": 1}):
+            await asyncio.sleep(MIGRATION_POLL_INTERVAL)
+
+    async def status(self) -> List[dict]:
+        """Report every registered migration with its stored progress"""
+        states = {state["_id"]: state async for state in self.collection.find({})}
+        report = []
+        for migration in self.ordered():
+            state = states.get(migration.name, {})
+            entry = {
+                "version": migration.version,
+                "name": migration.name,
+                "collection": migration.collection.name,
+                "status": state.get("status", "pending"),
+                "processed": state.get("processed", 0),
+                "rate": state.get("rate"),
+                "eta_seconds": state.get("eta_seconds"),
+                "started_at": state.get("started_at"),
+                "finished_at": state.get("finished_at"),
+                "locked_by": state.get("locked_by"),
+            }
+            if self.current and self.current["name"] == migration.name:
+                entry.update(self.current)
+            report.append(entry)
+        return report
+
+    def stats(self) -> dict:
+        return {"registered": len(self.migrations), "running": self.current}
+
+migration_runner = MigrationRunner(migrations_collection)
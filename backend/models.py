@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field, EmailStr
 from typing import List, Optional, Dict, Any
-from datetime import datetime
+from datetime import datetime, date
 from enum import Enum
 import uuid
 
@@ -50,7 +50,10 @@ class Organizer(OrganizerBase):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     rating: float = Field(default=5.0, ge=0, le=5)
     totalEvents: int = Field(default=0, ge=0)
-    recentEvents: List[str] = Field(default=[])
+    reviewCount: int = Field(default=0, ge=0)  # Reviews across all of the organizer's events
+    recentEvents: List[str] = Field(default=[])  # Newest first, capped
+    totalViews: int = Field(default=0, ge=0)  # Detail views across all of the organizer's events
+    totalImpressions: int = Field(default=0, ge=0)  # List appearances across all of the organizer's events
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
@@ -85,7 +88,11 @@ class Event(EventBase):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     attendees: int = Field(default=0, ge=0)
     rating: float = Field(default=5.0, ge=0, le=5)
+    views: int = Field(default=0, ge=0)  # Detail page views, written behind
+    impressions: int = Field(default=0, ge=0)  # List appearances, written behind
+    trending_score: float = Field(default=0, ge=0)  # Time-decayed activity, relative to trending_epoch
     reviews: List[EventReview] = Field(default=[])
+    starts_at: Optional[datetime] = None  # Derived from date and time
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
@@ -144,6 +151,9 @@ class EventFilters(BaseModel):
     max_distance: Optional[float] = Field(default=25)
     user_lat: Optional[float] = None
     user_lng: Optional[float] = None
+    date_from: Optional[date] = None
+    date_to: Optional[date] = None
+    upcoming: bool = False
     sort_by: Optional[str] = Field(default="distance")  # distance, date, rating, price
 
 class OrganizerFilters(BaseModel):
@@ -155,6 +165,14 @@ class OrganizerFilters(BaseModel):
     user_lng: Optional[float] = None
     sort_by: Optional[str] = Field(default="distance")  # distance, rating, events, name
 
+# Maximum number of ids accepted by a batch lookup
+MAX_BATCH_IDS = 500
+
+class BatchRequest(BaseModel):
+    ids: List[str] = Field(..., min_length=1, max_length=MAX_BATCH_IDS)
+    user_lat: Optional[float] = Field(default=None, ge=-90, le=90)
+    user_lng: Optional[float] = Field(default=None, ge=-180, le=180)
+
 # API Response Models
 class APIResponse(BaseModel):
     success: bool = True
@@ -0,0 +1,177 @@
+import asyncio
+import logging
+import os
+from datetime import datetime
+from typing import Optional, List, Dict, Any
+from database import events_collection, events_archive_collection, organizers_collection
+
+logger = logging.getLogger(__name__)
+
+# Number of event ids kept in an organizer's recentEvents
+RECENT_EVENTS_LIMIT = 10
+
+# Number of review ids kept in an organizer's recentReviews, which guards
+# record_review against counting a retried job twice
+RECENT_REVIEWS_LIMIT = int(os.environ.get("ORGANIZER_RECENT_REVIEWS", 100))
+
+# Organizers checked per reconciliation batch and seconds between batches
+RECONCILE_BATCH_SIZE = int(os.environ.get("ORGANIZER_STATS_BATCH_SIZE", 100))
+RECONCILE_INTERVAL = int(os.environ.get("ORGANIZER_STATS_INTERVAL", 300))
+
+# UTC hours during which the reconciler stays idle, as "start-end" (end exclusive)
+PEAK_HOURS = os.environ.get("ORGANIZER_STATS_PEAK_HOURS", "16-24")
+
+def in_peak_hours(now: Optional[datetime] = None) -> bool:
+    """Return True if the current UTC hour falls inside the configured peak window"""
+    if not PEAK_HOURS:
+        return False
+    start, end = (int(part) for part in PEAK_HOURS.split("-"))
+    hour = (now or datetime.utcnow()).hour
+    if start <= end:
+        return start <= hour < end
+    return hour >= start or hour < end
+
+class OrganizerStats:
+    @staticmethod
+    async def record_event_created(organizer_id: str, event_id: str) -> bool:
+        """Atomically count a new event and add it to the organizer's recent events, once per event"""
+        # An event already in recentEvents was counted by an earlier attempt
+        result = await organizers_collection.update_one(
+            {"id": organizer_id, "recentEvents": {"$ne": event_id}},
+            {
+                "$inc": {"totalEvents": 1},
+                "$push": {"recentEvents": {"$each": [event_id], "$position": 0, "$slice": RECENT_EVENTS_LIMIT}},
+                "$set": {"updated_at": datetime.utcnow()}
+            }
+        )
+        return result.modified_count > 0
+
+    @staticmethod
+    async def record_review(organizer_id: str, review_id: str, rating: int) -> bool:
+        """Atomically fold a new review of one of the organizer's events into its rating, once per review"""
+        # Organizers without ratingSum still wait for the organizer_review_totals
+        # migration, which counts the review from its event instead
+        result = await organizers_collection.update_one(
+            {"id": organizer_id, "ratingSum": {"$exists": True}, "recentReviews": {"$ne": review_id}},
+            {
+                "$inc": {"reviewCount": 1, "ratingSum": rating},
+                "$push": {"recentReviews": {"$each": [review_id], "$position": 0, "$slice": RECENT_REVIEWS_LIMIT}},
+                "$set": {"updated_at": datetime.utcnow()}
+            }
+        )
+        # Deriving the rating from the stored totals is safe to repeat
+        await organizers_collection.update_one(
+            {"id": organizer_id, "ratingSum": {"$exists": True}, "reviewCount": {"$gt": 0}},
+            [{"$set": {"rating": {"$round": [{"$divide": ["$ratingSum", "$reviewCount"]}, 1]}}}]
+        )
+        return result.modified_count > 0
+
+    @staticmethod
+    async def compute_stats(organizer_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Aggregate event counts and review totals for a batch of organizers from their live and archived events"""
+        pipeline = [
+            {"$match": {"organizer_id": {"$in": organizer_ids}}},
+            {"$group": {
+                "_id": "$organizer_id",
+                "totalEvents": {"$sum": 1},
+                "ratingSum": {"$sum": {"$sum": "$reviews.rating"}},
+                "reviewCount": {"$sum": {"$size": {"$ifNull": ["$reviews", []]}}}
+            }}
+        ]
+        stats = {organizer_id: {"totalEvents": 0, "ratingSum": 0, "reviewCount": 0} for organizer_id in organizer_ids}
+        # The archiver copies an event before deleting it, so one caught in
+        # between is counted twice until the next pass
+        for collection in (events_collection, events_archive_collection):
+            async for group in collection.aggregate(pipeline):
+                totals = stats[group["_id"]]
+                for field in ("totalEvents", "ratingSum", "reviewCount"):
+                    totals[field] += group[field]
+
+        for organizer_id in organizer_ids:
+            recent = []
+            for collection in (events_collection, events_archive_collection):
+                cursor = collection.find({"organizer_id": organizer_id}, {"_id": 0, "id": 1, "created_at": 1})
+                cursor = cursor.sort("created_at", -1).limit(RECENT_EVENTS_LIMIT)
+                recent += await cursor.to_list(length=RECENT_EVENTS_LIMIT)
+            recent.sort(key=lambda event: event.get("created_at") or datetime.min, reverse=True)
+            ids = []
+            for event in recent:
+                if event["id"] not in ids:
+                    ids.append(event["id"])
+            stats[organizer_id]["recentEvents"] = ids[:RECENT_EVENTS_LIMIT]
+
+        return stats
+
+    @staticmethod
+    async def review_totals(organizer_id: str) -> Dict[str, Any]:
+        """Sum the reviews of an organizer's live and archived events, with the ids of the most recent"""
+        totals = {"ratingSum": 0, "reviewCount": 0}
+        reviews = []
+        seen = set()
+        for collection in (events_collection, events_archive_collection):
+            async for event in collection.find({"organizer_id": organizer_id}, {"_id": 0, "id": 1, "reviews": 1}):
+                # Skip the live copy of an event the archiver is moving
+                if event["id"] in seen:
+                    continue
+                seen.add(event["id"])
+                for review in event.get("reviews") or []:
+                    totals["ratingSum"] += review.get("rating", 0)
+                    totals["reviewCount"] += 1
+                    if review.get("id"):
+                        reviews.append(review)
+
+        reviews.sort(key=lambda review: review.get("date") or datetime.min, reverse=True)
+        totals["recentReviews"] = [review["id"] for review in reviews[:RECENT_REVIEWS_LIMIT]]
+        return totals
+
+    @staticmethod
+    async def reconcile_batch(batch_size: int = RECONCILE_BATCH_SIZE) -> int:
+        """Repair drifted stats on the least recently reconciled organizers, returning the number repaired"""
+        projection = {"_id": 0, "id": 1, "totalEvents": 1, "ratingSum": 1, "reviewCount": 1, "recentEvents": 1}
+        cursor = organizers_collection.find({}, projection).sort("stats_reconciled_at", 1).limit(batch_size)
+        organizers = await cursor.to_list(length=batch_size)
+        if not organizers:
+            return 0
+
+        stats = await OrganizerStats.compute_stats([organizer["id"] for organizer in organizers])
+        now = datetime.utcnow()
+        repaired = 0
+
+        for organizer in organizers:
+            expected = stats[organizer["id"]]
+            update = {"stats_reconciled_at": now}
+            drifted = {
+                field: value for field, value in expected.items()
+                if organizer.get(field) != value
+            }
+            if drifted:
+                update.update(drifted)
+                if expected["reviewCount"]:
+                    update["rating"] = round(expected["ratingSum"] / expected["reviewCount"], 1)
+                repaired += 1
+
+            # Only write if no increment landed since the organizer was read
+            await organizers_collection.update_one(
+                {
+                    "id": organizer["id"],
+                    "totalEvents": organizer.get("totalEvents"),
+                    "reviewCount": organizer.get("reviewCount")
+                },
+                {"$set": update}
+            )
+
+        if repaired:
+            logger.info("Repaired stats on %d of %d organizers", repaired, len(organizers))
+        return repaired
+
+    @staticmethod
+    async def run_reconciler():
+        """Reconcile organizer stats in batches outside peak hours"""
+        while True:
+            await asyncio.sleep(RECONCILE_INTERVAL)
+            if in_peak_hours():
+                continue
+            try:
+                await OrganizerStats.reconcile_batch()
+            except Exception as e:
+                logger.error("Organizer stats reconciliation failed: %s", e)
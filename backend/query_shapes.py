@@ -0,0 +1,123 @@
+import asyncio
+import json
+import logging
+from datetime import datetime
+from typing import Optional, List, Dict, Any, Tuple
+from bson import json_util
+
+logger = logging.getLogger(__name__)
+
+# Seconds between flushes of recorded shapes to the query_shapes collection
+FLUSH_INTERVAL = 60
+
+# Longest stored example, in characters of Extended JSON; longer examples are cut
+# and marked truncated, so a large $in list cannot bloat the query_shapes documents
+EXAMPLE_MAX_LENGTH = 4096
+
+RANGE_OPERATORS = {"$gt", "$gte", "$lt", "$lte"}
+
+def _predicate_kind(value: Any) -> str:
+    """Classify a query predicate as equality, range, membership or other"""
+    if not isinstance(value, dict):
+        return "eq"
+
+    operators = set(value)
+    if operators <= RANGE_OPERATORS:
+        return "range"
+    if operators == {"$in"}:
+        return "in"
+    if "$regex" in operators:
+        return "regex"
+    return "other"
+
+def query_shape(query: dict) -> Dict[str, Any]:
+    """Reduce a query to its fields and predicate kinds, dropping the values"""
+    shape = {}
+    for field, value in sorted(query.items()):
+        if field in ("$or", "$and"):
+            shape[field] = sorted(
+                json.dumps(query_shape(clause), sort_keys=True) for clause in value
+            )
+        else:
+            shape[field] = _predicate_kind(value)
+    return shape
+
+class QueryShapeRecorder:
+    """Count the filter and sort shapes issued by list queries"""
+
+    def __init__(self):
+        # (collection, shape key) -> {"shape", "sort", "example", "example_truncated", "count"}
+        self._pending: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.enabled = True
+
+    def record(self, collection: str, query: dict, sort: Optional[List[tuple]] = None):
+        """Record one execution of a query shape, keeping an example for replay"""
+        if not self.enabled:
+            return
+        shape = query_shape(query)
+        sort_spec = [[field, direction] for field, direction in (sort or [])]
+        key = (collection, json.dumps({"shape": shape, "sort": sort_spec}, sort_keys=True))
+
+        entry = self._pending.get(key)
+        if entry is None:
+            # Serialised now, so later changes to the caller's query dict cannot leak in
+            example = json_util.dumps(query)
+            self._pending[key] = {
+                "shape": shape,
+                "sort": sort_spec,
+                "example": example[:EXAMPLE_MAX_LENGTH],
+                "example_truncated": len(example) > EXAMPLE_MAX_LENGTH,
+                "count": 1,
+            }
+        else:
+            entry["count"] += 1
+
+    async def flush(self, db) -> int:
+        """Persist recorded counts and examples, returning the number of shapes written"""
+        pending, self._pending = self._pending, {}
+        for (collection, key), entry in pending.items():
+            await db.query_shapes.update_one(
+                {"collection": collection, "key": key},
+                {
+                    "$inc": {"count": entry["count"]},
+                    "$set": {
+                        "shape": entry["shape"],
+                        "sort": entry["sort"],
+                        "example": entry["example"],
+                        "example_truncated": entry["example_truncated"],
+                        "last_seen": datetime.utcnow(),
+                    },
+                },
+                upsert=True
+            )
+        return len(pending)
+
+    def start(self, db) -> asyncio.Task:
+        """Flush recorded shapes periodically in the background"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._flush_loop(db))
+        return self._task
+
+    async def stop(self, db):
+        """Stop the flush loop and write out anything still pending"""
+        if self._task and not self._task.done():
+            self._task.cancel()
+        try:
+            await self.flush(db)
+        except Exception as e:
+            logger.error("Query shape flush failed: %s", e)
+
+    async def _flush_loop(self, db):
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL)
+            try:
+                await self.flush(db)
+            except Exception as e:
+                logger.error("Query shape flush failed: %s", e)
+
+query_shape_recorder = QueryShapeRecorder()
+
+def record_query_shape(collection: str, query: dict, sort: Optional[List[tuple]] = None):
+    """Record a list query so the index advisor can replay it"""
+    query_shape_recorder.record(collection, query, sort)
@@ -0,0 +1,136 @@
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional
+
+class Repository(ABC):
+    """Storage operations behind Database, implemented over MongoDB or in memory.
+
+    Implementations return fresh dicts that callers may modify, with _id as a
+    string, and must agree on filtering, sorting and limits so either can serve
+    the API.
+    """
+
+    # Users
+    @abstractmethod
+    async def create_user(self, user_data: dict) -> dict: ...
+
+    @abstractmethod
+    async def get_user_by_email(self, email: str) -> Optional[dict]: ...
+
+    @abstractmethod
+    async def get_user_by_id(self, user_id: str) -> Optional[dict]: ...
+
+    @abstractmethod
+    async def update_user(self, user_id: str, update_data: dict) -> bool: ...
+
+    @abstractmethod
+    async def add_user_created_event(self, user_id: str, event_id: str) -> bool: ...
+
+    @abstractmethod
+    async def get_user_saved_events(self, user_id: str, user_lat: Optional[float] = None, user_lng: Optional[float] = None) -> List[dict]: ...
+
+    # Organizers
+    @abstractmethod
+    async def create_organizer(self, organizer_data: dict) -> dict: ...
+
+    @abstractmethod
+    async def get_organizer_by_id(self, organizer_id: str) -> Optional[dict]: ...
+
+    @abstractmethod
+    async def get_organizers_by_ids(self, organizer_ids: List[str], user_lat: Optional[float] = None, user_lng: Optional[float] = None) -> List[dict]: ...
+
+    @abstractmethod
+    async def attach_organizers(self, events: List[dict]) -> List[dict]: ...
+
+    @abstractmethod
+    async def get_organizers_with_filters(
+        self,
+        search: Optional[str] = None,
+        categories: Optional[List[str]] = None,
+        min_rating: Optional[float] = None,
+        max_distance: Optional[float] = None,
+        user_lat: Optional[float] = None,
+        user_lng: Optional[float] = None,
+        sort_by: str = "distance",
+        limit: int = 50,
+        fuzzy: bool = False
+    ) -> List[dict]: ...
+
+    @abstractmethod
+    async def update_organizer(self, organizer_id: str, update_data: dict) -> bool: ...
+
+    # Events
+    @abstractmethod
+    async def create_event(self, event_data: dict) -> dict: ...
+
+    @abstractmethod
+    async def find_event(self, event_id: str) -> Optional[dict]: ...
+
+    @abstractmethod
+    async def get_event_by_id(self, event_id: str, user_lat: Optional[float] = None, user_lng: Optional[float] = None) -> Optional[dict]: ...
+
+    @abstractmethod
+    async def get_events_by_ids(
+        self,
+        event_ids: List[str],
+        user_lat: Optional[float] = None,
+        user_lng: Optional[float] = None,
+        projection: Optional[dict] = None
+    ) -> List[dict]: ...
+
+    @abstractmethod
+    async def get_events_with_filters(
+        self,
+        search: Optional[str] = None,
+        category: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        min_rating: Optional[float] = None,
+        max_distance: Optional[float] = None,
+        user_lat: Optional[float] = None,
+        user_lng: Optional[float] = None,
+        sort_by: str = "distance",
+        limit: int = 50,
+        date_from=None,
+        date_to=None,
+        upcoming: bool = False,
+        fuzzy: bool = False
+    ) -> List[dict]: ...
+
+    @abstractmethod
+    async def get_events_by_organizer(
+        self,
+        organizer_id: str,
+        when: str = "all",
+        order_by: str = "date",
+        cursor: Optional[str] = None,
+        limit: int = 20,
+        user_lat: Optional[float] = None,
+        user_lng: Optional[float] = None
+    ) -> Dict[str, Any]: ...
+
+    @abstractmethod
+    async def get_trending_events(
+        self,
+        city: Optional[str] = None,
+        user_lat: Optional[float] = None,
+        user_lng: Optional[float] = None,
+        limit: int = 20
+    ) -> List[dict]: ...
+
+    @abstractmethod
+    async def get_event_counters(self, event_ids: List[str]) -> Dict[str, dict]: ...
+
+    @abstractmethod
+    async def update_event(self, event_id: str, update_data: dict) -> bool: ...
+
+    @abstractmethod
+    async def increment_event_attendees(self, event_id: str) -> Optional[int]: ...
+
+    @abstractmethod
+    async def record_trending_signal(self, event_id: str, signal: str, count: int = 1): ...
+
+    @abstractmethod
+    async def add_event_review(self, event_id: str, review_data: dict, recalculate: bool = True) -> bool: ...
+
+    @abstractmethod
+    async def recalculate_event_rating(self, event_id: str) -> bool: ...
@@ -0,0 +1,169 @@
+import os
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+from cache import TTLCache
+from compression import COMPRESSION_MIN_SIZE, compress, encoded_headers, header_value, is_compressible, negotiate
+from metrics import metrics
+from counters import counter_buffer, impression_log
+
+# Seconds an anonymous GET response is served from memory
+RESPONSE_CACHE_TTL = float(os.environ.get("RESPONSE_CACHE_TTL", 15))
+RESPONSE_CACHE_SIZE = int(os.environ.get("RESPONSE_CACHE_SIZE", 2000))
+
+# Public read endpoints whose responses do not depend on the caller, by name
+CACHEABLE_ROUTES = {
+    "events": re.compile(r"^/api/events/?$"),
+    "organizers": re.compile(r"^/api/organizers/?$"),
+    "similar": re.compile(r"^/api/events/similar/[^/]+$"),
+    "trending": re.compile(r"^/api/events/trending$"),
+    "top_organizers": re.compile(r"^/api/organizers/nearby/top$"),
+    "suggest": re.compile(r"^/api/search/suggest$"),
+}
+
+# Cached routes showing event fields; event lists also embed their organizer
+EVENT_ROUTES = ("events", "trending", "similar")
+ORGANIZER_ROUTES = ("organizers", "top_organizers", "events", "trending")
+
+# Writes under these prefixes drop cached responses once they succeed
+INVALIDATING_PREFIXES = ("/api/events", "/api/organizers")
+
+# Cached routes each write changes inline. Follow-up writes made by jobs
+# (ratings, organizer stats, neighbour lists) reach the cache through the
+# invalidation bus. Other writes under the prefixes drop every route.
+WRITE_INVALIDATIONS = [
+    (re.compile(r"^/api/events/?$"), ("events", "trending", "suggest")),
+    (re.compile(r"^/api/events/[^/]+/reviews$"), ("events", "trending")),
+    (re.compile(r"^/api/events/[^/]+/rsvp$"), ("events", "trending", "suggest")),
+    # Saving only touches the user, plus the event's trending signal
+    (re.compile(r"^/api/events/[^/]+/save$"), ("trending",)),
+    (re.compile(r"^/api/organizers(/[^/]+)?/?$"), ORGANIZER_ROUTES + ("suggest",)),
+]
+
+# POST endpoints that only read and so never invalidate
+READ_ONLY_POSTS = [
+    re.compile(r"^/api/(events|organizers)/batch$"),
+]
+
+def route_name(path: str) -> Optional[str]:
+    """Return the name of the cacheable route serving a path"""
+    for name, pattern in CACHEABLE_ROUTES.items():
+        if pattern.match(path):
+            return name
+    return None
+
+def invalidate_routes(routes: Iterable[str], cache: Optional[TTLCache] = None) -> int:
+    """Drop cached responses of the named routes, keeping the rest"""
+    routes = set(routes)
+    dropped = (cache or response_cache).invalidate_where(lambda key, value: route_name(key[0]) in routes)
+    metrics.inc("response_cache.invalidations")
+    return dropped
+
+class CachedResponse:
+    """A response body plus its compressed forms, filled in as clients ask for them"""
+
+    def __init__(self, status: int, headers: List[Tuple[bytes, bytes]], body: bytes, impressions: list):
+        self.status = status
+        self.headers = headers
+        self.body = body
+        # Impressions counted by the handler, replayed on every hit
+        self.impressions = impressions
+        self.compressible = len(body) >= COMPRESSION_MIN_SIZE and is_compressible(headers)
+        self.encoded: Dict[str, bytes] = {}
+
+    def body_for(self, encoding: Optional[str]) -> Tuple[Optional[str], bytes]:
+        """Return the encoding actually used and the body, compressing at most once per encoding"""
+        if encoding is None or not self.compressible:
+            return None, self.body
+        if encoding not in self.encoded:
+            self.encoded[encoding] = compress(self.body, encoding)
+            metrics.inc(f"response_cache.compressed.{encoding}")
+        return encoding, self.encoded[encoding]
+
+class ResponseCacheMiddleware:
+    """ASGI middleware caching anonymous GET responses together with their compressed bodies"""
+
+    def __init__(self, app, cache: Optional[TTLCache] = None):
+        self.app = app
+        self.cache = cache or response_cache
+
+    @staticmethod
+    def cacheable(scope) -> bool:
+        if scope["method"] != "GET":
+            return False
+        if header_value(scope.get("headers", []), b"authorization"):
+            return False
+        return route_name(scope["path"]) is not None
+
+    @staticmethod
+    def invalidates(scope) -> Tuple[str, ...]:
+        """Return the cached routes a request changes, empty when it only reads"""
+        path = scope["path"]
+        if scope["method"] in ("GET", "HEAD", "OPTIONS") or not path.startswith(INVALIDATING_PREFIXES):
+            return ()
+        if any(pattern.match(path) for pattern in READ_ONLY_POSTS):
+            return ()
+        for pattern, routes in WRITE_INVALIDATIONS:
+            if pattern.match(path):
+                return routes
+        return tuple(CACHEABLE_ROUTES)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        if not self.cacheable(scope):
+            routes = self.invalidates(scope)
+            if routes:
+                await self._invalidate_after(routes, scope, receive, send)
+            else:
+                await self.app(scope, receive, send)
+            return
+
+        key = (scope["path"], scope.get("query_string", b""))
+        encoding = negotiate(header_value(scope.get("headers", []), b"accept-encoding"))
+
+        cached = self.cache.get(key)
+        if cached is not None:
+            counter_buffer.replay(cached.impressions)
+            await self._send(send, cached, encoding, b"HIT")
+            return
+
+        start = None
+        chunks = []
+        impressions = []
+        impression_log.set(impressions)
+
+        async def capture(message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            chunks.append(message.get("body", b""))
+            if message.get("more_body", False):
+                return
+
+            response = CachedResponse(start["status"], start.get("headers", []), b"".join(chunks), impressions)
+            if response.status == 200 and not header_value(response.headers, b"set-cookie"):
+                self.cache.set(key, response)
+            await self._send(send, response, encoding, b"MISS")
+
+        await self.app(scope, receive, capture)
+
+    async def _send(self, send, response: CachedResponse, encoding: Optional[str], cache_status: bytes):
+        body_encoding, body = response.body_for(encoding)
+        headers = encoded_headers(response.headers, body_encoding, len(body)) + [(b"x-cache", cache_status)]
+        await send({"type": "http.response.start", "status": response.status, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+
+    async def _invalidate_after(self, routes: Tuple[str, ...], scope, receive, send):
+        """Run a write and drop the responses of the routes it changes once it succeeds"""
+        async def watch(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                invalidate_routes(routes, self.cache)
+            await send(message)
+
+        await self.app(scope, receive, watch)
+
+response_cache = TTLCache(RESPONSE_CACHE_TTL, RESPONSE_CACHE_SIZE)
+metrics.register_gauge("response_cache", response_cache.stats)
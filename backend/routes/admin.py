@@ -0,0 +1,69 @@
+import os
+from fastapi import APIRouter, Depends, Header, HTTPException
+from pydantic import BaseModel, Field
+from typing import Optional
+from models import APIResponse
+from admission import admission_controller
+from migrations import migration_runner
+
+router = APIRouter(prefix="/admin", tags=["admin"])
+
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+
+class BudgetUpdate(BaseModel):
+    concurrency: Optional[int] = Field(None, ge=1)
+    queue: Optional[int] = Field(None, ge=0)
+    timeout: Optional[float] = Field(None, ge=0)
+
+class RouteBudget(BaseModel):
+    method: str
+    path: str = Field(..., description="Regular expression matched against the request path")
+    concurrency: int = Field(..., ge=1)
+    queue: int = Field(0, ge=0)
+    timeout: float = Field(0.25, ge=0)
+
+async def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Allow the request only with the configured admin token"""
+    if not ADMIN_TOKEN or x_admin_token != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin access required")
+
+@router.get("/admission", response_model=APIResponse, dependencies=[Depends(require_admin)])
+async def get_admission_limits():
+    """Report admission budgets and their current usage"""
+    return APIResponse(data=admission_controller.stats(), message="Admission limits")
+
+@router.put("/admission/classes/{priority}", response_model=APIResponse, dependencies=[Depends(require_admin)])
+async def update_class_budget(priority: str, update: BudgetUpdate):
+    """Change the limits of a priority class"""
+    budget = admission_controller.budgets.get(priority)
+    if budget is None:
+        raise HTTPException(status_code=404, detail=f"Unknown priority class {priority}")
+    
+    budget.configure(update.concurrency, update.queue, update.timeout)
+    return APIResponse(data=budget.stats(), message=f"Updated {priority} budget")
+
+@router.put("/admission/routes", response_model=APIResponse, dependencies=[Depends(require_admin)])
+async def set_route_budget(route: RouteBudget):
+    """Add or replace the budget of a route"""
+    try:
+        admission_controller.set_route_budget(**route.dict())
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid route budget: {str(e)}")
+    
+    return APIResponse(data=admission_controller.stats()["routes"], message="Route budget saved")
+
+@router.delete("/admission/routes", response_model=APIResponse, dependencies=[Depends(require_admin)])
+async def remove_route_budget(method: str, path: str):
+    """Remove the budget of a route"""
+    if not admission_controller.remove_route_budget(method, path):
+        raise HTTPException(status_code=404, detail="Route budget not found")
+    
+    return APIResponse(data=admission_controller.stats()["routes"], message="Route budget removed")
+
+@router.get("/migrations", response_model=APIResponse, dependencies=[Depends(require_admin)])
+async def get_migrations():
+    """Report each migration's status, throughput and estimated time to completion"""
+    try:
+        return APIResponse(data=await migration_runner.status(), message="Migrations")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error reading migrations: {str(e)}")
@@ -11,6 +11,7 @@ from auth import (
     ACCESS_TOKEN_EXPIRE_MINUTES,
     security
 )
+from feed import EventFeed
 import uuid
 
 router = APIRouter(prefix="/auth", tags=["authentication"])
@@ -149,6 +150,9 @@ async def update_current_user(
                 detail="Failed to update user"
             )
         
+        # Preferences, location or saved events may have changed
+        EventFeed.invalidate_user(current_user["id"])
+        
         # Get updated user
         updated_user = await Database.get_user_by_id(current_user["id"])
         updated_user.pop("password", None)
@@ -1,13 +1,26 @@
 from fastapi import APIRouter, HTTPException, Query, Depends
+from fastapi.responses import StreamingResponse
 from typing import Optional, List
 from database import Database
-from models import EventCreate, Event, EventResponse, APIResponse, EventFilters, EventReview
+from models import EventCreate, Event, EventResponse, APIResponse, EventFilters, EventReview, BatchRequest
 from auth import get_current_user_optional, get_current_user
+from similarity import EventSimilarity
+from jobs import job_queue
+from feed import EventFeed
+from search_index import suggest_index
+from fuzzy import event_fuzzy
+from facets import FacetedSearch, parse_facets, EVENT_FACETS
+from live import live_hub
+from counters import counter_buffer
+from map_clusters import map_index, MAP_LIMIT, MAP_MAX_LIMIT
 import uuid
-from datetime import datetime
+from datetime import datetime, date
 
 router = APIRouter(prefix="/events", tags=["events"])
 
+# Maximum number of events one live stream can follow
+MAX_LIVE_EVENTS = 100
+
 @router.get("/", response_model=APIResponse)
 async def get_events(
     search: Optional[str] = Query(None, description="Search in title, description, category, or location"),
@@ -18,12 +31,46 @@ async def get_events(
     max_distance: Optional[float] = Query(25, ge=1, le=100, description="Maximum distance in miles"),
     user_lat: Optional[float] = Query(None, ge=-90, le=90, description="User latitude for distance calculation"),
     user_lng: Optional[float] = Query(None, ge=-180, le=180, description="User longitude for distance calculation"),
-    sort_by: str = Query("distance", description="Sort by: distance, date, rating, price"),
-    limit: int = Query(50, ge=1, le=100, description="Maximum number of results")
+    date_from: Optional[date] = Query(None, description="Only events starting on or after this date"),
+    date_to: Optional[date] = Query(None, description="Only events starting on or before this date"),
+    upcoming: bool = Query(False, description="Only events that have not started yet"),
+    sort_by: str = Query("distance", description="Sort by: distance, date, rating, price, trending"),
+    limit: int = Query(50, ge=1, le=100, description="Maximum number of results"),
+    facets: Optional[str] = Query(None, description="Comma-separated facet counts to include: category, price, rating, distance"),
+    fuzzy: bool = Query(False, description="Match search words in titles and venue names despite typos")
 ):
     """Get events with optional filtering and sorting"""
     
     try:
+        try:
+            requested_facets = parse_facets(facets, EVENT_FACETS)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
+        if requested_facets:
+            result = await FacetedSearch.search_events(
+                requested_facets,
+                search=search,
+                category=category,
+                min_price=min_price,
+                max_price=max_price,
+                min_rating=min_rating,
+                max_distance=max_distance,
+                user_lat=user_lat,
+                user_lng=user_lng,
+                sort_by=sort_by,
+                limit=limit,
+                date_from=date_from,
+                date_to=date_to,
+                upcoming=upcoming,
+                fuzzy=fuzzy
+            )
+            counter_buffer.impressions(result['events'])
+            return APIResponse(
+                data=result,
+                message=f"Found {len(result['events'])} events"
+            )
+        
         events = await Database.get_events_with_filters(
             search=search,
             category=category,
@@ -34,20 +81,127 @@ async def get_events(
             user_lat=user_lat,
             user_lng=user_lng,
             sort_by=sort_by,
-            limit=limit
+            limit=limit,
+            date_from=date_from,
+            date_to=date_to,
+            upcoming=upcoming,
+            fuzzy=fuzzy
         )
+        counter_buffer.impressions(events)
         
         return APIResponse(
             data=events,
             message=f"Found {len(events)} events"
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Error fetching events: {str(e)}"
         )
 
+@router.get("/map", response_model=APIResponse)
+async def get_events_map(
+    bbox: str = Query(..., description="Visible area as min_lng,min_lat,max_lng,max_lat"),
+    zoom: float = Query(..., ge=0, le=24, description="Map zoom level"),
+    limit: int = Query(MAP_LIMIT, ge=1, le=MAP_MAX_LIMIT, description="Maximum number of clusters and events")
+):
+    """Get upcoming events in a map viewport, clustered for the zoom level"""
+    
+    try:
+        min_lng, min_lat, max_lng, max_lat = (float(part) for part in bbox.split(","))
+    except ValueError:
+        raise HTTPException(
+            status_code=400,
+            detail="bbox must be min_lng,min_lat,max_lng,max_lat"
+        )
+    if not (-90 <= min_lat <= max_lat <= 90 and -180 <= min_lng <= 180 and -180 <= max_lng <= 180):
+        raise HTTPException(
+            status_code=400,
+            detail="bbox is out of range"
+        )
+    
+    try:
+        result = map_index.query((min_lng, min_lat, max_lng, max_lat), zoom, limit)
+        
+        return APIResponse(
+            data=result,
+            message=f"Found {result['total']} events" if map_index.ready else "Map index is still loading"
+        )
+        
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error fetching map events: {str(e)}"
+        )
+
+@router.get("/trending", response_model=APIResponse)
+async def get_trending_events(
+    city: Optional[str] = Query(None, min_length=1, description="Only events in this city"),
+    user_lat: Optional[float] = Query(None, ge=-90, le=90, description="User latitude for distance calculation"),
+    user_lng: Optional[float] = Query(None, ge=-180, le=180, description="User longitude for distance calculation"),
+    limit: int = Query(20, ge=1, le=100, description="Maximum number of results")
+):
+    """Get events with the highest time-decayed RSVP, save, review and view activity"""
+    
+    try:
+        events = await Database.get_trending_events(city, user_lat, user_lng, limit)
+        counter_buffer.impressions(events)
+        
+        return APIResponse(
+            data=events,
+            message=f"Found {len(events)} trending events"
+        )
+        
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error fetching trending events: {str(e)}"
+        )
+
+async def live_updates(event_ids: List[str]):
+    """Yield current values, then coalesced attendee and rating updates as server-sent events"""
+    subscriber = live_hub.subscribe(event_ids)
+    try:
+        # Current values first so clients need no separate fetch after connecting
+        counters = await Database.get_event_counters(event_ids)
+        yield live_hub.message([live_hub.fragment(event_id, fields) for event_id, fields in counters.items()])
+        
+        # Disconnects cancel this generator, which unsubscribes
+        while True:
+            yield await subscriber.queue.get()
+    finally:
+        live_hub.unsubscribe(subscriber)
+
+def live_response(event_ids: List[str]) -> StreamingResponse:
+    return StreamingResponse(
+        live_updates(event_ids),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/live")
+async def stream_events(
+    ids: str = Query(..., description="Comma-separated event IDs, e.g. the events in view")
+):
+    """Stream live attendee and rating updates for a set of events"""
+    
+    event_ids = list(dict.fromkeys(event_id.strip() for event_id in ids.split(",") if event_id.strip()))
+    if not event_ids or len(event_ids) > MAX_LIVE_EVENTS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Provide between 1 and {MAX_LIVE_EVENTS} event IDs"
+        )
+    
+    return live_response(event_ids)
+
+@router.get("/{event_id}/live")
+async def stream_event(event_id: str):
+    """Stream live attendee and rating updates for one event"""
+    return live_response([event_id])
+
 @router.get("/{event_id}", response_model=APIResponse)
 async def get_event_by_id(
     event_id: str,
@@ -64,6 +218,7 @@ async def get_event_by_id(
                 status_code=404,
                 detail="Event not found"
             )
+        counter_buffer.view(event)
         
         return APIResponse(
             data=event,
@@ -78,6 +233,28 @@ async def get_event_by_id(
             detail=f"Error fetching event: {str(e)}"
         )
 
+@router.post("/batch", response_model=APIResponse)
+async def get_events_batch(request: BatchRequest):
+    """Get many events by ID in one request, in the requested order"""
+    
+    try:
+        events = await Database.get_events_by_ids(request.ids, request.user_lat, request.user_lng)
+        found = {event["id"] for event in events}
+        
+        return APIResponse(
+            data={
+                "events": events,
+                "missing": [event_id for event_id in dict.fromkeys(request.ids) if event_id not in found]
+            },
+            message=f"Found {len(events)} of {len(set(request.ids))} events"
+        )
+        
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error fetching events: {str(e)}"
+        )
+
 @router.post("/", response_model=APIResponse)
 async def create_event(
     event: EventCreate,
@@ -103,16 +280,16 @@ async def create_event(
         
         created_event = await Database.create_event(event_dict)
         
-        # Update user's created events
-        user_created_events = current_user.get("createdEvents", [])
-        user_created_events.append(created_event["id"])
-        await Database.update_user(current_user["id"], {"createdEvents": user_created_events})
+        # Update in-process indexes and caches
+        EventFeed.invalidate_event(created_event["id"], created_event.get("location"))
+        suggest_index.index_event(created_event)
+        event_fuzzy.index(created_event)
+        map_index.index_event(created_event)
         
-        # Update organizer's total events count
-        await Database.update_organizer(
-            event.organizer_id,
-            {"totalEvents": organizer.get("totalEvents", 0) + 1}
-        )
+        # Defer follow-up writes: creator's created events, organizer stats and similar-events lists
+        await job_queue.enqueue("user_created_event", {"user_id": current_user["id"], "event_id": created_event["id"]})
+        await job_queue.enqueue("organizer_event_created", {"organizer_id": event.organizer_id, "event_id": created_event["id"]})
+        await job_queue.enqueue("refresh_event_neighbors", {"event_id": created_event["id"]}, key=created_event["id"])
         
         return APIResponse(
             data=created_event,
@@ -144,6 +321,11 @@ async def add_event_review(
                 status_code=404,
                 detail="Event not found"
             )
+        if event.get("archived_at"):
+            raise HTTPException(
+                status_code=409,
+                detail="Event is archived"
+            )
         
         # Create review
         review = EventReview(
@@ -154,7 +336,7 @@ async def add_event_review(
         )
         
         # Add review to event
-        success = await Database.add_event_review(event_id, review.dict())
+        success = await Database.add_event_review(event_id, review.dict(), recalculate=False)
         
         if not success:
             raise HTTPException(
@@ -162,6 +344,16 @@ async def add_event_review(
                 detail="Failed to add review"
             )
         
+        await Database.record_trending_signal(event_id, "review")
+        
+        # Defer the event and organizer rating updates
+        await job_queue.enqueue("recalculate_event_rating", {"event_id": event_id})
+        await job_queue.enqueue("organizer_review", {
+            "organizer_id": event["organizer_id"],
+            "review_id": review.id,
+            "rating": rating
+        })
+        
         return APIResponse(
             data=review.dict(),
             message="Review added successfully"
@@ -190,13 +382,25 @@ async def rsvp_event(
                 status_code=404,
                 detail="Event not found"
             )
+        if event.get("archived_at"):
+            raise HTTPException(
+                status_code=409,
+                detail="Event is archived"
+            )
         
         # Update event attendees count
-        current_attendees = event.get("attendees", 0)
-        await Database.update_event(event_id, {"attendees": current_attendees + 1})
+        attendees = await Database.increment_event_attendees(event_id)
+        if attendees is None:
+            raise HTTPException(
+                status_code=404,
+                detail="Event not found"
+            )
+        suggest_index.index_event({**event, "attendees": attendees})
+        live_hub.publish(event_id, {"attendees": attendees})
+        await Database.record_trending_signal(event_id, "rsvp")
         
         return APIResponse(
-            data={"event_id": event_id, "attendees": current_attendees + 1},
+            data={"event_id": event_id, "attendees": attendees},
             message="RSVP successful"
         )
         
@@ -239,6 +443,9 @@ async def save_event(
             action = "saved"
         
         await Database.update_user(current_user["id"], {"savedEvents": saved_events})
+        EventFeed.invalidate_user(current_user["id"])
+        if action == "saved":
+            await Database.record_trending_signal(event_id, "save")
         
         return APIResponse(
             data={"event_id": event_id, "action": action, "saved_events_count": len(saved_events)},
@@ -260,32 +467,16 @@ async def get_similar_events(
     user_lng: Optional[float] = Query(None, ge=-180, le=180, description="User longitude"),
     limit: int = Query(3, ge=1, le=10, description="Number of similar events to return")
 ):
-    """Get similar events based on category and location"""
+    """Get similar events from the precomputed neighbour lists"""
     
     try:
-        # Get the original event
-        event = await Database.get_event_by_id(event_id)
-        if not event:
+        similar_events = await EventSimilarity.get_similar_events(event_id, user_lat, user_lng, limit)
+        if similar_events is None:
             raise HTTPException(
                 status_code=404,
                 detail="Event not found"
             )
-        
-        # Find similar events (same category, different event)
-        similar_events = await Database.get_events_with_filters(
-            category=event["category"],
-            max_distance=50,
-            user_lat=user_lat,
-            user_lng=user_lng,
-            sort_by="distance",
-            limit=limit + 5  # Get extra in case we need to filter out the original
-        )
-        
-        # Remove the original event from results
-        similar_events = [e for e in similar_events if e["id"] != event_id]
-        
-        # Limit results
-        similar_events = similar_events[:limit]
+        counter_buffer.impressions(similar_events)
         
         return APIResponse(
             data=similar_events,
@@ -0,0 +1,40 @@
+from fastapi import APIRouter, HTTPException, Query, Depends
+from typing import Optional
+from models import APIResponse
+from auth import get_current_user
+from feed import EventFeed
+from counters import counter_buffer
+
+router = APIRouter(prefix="/feed", tags=["feed"])
+
+@router.get("/", response_model=APIResponse)
+async def get_feed(
+    user_lat: Optional[float] = Query(None, ge=-90, le=90, description="Override the user's saved latitude"),
+    user_lng: Optional[float] = Query(None, ge=-180, le=180, description="Override the user's saved longitude"),
+    limit: int = Query(20, ge=1, le=100, description="Maximum number of results"),
+    current_user: dict = Depends(get_current_user)
+):
+    """Get upcoming nearby events ranked for the signed-in user (requires authentication)"""
+    
+    try:
+        events = await EventFeed.get_feed(current_user, user_lat, user_lng, limit)
+        
+        if events is None:
+            raise HTTPException(
+                status_code=400,
+                detail="User location is required to build the feed"
+            )
+        counter_buffer.impressions(events)
+        
+        return APIResponse(
+            data=events,
+            message=f"Found {len(events)} events for you"
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error building feed: {str(e)}"
+        )
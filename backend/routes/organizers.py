@@ -1,8 +1,13 @@
 from fastapi import APIRouter, HTTPException, Query, Depends
 from typing import Optional, List
 from database import Database
-from models import OrganizerCreate, Organizer, OrganizerResponse, APIResponse, EventCategory
+from models import OrganizerCreate, Organizer, OrganizerResponse, APIResponse, EventCategory, BatchRequest
 from auth import get_current_user_optional, get_current_user
+from search_index import suggest_index
+from fuzzy import organizer_fuzzy
+from facets import FacetedSearch, parse_facets, ORGANIZER_FACETS
+from leaderboard import OrganizerLeaderboard
+from counters import counter_buffer
 import uuid
 
 router = APIRouter(prefix="/organizers", tags=["organizers"])
@@ -16,16 +21,41 @@ async def get_organizers(
     user_lat: Optional[float] = Query(None, ge=-90, le=90, description="User latitude for distance calculation"),
     user_lng: Optional[float] = Query(None, ge=-180, le=180, description="User longitude for distance calculation"),
     sort_by: str = Query("distance", description="Sort by: distance, rating, events, name"),
-    limit: int = Query(50, ge=1, le=100, description="Maximum number of results")
+    limit: int = Query(50, ge=1, le=100, description="Maximum number of results"),
+    facets: Optional[str] = Query(None, description="Comma-separated facet counts to include: category, rating, distance"),
+    fuzzy: bool = Query(False, description="Match search words in organizer and venue names despite typos")
 ):
     """Get organizers with optional filtering and sorting"""
     
     try:
+        try:
+            requested_facets = parse_facets(facets, ORGANIZER_FACETS)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
         # Parse categories if provided
         category_list = None
         if categories:
             category_list = [cat.strip() for cat in categories.split(",") if cat.strip()]
         
+        if requested_facets:
+            result = await FacetedSearch.search_organizers(
+                requested_facets,
+                search=search,
+                categories=category_list,
+                min_rating=min_rating,
+                max_distance=max_distance,
+                user_lat=user_lat,
+                user_lng=user_lng,
+                sort_by=sort_by,
+                limit=limit,
+                fuzzy=fuzzy
+            )
+            return APIResponse(
+                data=result,
+                message=f"Found {len(result['organizers'])} organizers"
+            )
+        
         organizers = await Database.get_organizers_with_filters(
             search=search,
             categories=category_list,
@@ -34,7 +64,8 @@ async def get_organizers(
             user_lat=user_lat,
             user_lng=user_lng,
             sort_by=sort_by,
-            limit=limit
+            limit=limit,
+            fuzzy=fuzzy
         )
         
         return APIResponse(
@@ -42,6 +73,8 @@ async def get_organizers(
             message=f"Found {len(organizers)} organizers"
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -86,6 +119,28 @@ async def get_organizer_by_id(
             detail=f"Error fetching organizer: {str(e)}"
         )
 
+@router.post("/batch", response_model=APIResponse)
+async def get_organizers_batch(request: BatchRequest):
+    """Get many organizers by ID in one request, in the requested order"""
+    
+    try:
+        organizers = await Database.get_organizers_by_ids(request.ids, request.user_lat, request.user_lng)
+        found = {organizer["id"] for organizer in organizers}
+        
+        return APIResponse(
+            data={
+                "organizers": organizers,
+                "missing": [organizer_id for organizer_id in dict.fromkeys(request.ids) if organizer_id not in found]
+            },
+            message=f"Found {len(organizers)} of {len(set(request.ids))} organizers"
+        )
+        
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error fetching organizers: {str(e)}"
+        )
+
 @router.post("/", response_model=APIResponse)
 async def create_organizer(
     organizer: OrganizerCreate,
@@ -99,9 +154,14 @@ async def create_organizer(
         organizer_dict["id"] = str(uuid.uuid4())
         organizer_dict["rating"] = 5.0
         organizer_dict["totalEvents"] = 0
+        organizer_dict["reviewCount"] = 0
+        organizer_dict["ratingSum"] = 0
         organizer_dict["recentEvents"] = []
         
         created_organizer = await Database.create_organizer(organizer_dict)
+        suggest_index.index_organizer(created_organizer)
+        organizer_fuzzy.index(created_organizer)
+        await OrganizerLeaderboard.refresh_organizer(created_organizer)
         
         return APIResponse(
             data=created_organizer,
@@ -119,8 +179,12 @@ async def get_organizer_events(
     organizer_id: str,
     user_lat: Optional[float] = Query(None, ge=-90, le=90, description="User latitude for distance calculation"),
     user_lng: Optional[float] = Query(None, ge=-180, le=180, description="User longitude for distance calculation"),
+    when: str = Query("all", pattern="^(all|upcoming|past)$", description="Filter by: all, upcoming, past"),
+    order_by: str = Query("date", pattern="^(date|distance)$", description="Order by: date, distance (requires user location)"),
+    cursor: Optional[str] = Query(None, description="Cursor returned by the previous page"),
+    limit: int = Query(20, ge=1, le=100, description="Maximum number of results")
 ):
-    """Get all events by a specific organizer"""
+    """Get a page of events by a specific organizer"""
     
     try:
         # Check if organizer exists
@@ -132,23 +196,23 @@ async def get_organizer_events(
             )
         
         # Get events by organizer
-        events = await Database.get_events_by_organizer(organizer_id)
-        
-        # Add distance calculation if user location provided
-        if user_lat is not None and user_lng is not None:
-            for event in events:
-                distance = Database.calculate_distance(
-                    user_lat, user_lng,
-                    event['location']['lat'], event['location']['lng']
-                )
-                event['distance'] = distance
-            
-            # Sort by distance
-            events.sort(key=lambda x: x.get('distance', float('inf')))
+        try:
+            page = await Database.get_events_by_organizer(
+                organizer_id,
+                when=when,
+                order_by=order_by,
+                cursor=cursor,
+                limit=limit,
+                user_lat=user_lat,
+                user_lng=user_lng
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        counter_buffer.impressions(page['events'])
         
         return APIResponse(
-            data=events,
-            message=f"Found {len(events)} events by {organizer['name']}"
+            data=page,
+            message=f"Found {len(page['events'])} events by {organizer['name']}"
         )
         
     except HTTPException:
@@ -187,6 +251,14 @@ async def get_top_nearby_organizers(
     """Get top-rated organizers near user location"""
     
     try:
+        # Served from the precomputed per-cell leaderboard when it can answer exactly
+        organizers = await OrganizerLeaderboard.get_top_nearby(user_lat, user_lng, max_distance, limit)
+        if organizers is not None:
+            return APIResponse(
+                data=organizers,
+                message=f"Found {len(organizers)} top organizers nearby"
+            )
+        
         organizers = await Database.get_organizers_with_filters(
             min_rating=4.0,
             max_distance=max_distance,
@@ -235,6 +307,9 @@ async def update_organizer(
         
         # Get updated organizer
         updated_organizer = await Database.get_organizer_by_id(organizer_id)
+        suggest_index.index_organizer(updated_organizer)
+        organizer_fuzzy.index(updated_organizer)
+        await OrganizerLeaderboard.refresh_organizer(updated_organizer, previous_location=organizer.get("location"))
         
         return APIResponse(
             data=updated_organizer,
@@ -0,0 +1,32 @@
+from fastapi import APIRouter, HTTPException, Query
+from typing import Optional
+from models import APIResponse
+from search_index import suggest_index
+
+router = APIRouter(prefix="/search", tags=["search"])
+
+@router.get("/suggest", response_model=APIResponse)
+async def suggest(
+    q: str = Query(..., min_length=1, max_length=100, description="Prefix typed by the user"),
+    types: Optional[str] = Query(None, description="Comma-separated suggestion types: event, organizer, category, venue"),
+    limit: int = Query(8, ge=1, le=20, description="Maximum number of suggestions")
+):
+    """Suggest event titles, organizer names, categories and venues by prefix"""
+    
+    try:
+        kinds = None
+        if types:
+            kinds = [kind.strip() for kind in types.split(",") if kind.strip()]
+        
+        suggestions = suggest_index.suggest(q, limit=limit, kinds=kinds)
+        
+        return APIResponse(
+            data=suggestions,
+            message=f"Found {len(suggestions)} suggestions" if suggest_index.ready else "Suggestion index is still loading"
+        )
+        
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error fetching suggestions: {str(e)}"
+        )
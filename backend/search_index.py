@@ -0,0 +1,394 @@
+import asyncio
+import bisect
+import functools
+import heapq
+import logging
+import math
+import re
+import time
+from typing import Optional, Iterable, List, Dict, Tuple, Any, Callable
+from database import events_collection, organizers_collection
+from models import EventCategory
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Prefixes up to this many characters get their own bucket; longer queries
+# filter the bucket of their first PREFIX_LENGTH characters
+PREFIX_LENGTH = 6
+
+# Best entries kept per kind and prefix, so a query never ranks a whole bucket
+TOP_K = 64
+
+# Top lists kept for prefixes longer than PREFIX_LENGTH
+LONG_PREFIX_CACHE = 10000
+
+# Suggestion kinds
+EVENT = "event"
+ORGANIZER = "organizer"
+CATEGORY = "category"
+VENUE = "venue"
+KINDS = [EVENT, ORGANIZER, CATEGORY, VENUE]
+
+_TOKEN_RE = re.compile(r"[^\w]+", re.UNICODE)
+
+def normalize(text: str) -> str:
+    """Lowercase text and collapse punctuation and whitespace"""
+    return " ".join(_TOKEN_RE.sub(" ", text.lower()).split())
+
+def word_suffixes(text: str) -> List[str]:
+    """Return the label starting at each word, so prefixes match mid-label words"""
+    words = normalize(text).split()
+    return [" ".join(words[i:]) for i in range(len(words))]
+
+def event_weight(event: dict) -> float:
+    """Weight an event suggestion by rating and attendance"""
+    return event.get("rating", 0) / 5 + math.log1p(event.get("attendees", 0))
+
+def organizer_weight(organizer: dict) -> float:
+    """Weight an organizer suggestion by rating and event count"""
+    return organizer.get("rating", 0) / 5 + math.log1p(organizer.get("totalEvents", 0))
+
+def rank_suggestions(matches: Dict[Any, float], entry_of: Callable[[Any], dict], limit: int) -> List[dict]:
+    """Order scored matches into suggestions, skipping repeated labels of the same kind"""
+    ranked = sorted(matches.items(), key=lambda item: item[1], reverse=True)
+    suggestions = []
+    seen_labels = set()
+    for key, score in ranked:
+        entry = entry_of(key)
+        label_key = (entry["kind"], entry["label"].lower())
+        if label_key in seen_labels:
+            continue
+        seen_labels.add(label_key)
+        suggestions.append({
+            "type": entry["kind"],
+            "id": entry["id"],
+            "label": entry["label"],
+            "score": round(score, 3)
+        })
+        if len(suggestions) >= limit:
+            break
+
+    return suggestions
+
+def _top_order(item: Tuple[float, Tuple[str, str]]) -> tuple:
+    """Order top-list items by score, highest first, then by key"""
+    return (-item[0], item[1])
+
+class SuggestIndex:
+    """In-memory prefix table of event, organizer, category and venue labels, keeping the most popular entries per prefix"""
+
+    def __init__(self):
+        # prefix (up to PREFIX_LENGTH characters) -> {key: boost}; key is (kind, id) and
+        # boost is 1.0 when the whole label, not just a later word, starts with the prefix
+        self._prefixes: Dict[str, Dict[Tuple[str, str], float]] = {}
+        # (kind, prefix) -> the TOP_K best (score, key) pairs of that kind in the bucket,
+        # highest first; built on first use and dropped when it can no longer be patched
+        self._top: Dict[Tuple[str, str], List[Tuple[float, Tuple[str, str]]]] = {}
+        # The same for queried prefixes longer than PREFIX_LENGTH, oldest evicted first
+        self._long_top: Dict[Tuple[str, str], List[Tuple[float, Tuple[str, str]]]] = {}
+        # key -> suggestion entry {"kind", "id", "label", "weight", "terms"}
+        self._entries: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        # Venue contributions per document, so venue weights can be adjusted on change
+        self._venue_refs: Dict[Tuple[str, str], Tuple[str, float]] = {}
+        self._venue_counts: Dict[str, int] = {}
+        # Writes made while load() builds a fresh table, replayed onto it before the swap
+        self._pending: Optional[List[Tuple[Callable, tuple]]] = None
+        self._ready = False
+        self._task: Optional[asyncio.Task] = None
+        # Set in multi-worker mode, where suggestions come from the shared snapshot
+        self.snapshot_reader = None
+        # In multi-worker mode this table only holds events and organizers written since
+        # the snapshot was built, overlaid on it: key -> time this process saw the write
+        self._changed: Dict[Tuple[str, str], float] = {}
+        self._overlay_version: Optional[str] = None
+        # Set by load(), so a snapshot knows which writes it may have missed
+        self.load_started_at: Optional[float] = None
+
+    @property
+    def ready(self) -> bool:
+        if self.snapshot_reader is not None:
+            return self.snapshot_reader.current is not None
+        return self._ready
+
+    def attach(self, snapshot_reader):
+        """Serve suggestions from a shared snapshot instead of building the index in this process"""
+        self.snapshot_reader = snapshot_reader
+
+    @staticmethod
+    def _entry_prefixes(terms: List[str], max_length: Optional[int] = PREFIX_LENGTH) -> Dict[str, float]:
+        """Map each prefix of an entry's terms, up to max_length characters, to its boost"""
+        prefixes = {}
+        for term in terms:
+            for length in range(1, min(len(term), max_length or len(term)) + 1):
+                prefixes.setdefault(term[:length], 0.0)
+        for length in range(1, min(len(terms[0]), max_length or len(terms[0])) + 1):
+            prefixes[terms[0][:length]] = 1.0
+        return prefixes
+
+    def _score(self, key: Tuple[str, str], boost: float) -> float:
+        return self._entries[key]["weight"] + boost
+
+    def _candidates(self, prefix: str) -> Iterable[Tuple[Tuple[str, str], float]]:
+        """Yield (key, boost) for every entry with a word starting with the prefix"""
+        bucket = self._prefixes.get(prefix[:PREFIX_LENGTH], {})
+        if len(prefix) <= PREFIX_LENGTH:
+            yield from bucket.items()
+            return
+        for key in bucket:
+            terms = self._entries[key]["terms"]
+            if any(term.startswith(prefix) for term in terms):
+                # Whole-label prefix matches rank above mid-label word matches
+                yield key, 1.0 if terms[0].startswith(prefix) else 0.0
+
+    def _tops(self, prefix: str) -> Dict[Tuple[str, str], List[Tuple[float, Tuple[str, str]]]]:
+        return self._top if len(prefix) <= PREFIX_LENGTH else self._long_top
+
+    def top(self, kind: str, prefix: str) -> List[Tuple[float, Tuple[str, str]]]:
+        """Return the best scored entries of a kind whose words start with the prefix, highest first"""
+        tops = self._tops(prefix)
+        cached = tops.get((kind, prefix))
+        if cached is None:
+            # One pass over the candidates fills the lists of every kind
+            by_kind = {other: [] for other in KINDS}
+            for key, boost in self._candidates(prefix):
+                by_kind[key[0]].append((self._score(key, boost), key))
+            for other, scored in by_kind.items():
+                if tops is self._long_top and len(tops) >= LONG_PREFIX_CACHE:
+                    del tops[next(iter(tops))]
+                tops[(other, prefix)] = heapq.nsmallest(TOP_K, scored, key=_top_order)
+            cached = tops[(kind, prefix)]
+        return cached
+
+    def _cached_tops(self, key: Tuple[str, str]):
+        """Yield (prefix, boost, top list) for every cached top list the entry's words belong to"""
+        terms = self._entries[key]["terms"]
+        for prefix, boost in self._entry_prefixes(terms, None if self._long_top else PREFIX_LENGTH).items():
+            top = self._tops(prefix).get((key[0], prefix))
+            if top is not None:
+                yield prefix, boost, top
+
+    def _rescore(self, key: Tuple[str, str], previous: Optional[float]):
+        """Patch the cached top lists holding, or now beaten by, an entry that was added or reweighted"""
+        weight = self._entries[key]["weight"]
+        for prefix, boost, top in list(self._cached_tops(key)):
+            position = next((i for i, (_, other) in enumerate(top) if other == key), None)
+            if position is not None:
+                if len(top) == TOP_K and weight < previous:
+                    # A lower score may fall below entries outside the list
+                    del self._tops(prefix)[(key[0], prefix)]
+                    continue
+                del top[position]
+            elif len(top) == TOP_K and weight + boost <= top[-1][0]:
+                continue
+            bisect.insort(top, (weight + boost, key), key=_top_order)
+            del top[TOP_K:]
+
+    def _put(self, kind: str, doc_id: str, label: str, weight: float):
+        """Insert or replace a suggestion entry"""
+        key = (kind, doc_id)
+        existing = self._entries.get(key)
+        if existing and existing["label"] == label:
+            previous = existing["weight"]
+            existing["weight"] = weight
+            self._rescore(key, previous)
+            return
+
+        self._drop(key)
+        terms = word_suffixes(label) or [""]
+        self._entries[key] = {"kind": kind, "id": doc_id, "label": label, "weight": weight, "terms": terms}
+        for prefix, boost in self._entry_prefixes(terms).items():
+            self._prefixes.setdefault(prefix, {})[key] = boost
+        self._rescore(key, None)
+
+    def _drop(self, key: Tuple[str, str]):
+        """Remove a suggestion entry from its prefix buckets and top lists"""
+        entry = self._entries.get(key)
+        if not entry:
+            return
+
+        for prefix, _, top in list(self._cached_tops(key)):
+            if any(other == key for _, other in top):
+                if len(top) == TOP_K:
+                    # The next best entry is unknown until the list is rebuilt
+                    del self._tops(prefix)[(key[0], prefix)]
+                else:
+                    top[:] = [item for item in top if item[1] != key]
+        for prefix in self._entry_prefixes(entry["terms"]):
+            bucket = self._prefixes[prefix]
+            del bucket[key]
+            if not bucket:
+                del self._prefixes[prefix]
+        del self._entries[key]
+
+    def _add_venue(self, ref: Tuple[str, str], location: Optional[dict], weight: float):
+        """Credit a document's weight to the venue it is located at"""
+        self._remove_venue(ref)
+        name = (location or {}).get("name")
+        if not name:
+            return
+
+        venue_id = normalize(name)
+        entry = self._entries.get((VENUE, venue_id))
+        if entry:
+            self._put(VENUE, venue_id, entry["label"], entry["weight"] + weight)
+        else:
+            self._put(VENUE, venue_id, name, weight)
+        self._venue_refs[ref] = (venue_id, weight)
+        self._venue_counts[venue_id] = self._venue_counts.get(venue_id, 0) + 1
+
+    def _remove_venue(self, ref: Tuple[str, str]):
+        """Withdraw a document's weight from its venue, dropping unused venues"""
+        previous = self._venue_refs.pop(ref, None)
+        if not previous:
+            return
+
+        venue_id, weight = previous
+        self._venue_counts[venue_id] -= 1
+        if self._venue_counts[venue_id] <= 0:
+            del self._venue_counts[venue_id]
+            self._drop((VENUE, venue_id))
+        else:
+            entry = self._entries[(VENUE, venue_id)]
+            self._put(VENUE, venue_id, entry["label"], entry["weight"] - weight)
+
+    def index_event(self, event: dict):
+        """Add or update an event and its venue"""
+        if self._pending is not None:
+            self._pending.append((SuggestIndex.index_event, (event,)))
+        weight = event_weight(event)
+        self._put(EVENT, event["id"], event["title"], weight)
+        self._track((EVENT, event["id"]), event.get("location"), weight)
+
+    def index_organizer(self, organizer: dict):
+        """Add or update an organizer and its venue"""
+        if self._pending is not None:
+            self._pending.append((SuggestIndex.index_organizer, (organizer,)))
+        weight = organizer_weight(organizer)
+        self._put(ORGANIZER, organizer["id"], organizer["name"], weight)
+        self._track((ORGANIZER, organizer["id"]), organizer.get("location"), weight)
+
+    def remove(self, kind: str, doc_id: str):
+        """Remove an event or organizer"""
+        if self._pending is not None:
+            self._pending.append((SuggestIndex.remove, (kind, doc_id)))
+        self._drop((kind, doc_id))
+        if self.snapshot_reader is not None:
+            self._changed[(kind, doc_id)] = time.time()
+        else:
+            self._remove_venue((kind, doc_id))
+
+    def _track(self, ref: Tuple[str, str], location: Optional[dict], weight: float):
+        """Credit a written document's venue, or mark it as overlaid on the snapshot"""
+        if self.snapshot_reader is None:
+            self._add_venue(ref, location, weight)
+        else:
+            # Venue weights sum over every document, so they follow the next snapshot
+            self._changed[ref] = time.time()
+
+    def _overlay(self, snapshot):
+        """Drop overlaid writes that a newly attached snapshot already includes"""
+        if self._overlay_version == snapshot.version:
+            return
+        since = snapshot.header.get("load_started_at") or 0
+        for key, changed_at in list(self._changed.items()):
+            if changed_at < since:
+                del self._changed[key]
+                self._drop(key)
+        self._overlay_version = snapshot.version
+
+    def _snapshot_matches(self, snapshot, prefix: str, kinds: Optional[List[str]], exhaustive: bool = False) -> Dict[Any, float]:
+        """Score snapshot entries, replacing those written since it was built with this table's"""
+        matches = snapshot.matches(prefix, kinds, exhaustive)
+        if not self._changed:
+            return matches
+        matches = {i: score for i, score in matches.items() if snapshot.key(i) not in self._changed}
+        matches.update(self.matches(prefix, kinds, exhaustive))
+        return matches
+
+    def matches(self, prefix: str, kinds: Optional[List[str]], exhaustive: bool = False) -> Dict[Tuple[str, str], float]:
+        """Score entries with a word starting with the prefix, from the top lists unless exhaustive"""
+        wanted = [kind for kind in KINDS if not kinds or kind in kinds]
+        if not exhaustive:
+            return {key: score for kind in wanted for score, key in self.top(kind, prefix)}
+        return {key: self._score(key, boost) for key, boost in self._candidates(prefix) if key[0] in wanted}
+
+    def suggest(self, query: str, limit: int = 8, kinds: Optional[List[str]] = None) -> List[dict]:
+        """Return the highest weighted suggestions whose words start with the query"""
+        prefix = normalize(query)
+        if not prefix:
+            return []
+
+        snapshot = self.snapshot_reader.current if self.snapshot_reader is not None else None
+        if snapshot is None:
+            matches_of = self.matches
+            entry_of = self._entries.__getitem__
+        else:
+            self._overlay(snapshot)
+            matches_of = functools.partial(self._snapshot_matches, snapshot)
+
+            def entry_of(key):
+                # Snapshot entries are keyed by position, overlaid ones by (kind, id)
+                return self._entries[key] if isinstance(key, tuple) else snapshot.entry(key)
+
+        matches = matches_of(prefix, kinds)
+        suggestions = rank_suggestions(matches, entry_of, limit)
+        # Repeated labels can leave a full top list short of the limit; fall back to the whole bucket
+        if len(suggestions) < limit and len(matches) >= TOP_K:
+            suggestions = rank_suggestions(matches_of(prefix, kinds, exhaustive=True), entry_of, limit)
+        return suggestions
+
+    async def load(self):
+        """Build the index from the events and organizers collections"""
+        # Build into a fresh table, then swap it in; writes made meanwhile are replayed onto it
+        fresh = SuggestIndex()
+        self.load_started_at = time.time()
+        self._pending = []
+        try:
+            for category in EventCategory:
+                fresh._put(CATEGORY, category.value, category.value, 1.0)
+
+            projection = {"_id": 0, "id": 1, "title": 1, "location.name": 1, "rating": 1, "attendees": 1}
+            async for event in events_collection.find({}, projection):
+                fresh.index_event(event)
+
+            projection = {"_id": 0, "id": 1, "name": 1, "location.name": 1, "rating": 1, "totalEvents": 1}
+            async for organizer in organizers_collection.find({}, projection):
+                fresh.index_organizer(organizer)
+
+            for method, args in self._pending:
+                method(fresh, *args)
+        finally:
+            self._pending = None
+
+        self._prefixes = fresh._prefixes
+        self._top = fresh._top
+        self._long_top = fresh._long_top
+        self._entries = fresh._entries
+        self._venue_refs = fresh._venue_refs
+        self._venue_counts = fresh._venue_counts
+        self._ready = True
+        logger.info("Suggest index built with %d entries", len(self._entries))
+
+    def start(self) -> asyncio.Task:
+        """Build the index in the background, or follow the shared snapshot when attached"""
+        if self.snapshot_reader is not None:
+            return self.snapshot_reader.start()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._load_logged())
+        return self._task
+
+    async def _load_logged(self):
+        try:
+            await self.load()
+        except Exception as e:
+            logger.error("Suggest index build failed: %s", e)
+
+    def stats(self) -> dict:
+        """Return index size information"""
+        if self.snapshot_reader is not None:
+            return {"ready": self.ready, "snapshot": self.snapshot_reader.stats(), "overlaid": len(self._changed)}
+        return {"ready": self.ready, "entries": len(self._entries), "prefixes": len(self._prefixes)}
+
+suggest_index = SuggestIndex()
+metrics.register_gauge("suggest_index", suggest_index.stats)
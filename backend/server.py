@@ -1,8 +1,11 @@
 from fastapi import FastAPI, APIRouter, HTTPException
+from fastapi.responses import JSONResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
 import os
+import asyncio
+import multiprocessing
 import logging
 from pathlib import Path
 from contextlib import asynccontextmanager
@@ -11,21 +14,82 @@ from contextlib import asynccontextmanager
 from routes.events import router as events_router
 from routes.organizers import router as organizers_router
 from routes.auth import router as auth_router
+from routes.feed import router as feed_router
+from routes.search import router as search_router
+from routes.admin import router as admin_router
 
 # Import database initialization
-from database import init_database
+from database import init_database, close_database, index_reconciler, events_collection, organizers_collection, use_repository, db, STORAGE_BACKEND
+from memory_repository import MemoryRepository
+from search_index import suggest_index
+from snapshot import SnapshotReader, build_forever
+from leaderboard import OrganizerLeaderboard
+from organizer_stats import OrganizerStats
+from archiver import EventArchiver
+from jobs import job_queue
+from live import live_hub
+from map_clusters import map_index
+from fuzzy import event_fuzzy, organizer_fuzzy
+from counters import counter_buffer
+from trending import rebase_forever
+from metrics import metrics
+from admission import AdmissionMiddleware
+from response_cache import ResponseCacheMiddleware
+from compression import CompressionMiddleware
+import job_handlers  # noqa: F401 - registers job handlers
+import invalidation_handlers  # noqa: F401 - subscribes caches to the invalidation bus
+import migration_steps  # noqa: F401 - registers migrations
+from migrations import migration_runner
+from invalidation import invalidation_bus
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+# Set by the launcher on worker processes when serving with more than one worker
+MULTI_WORKER = os.environ.get("SNAPSHOT_ROLE") == "worker"
+
+# The memory backend keeps every collection in this process; Database list queries use its indexes directly
+if STORAGE_BACKEND == "memory":
+    use_repository(MemoryRepository(db))
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     await init_database()
-    print("✅ Database initialized successfully")
+    print("✅ Database initialized, index reconciliation running in background")
+    if MULTI_WORKER:
+        # The builder process owns the suggest index and the singleton background jobs
+        suggest_index.attach(SnapshotReader())
+    suggest_index.start()
+    job_queue.start()
+    live_hub.start()
+    # Map clusters and fuzzy indexes are built in every worker, not snapshotted;
+    # like the suggest overlay they follow writes through the invalidation bus
+    map_index.start()
+    event_fuzzy.start(events_collection)
+    organizer_fuzzy.start(organizers_collection)
+    counter_buffer.start()
+    invalidation_bus.start()
+    background_tasks = [] if MULTI_WORKER else [
+        migration_runner.start(),
+        OrganizerLeaderboard.start_rebuild_if_empty(),
+        asyncio.create_task(OrganizerStats.run_reconciler()),
+        asyncio.create_task(EventArchiver.run_archiver()),
+        asyncio.create_task(rebase_forever(events_collection)),
+    ]
     yield
     # Shutdown
     print("🔄 Server shutting down...")
+    for task in background_tasks:
+        task.cancel()
+    await invalidation_bus.stop()
+    live_hub.stop()
+    map_index.stop()
+    event_fuzzy.stop()
+    organizer_fuzzy.stop()
+    await counter_buffer.stop()
+    await job_queue.stop()
+    await close_database()
 
 # Create the main app with lifespan
 app = FastAPI(
@@ -51,17 +115,59 @@ async def root():
 async def health_check():
     return {
         "status": "healthy",
-        "message": "API is running smoothly"
+        "message": "API is running smoothly",
+        "indexes": index_reconciler.status()
+    }
+
+@api_router.get("/ready")
+async def readiness_check():
+    """Report ready once the indexes behind hot queries exist"""
+    status = index_reconciler.status()
+    if status["failed_hot"]:
+        # Queries such as $geoNear fail outright without their index, so stay out of rotation while retrying
+        return JSONResponse(
+            status_code=503,
+            content={
+                "status": "failed",
+                "message": f"Hot indexes failed to build, retrying: {', '.join(status['failed_hot'])}",
+                "indexes": status
+            }
+        )
+    if not status["ready"]:
+        return JSONResponse(
+            status_code=503,
+            content={"status": "starting", "message": "Indexes are still building", "indexes": status}
+        )
+    
+    return {
+        "status": "ready",
+        "message": "Hot indexes are available",
+        "indexes": status
     }
 
+@api_router.get("/metrics")
+async def get_metrics():
+    """Report process counters and gauges"""
+    return metrics.snapshot()
+
 # Include routers
 api_router.include_router(events_router)
 api_router.include_router(organizers_router)
 api_router.include_router(auth_router)
+api_router.include_router(feed_router)
+api_router.include_router(search_router)
+api_router.include_router(admin_router)
 
 # Include the main API router in the app
 app.include_router(api_router)
 
+# Shed load before it queues on the event loop; CORS is added after so 503s still carry CORS headers
+app.add_middleware(AdmissionMiddleware)
+
+# Cache hits skip admission and are served with a stored compressed body
+app.add_middleware(ResponseCacheMiddleware)
+app.add_middleware(CompressionMiddleware)
+
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -95,12 +201,52 @@ async def internal_server_error_handler(request, exc):
         "status_code": 500
     }
 
+async def run_builder():
+    """Publish suggest snapshots and run the background jobs that must only run once"""
+    background_tasks = [
+        migration_runner.start(),
+        OrganizerLeaderboard.start_rebuild_if_empty(),
+        asyncio.create_task(OrganizerStats.run_reconciler()),
+        asyncio.create_task(EventArchiver.run_archiver()),
+        asyncio.create_task(rebase_forever(events_collection)),
+    ]
+    try:
+        await build_forever()
+    finally:
+        for task in background_tasks:
+            task.cancel()
+
+def run_builder_process():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    asyncio.run(run_builder())
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(
-        "server:app",
-        host="0.0.0.0",
-        port=8001,
-        reload=True,
-        log_level="info"
-    )
\ No newline at end of file
+    workers = int(os.environ.get("WEB_CONCURRENCY", 1))
+    if STORAGE_BACKEND == "memory" and workers > 1:
+        # Worker processes could not see each other's in-memory collections
+        print("⚠️  STORAGE_BACKEND=memory serves from a single worker")
+        workers = 1
+    reload = os.environ.get("RELOAD", "false").lower() in ("1", "true", "yes")
+    
+    builder = None
+    if workers > 1:
+        # Workers inherit the role and attach to the snapshots the builder publishes
+        os.environ["SNAPSHOT_ROLE"] = "worker"
+        builder = multiprocessing.get_context("spawn").Process(
+            target=run_builder_process, name="snapshot-builder", daemon=True
+        )
+        builder.start()
+    
+    try:
+        uvicorn.run(
+            "server:app",
+            host="0.0.0.0",
+            port=int(os.environ.get("PORT", 8001)),
+            reload=reload and workers == 1,
+            workers=workers,
+            log_level="info"
+        )
+    finally:
+        if builder is not None:
+            builder.terminate()
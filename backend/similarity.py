@@ -0,0 +1,207 @@
+from typing import Optional, List, Dict, Any
+from datetime import datetime
+import math
+from pymongo import UpdateOne
+from database import Database, events_collection, event_neighbors_collection
+from geo import geo_point, METERS_PER_MILE
+from single_flight import SingleFlight
+
+# Number of neighbours stored per event
+NEIGHBOR_COUNT = 10
+
+# Upper bound on candidates scored for a single event
+CANDIDATE_LIMIT = 500
+
+# Candidate events outside the category must lie within this many miles
+CANDIDATE_RADIUS_MILES = 35
+
+# Score weights and decay scales
+CATEGORY_WEIGHT = 3.0
+GEO_WEIGHT = 2.0
+GEO_SCALE_MILES = 10.0
+DATE_WEIGHT = 1.5
+DATE_SCALE_DAYS = 14.0
+PRICE_WEIGHT = 1.0
+
+# Price bands by minimum ticket price: free, budget, mid-range, premium
+PRICE_BANDS = [0, 25, 75]
+
+# Fields copied into each neighbour entry so the list can be served without a join
+SNAPSHOT_FIELDS = [
+    "id", "title", "description", "date", "time", "location", "category",
+    "price", "image", "rating", "attendees", "organizer_id"
+]
+
+# Concurrent views of the same event share one neighbour lookup or computation
+neighbor_reads = SingleFlight("event_neighbors")
+
+def _price_band(event: dict) -> int:
+    """Return the price band index of an event"""
+    price_min = (event.get("price") or {}).get("min", 0) or 0
+    band = 0
+    for i, threshold in enumerate(PRICE_BANDS):
+        if price_min > threshold:
+            band = i + 1
+    return band
+
+def _parse_date(event: dict) -> Optional[datetime]:
+    """Parse the ISO date string of an event"""
+    try:
+        return datetime.fromisoformat(event.get("date", ""))
+    except (TypeError, ValueError):
+        return None
+
+class EventSimilarity:
+    @staticmethod
+    def score(event: dict, other: dict) -> float:
+        """Score how similar two events are by category, proximity, date and price"""
+        score = 0.0
+
+        if event.get("category") == other.get("category"):
+            score += CATEGORY_WEIGHT
+
+        # Geographic proximity decays exponentially with distance
+        try:
+            distance = Database.calculate_distance(
+                event["location"]["lat"], event["location"]["lng"],
+                other["location"]["lat"], other["location"]["lng"]
+            )
+            score += GEO_WEIGHT * math.exp(-distance / GEO_SCALE_MILES)
+        except (KeyError, TypeError):
+            pass
+
+        # Date closeness
+        event_date, other_date = _parse_date(event), _parse_date(other)
+        if event_date and other_date:
+            days = abs((event_date - other_date).days)
+            score += DATE_WEIGHT * math.exp(-days / DATE_SCALE_DAYS)
+
+        # Price band similarity
+        band_gap = abs(_price_band(event) - _price_band(other))
+        score += PRICE_WEIGHT * (1 - band_gap / len(PRICE_BANDS))
+
+        return round(score, 4)
+
+    @staticmethod
+    def snapshot(event: dict, score: float) -> dict:
+        """Build the stored neighbour entry for an event"""
+        entry = {field: event.get(field) for field in SNAPSHOT_FIELDS}
+        entry["score"] = score
+        return entry
+
+    @staticmethod
+    async def get_candidates(event: dict) -> List[dict]:
+        """Fetch the closest same-category events and the closest other events nearby, nearest first"""
+        projection = {field: 1 for field in SNAPSHOT_FIELDS}
+        projection["_id"] = 0
+        projection["candidate_distance"] = 1
+
+        async def nearest(query: dict, max_distance: Optional[float] = None) -> List[dict]:
+            geo_near = {
+                "near": geo_point(event["location"]),
+                "distanceField": "candidate_distance",
+                "query": {"id": {"$ne": event["id"]}, **query},
+                "spherical": True
+            }
+            if max_distance is not None:
+                geo_near["maxDistance"] = max_distance
+            pipeline = [{"$geoNear": geo_near}, {"$limit": CANDIDATE_LIMIT}, {"$project": projection}]
+            return await events_collection.aggregate(pipeline).to_list(length=CANDIDATE_LIMIT)
+
+        same_category = await nearest({"category": event["category"]})
+        nearby = await nearest({"category": {"$ne": event["category"]}}, CANDIDATE_RADIUS_MILES * METERS_PER_MILE)
+
+        candidates = sorted(same_category + nearby, key=lambda candidate: candidate["candidate_distance"])[:CANDIDATE_LIMIT]
+        for candidate in candidates:
+            del candidate["candidate_distance"]
+        return candidates
+
+    @staticmethod
+    async def compute_neighbors(event: dict) -> List[dict]:
+        """Score the candidates of an event and store its top neighbours"""
+        candidates = await EventSimilarity.get_candidates(event)
+
+        scored = [
+            EventSimilarity.snapshot(candidate, EventSimilarity.score(event, candidate))
+            for candidate in candidates
+        ]
+        scored.sort(key=lambda x: x["score"], reverse=True)
+        neighbors = scored[:NEIGHBOR_COUNT]
+
+        await event_neighbors_collection.update_one(
+            {"event_id": event["id"]},
+            {"$set": {"neighbors": neighbors, "updated_at": datetime.utcnow()}},
+            upsert=True
+        )
+        return neighbors
+
+    @staticmethod
+    async def refresh_event(event: dict) -> int:
+        """Refresh the neighbour list of an event and its entry in its candidates' lists"""
+        candidates = await EventSimilarity.get_candidates(event)
+
+        scored = []
+        operations = []
+        for candidate in candidates:
+            score = EventSimilarity.score(event, candidate)
+            scored.append(EventSimilarity.snapshot(candidate, score))
+
+            # Replace this event's entry in the candidate's list, keeping only the top K
+            operations.append(UpdateOne(
+                {"event_id": candidate["id"]},
+                {"$pull": {"neighbors": {"id": event["id"]}}}
+            ))
+            operations.append(UpdateOne(
+                {"event_id": candidate["id"]},
+                {"$push": {"neighbors": {
+                    "$each": [EventSimilarity.snapshot(event, score)],
+                    "$sort": {"score": -1},
+                    "$slice": NEIGHBOR_COUNT
+                }}}
+            ))
+
+        scored.sort(key=lambda x: x["score"], reverse=True)
+        operations.append(UpdateOne(
+            {"event_id": event["id"]},
+            {"$set": {"neighbors": scored[:NEIGHBOR_COUNT], "updated_at": datetime.utcnow()}},
+            upsert=True
+        ))
+
+        await event_neighbors_collection.bulk_write(operations, ordered=True)
+        return len(candidates)
+
+    @staticmethod
+    async def load_neighbors(event_id: str) -> Optional[List[dict]]:
+        """Read the stored neighbours of an event, computing them if missing"""
+        doc = await event_neighbors_collection.find_one({"event_id": event_id}, {"_id": 0, "neighbors": 1})
+        if doc is not None:
+            return doc.get("neighbors", [])
+
+        # Neighbours are computed lazily the first time an event is viewed
+        event = await events_collection.find_one({"id": event_id}, {"_id": 0})
+        if not event:
+            return None
+        return await EventSimilarity.compute_neighbors(event)
+
+    @staticmethod
+    async def get_similar_events(
+        event_id: str,
+        user_lat: Optional[float] = None,
+        user_lng: Optional[float] = None,
+        limit: int = 3
+    ) -> Optional[List[dict]]:
+        """Get the precomputed neighbours of an event, or None if the event does not exist"""
+        neighbors = await neighbor_reads.do(event_id, lambda: EventSimilarity.load_neighbors(event_id))
+        if neighbors is None:
+            return None
+
+        similar_events = []
+        for neighbor in neighbors[:limit]:
+            if user_lat is not None and user_lng is not None:
+                neighbor["distance"] = Database.calculate_distance(
+                    user_lat, user_lng,
+                    neighbor["location"]["lat"], neighbor["location"]["lng"]
+                )
+            similar_events.append(neighbor)
+
+        return similar_events
@@ -0,0 +1,44 @@
+import asyncio
+import copy
+from typing import Any, Awaitable, Callable, Dict, Hashable
+from metrics import metrics
+
+class SingleFlight:
+    """Share one in-flight call between concurrent callers asking for the same key"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.calls = 0
+        self.executions = 0
+
+        metrics.register_gauge(f"single_flight.{name}", self.stats)
+
+    async def do(self, key: Hashable, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        """Run fetch once per key at a time; every caller gets its own copy of the result"""
+        self.calls += 1
+        task = self._inflight.get(key)
+
+        if task is None:
+            self.executions += 1
+            # Run in its own task so a cancelled caller does not cancel the call for the others
+            task = asyncio.create_task(fetch())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+
+        result = await asyncio.shield(task)
+        # Callers mutate what they get back (ids, distance, organizer), so never share it
+        return copy.deepcopy(result)
+
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "executions": self.executions,
+            "coalesced": self.calls - self.executions,
+            "coalescing_ratio": round(1 - self.executions / self.calls, 3) if self.calls else 0.0,
+            "inflight": len(self._inflight),
+        }
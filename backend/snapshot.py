@@ -0,0 +1,296 @@
+import asyncio
+import bisect
+import json
+import logging
+import mmap
+import os
+import struct
+import time
+import uuid
+from array import array
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from search_index import KINDS, PREFIX_LENGTH, SuggestIndex
+
+logger = logging.getLogger(__name__)
+
+# Directory shared by the builder and the workers
+SNAPSHOT_DIR = Path(os.environ.get("SNAPSHOT_DIR", Path(__file__).parent / "snapshots"))
+
+# Seconds between snapshot rebuilds, and between worker checks for a new version.
+# Between rebuilds workers overlay changes from the invalidation bus, so this
+# bounds how long the overlay grows rather than how stale suggestions get.
+SNAPSHOT_REFRESH_INTERVAL = float(os.environ.get("SNAPSHOT_REFRESH_INTERVAL", 300))
+SNAPSHOT_POLL_INTERVAL = float(os.environ.get("SNAPSHOT_POLL_INTERVAL", 5))
+
+# Versions kept on disk so workers still mapping an older one are not cut off
+SNAPSHOT_KEEP = 3
+
+MAGIC = b"NMSNAP02"
+POINTER = "CURRENT"
+
+# (section name, array typecode); offsets arrays hold n + 1 entries
+SECTIONS = [
+    ("entry_kind", "B"),
+    ("entry_weight", "d"),
+    ("entry_label_offsets", "Q"),
+    ("entry_id_offsets", "Q"),
+    ("term_offsets", "Q"),
+    ("term_entry", "I"),
+    ("term_whole", "B"),
+    ("top_key_offsets", "Q"),
+    ("top_offsets", "Q"),
+    ("top_entry", "I"),
+    ("top_whole", "B"),
+]
+BLOBS = ["labels", "ids", "terms", "top_keys"]
+
+def top_key(kind: int, prefix: str) -> bytes:
+    """Key of a top list in the snapshot: the kind index byte followed by the prefix"""
+    return bytes([kind]) + prefix.encode()
+
+def _offsets(values: List[bytes]) -> Tuple[array, bytes]:
+    """Concatenate byte strings, returning their start offsets and the blob"""
+    offsets = array("Q", [0])
+    for value in values:
+        offsets.append(offsets[-1] + len(value))
+    return offsets, b"".join(values)
+
+def write_snapshot(index: SuggestIndex, path: Path) -> dict:
+    """Serialise a SuggestIndex into a flat file that can be memory-mapped"""
+    keys = list(index._entries)
+    positions = {key: i for i, key in enumerate(keys)}
+    entries = [index._entries[key] for key in keys]
+
+    label_offsets, labels = _offsets([entry["label"].encode() for entry in entries])
+    id_offsets, ids = _offsets([entry["id"].encode() for entry in entries])
+
+    # Every term in code point order, for prefixes longer than the top lists cover
+    terms = sorted((term, key) for key in keys for term in index._entries[key]["terms"] if term)
+    term_offsets, term_blob = _offsets([term.encode() for term, _ in terms])
+
+    # The top list of every kind and indexed prefix, in key order
+    tops = []
+    for prefix, bucket in index._prefixes.items():
+        for kind in {key[0] for key in bucket}:
+            tops.append((top_key(KINDS.index(kind), prefix), index.top(kind, prefix)))
+    tops.sort(key=lambda item: item[0])
+    top_key_offsets, top_keys = _offsets([key for key, _ in tops])
+    top_offsets = array("Q", [0])
+    top_entry = array("I")
+    top_whole = array("B")
+    for _, top in tops:
+        for score, key in top:
+            top_entry.append(positions[key])
+            top_whole.append(int(score > index._entries[key]["weight"]))
+        top_offsets.append(len(top_entry))
+
+    sections = {
+        "entry_kind": array("B", [KINDS.index(entry["kind"]) for entry in entries]),
+        "entry_weight": array("d", [entry["weight"] for entry in entries]),
+        "entry_label_offsets": label_offsets,
+        "entry_id_offsets": id_offsets,
+        "term_offsets": term_offsets,
+        "term_entry": array("I", [positions[key] for _, key in terms]),
+        "term_whole": array("B", [int(term == index._entries[key]["terms"][0]) for term, key in terms]),
+        "top_key_offsets": top_key_offsets,
+        "top_offsets": top_offsets,
+        "top_entry": top_entry,
+        "top_whole": top_whole,
+    }
+    blobs = {"labels": labels, "ids": ids, "terms": term_blob, "top_keys": top_keys}
+
+    # Lay sections out 8-byte aligned after a fixed-size prefix and a JSON header
+    layout = {}
+    chunks = []
+    offset = 0
+    for name, _ in SECTIONS:
+        data = sections[name].tobytes()
+        layout[name] = [offset, len(sections[name])]
+        chunks.append(data + b"\0" * (-len(data) % 8))
+        offset += len(chunks[-1])
+    for name in BLOBS:
+        layout[name] = [offset, len(blobs[name])]
+        chunks.append(blobs[name])
+        offset += len(blobs[name])
+
+    header = {
+        "entries": len(entries),
+        "terms": len(terms),
+        "tops": len(tops),
+        "built_at": time.time(),
+        # Workers keep their own copies of documents written after this
+        "load_started_at": index.load_started_at,
+        "layout": layout,
+    }
+    header_bytes = json.dumps(header).encode()
+    header_bytes += b" " * (-(len(MAGIC) + 8 + len(header_bytes)) % 8)
+
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<Q", len(header_bytes)))
+        f.write(header_bytes)
+        for chunk in chunks:
+            f.write(chunk)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return header
+
+def publish(index: SuggestIndex, directory: Path = SNAPSHOT_DIR) -> Path:
+    """Write a new snapshot version and atomically point CURRENT at it"""
+    directory.mkdir(parents=True, exist_ok=True)
+    version = f"suggest-{int(time.time() * 1000)}-{uuid.uuid4().hex[:8]}.snap"
+    path = directory / version
+    write_snapshot(index, path)
+
+    pointer_tmp = directory / f"{POINTER}.{os.getpid()}.tmp"
+    pointer_tmp.write_text(version)
+    os.replace(pointer_tmp, directory / POINTER)
+
+    # Unlinking a file does not affect processes that still have it mapped
+    versions = sorted(directory.glob("suggest-*.snap"), key=lambda p: p.stat().st_mtime)
+    for old in versions[:-SNAPSHOT_KEEP]:
+        old.unlink(missing_ok=True)
+    return path
+
+class SuggestSnapshot:
+    """Read-only suggest table mapped from a snapshot file and shared between processes"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.version = path.name
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self._map[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a snapshot file")
+        (header_len,) = struct.unpack_from("<Q", self._map, len(MAGIC))
+        base = len(MAGIC) + 8
+        self.header = json.loads(self._map[base:base + header_len])
+        base += header_len
+
+        view = memoryview(self._map)
+        layout = self.header["layout"]
+        # Casting slices of the map keeps every section zero-copy
+        for name, typecode in SECTIONS:
+            offset, count = layout[name]
+            size = array(typecode).itemsize
+            setattr(self, name, view[base + offset:base + offset + count * size].cast(typecode))
+        for name in BLOBS:
+            offset, length = layout[name]
+            setattr(self, name, view[base + offset:base + offset + length])
+
+    def __len__(self) -> int:
+        return self.header["entries"]
+
+    def _term(self, i: int) -> bytes:
+        return bytes(self.terms[self.term_offsets[i]:self.term_offsets[i + 1]])
+
+    def entry(self, i: int) -> dict:
+        """Decode one suggestion entry"""
+        return {
+            "kind": KINDS[self.entry_kind[i]],
+            "id": bytes(self.ids[self.entry_id_offsets[i]:self.entry_id_offsets[i + 1]]).decode(),
+            "label": bytes(self.labels[self.entry_label_offsets[i]:self.entry_label_offsets[i + 1]]).decode(),
+            "weight": self.entry_weight[i],
+        }
+
+    def key(self, i: int) -> Tuple[str, str]:
+        """Return the (kind, id) of one entry without decoding its label"""
+        return KINDS[self.entry_kind[i]], bytes(self.ids[self.entry_id_offsets[i]:self.entry_id_offsets[i + 1]]).decode()
+
+    def _top_key(self, i: int) -> bytes:
+        return bytes(self.top_keys[self.top_key_offsets[i]:self.top_key_offsets[i + 1]])
+
+    def matches(self, prefix: str, kinds: Optional[List[str]], exhaustive: bool = False) -> Dict[int, float]:
+        """Score entries with a word starting with the prefix, like SuggestIndex.matches"""
+        wanted = [KINDS.index(kind) for kind in KINDS if not kinds or kind in kinds]
+        matches = {}
+        if len(prefix) <= PREFIX_LENGTH and not exhaustive:
+            for kind in wanted:
+                needle = top_key(kind, prefix)
+                i = bisect.bisect_left(range(self.header["tops"]), needle, key=self._top_key)
+                if i == self.header["tops"] or self._top_key(i) != needle:
+                    continue
+                for j in range(self.top_offsets[i], self.top_offsets[i + 1]):
+                    entry = self.top_entry[j]
+                    matches[entry] = self.entry_weight[entry] + (1.0 if self.top_whole[j] else 0.0)
+            return matches
+
+        needle = prefix.encode()
+        # UTF-8 byte order matches the code point order the builder sorted by
+        start = bisect.bisect_left(range(self.header["terms"]), needle, key=self._term)
+        for i in range(start, self.header["terms"]):
+            if not self._term(i).startswith(needle):
+                break
+            entry = self.term_entry[i]
+            if self.entry_kind[entry] not in wanted:
+                continue
+            score = self.entry_weight[entry] + (1.0 if self.term_whole[i] else 0.0)
+            matches[entry] = max(matches.get(entry, 0), score)
+        return matches
+
+class SnapshotReader:
+    """Follows the CURRENT pointer and swaps in new snapshot versions"""
+
+    def __init__(self, directory: Path = SNAPSHOT_DIR):
+        self.directory = directory
+        self.current: Optional[SuggestSnapshot] = None
+        self.swaps = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def refresh(self) -> bool:
+        """Attach to the published version if it changed; return True on swap"""
+        try:
+            version = (self.directory / POINTER).read_text().strip()
+        except FileNotFoundError:
+            return False
+        if self.current is not None and self.current.version == version:
+            return False
+
+        snapshot = SuggestSnapshot(self.directory / version)
+        # A single reference swap; requests holding the old snapshot finish against it
+        self.current = snapshot
+        self.swaps += 1
+        logger.info("Attached suggest snapshot %s with %d entries", version, len(snapshot))
+        return True
+
+    async def _follow(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error("Snapshot refresh failed: %s", e)
+            await asyncio.sleep(SNAPSHOT_POLL_INTERVAL)
+
+    def start(self) -> asyncio.Task:
+        """Follow the pointer in the background"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._follow())
+        return self._task
+
+    def stats(self) -> dict:
+        return {
+            "version": self.current.version if self.current else None,
+            "built_at": self.current.header["built_at"] if self.current else None,
+            "swaps": self.swaps,
+        }
+
+async def build_forever(directory: Path = SNAPSHOT_DIR, interval: float = SNAPSHOT_REFRESH_INTERVAL):
+    """Rebuild the suggest index from MongoDB and publish it on an interval"""
+    while True:
+        try:
+            index = SuggestIndex()
+            await index.load()
+            path = publish(index, directory)
+            logger.info("Published suggest snapshot %s", path.name)
+        except Exception as e:
+            logger.error("Snapshot build failed: %s", e)
+        await asyncio.sleep(interval)
+
+if __name__ == "__main__":
+    # The builder also owns the jobs that must run on one instance only, so start it through server.py
+    from server import run_builder_process
+    run_builder_process()
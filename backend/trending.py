@@ -0,0 +1,92 @@
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Hours for a signal's contribution to the trending score to halve
+TRENDING_HALF_LIFE_HOURS = float(os.environ.get("TRENDING_HALF_LIFE_HOURS", 24))
+
+# Scores are stored relative to an epoch that moves forward this often, so they
+# never overflow; capped well below the ~1000 half-lives a double can hold
+TRENDING_EPOCH_DAYS = min(
+    float(os.environ.get("TRENDING_EPOCH_DAYS", 30)),
+    TRENDING_HALF_LIFE_HOURS * 500 / 24
+)
+
+# Seconds between checks for documents still scored against an older epoch
+TRENDING_REBASE_INTERVAL = float(os.environ.get("TRENDING_REBASE_INTERVAL", 3600))
+
+# Contribution of one signal at the moment it happens
+SIGNAL_WEIGHTS = {
+    "rsvp": 3.0,
+    "save": 2.0,
+    "review": 4.0,
+    "view": 0.25,
+}
+
+# Fixed origin of the epoch schedule, shared by every process
+EPOCH_ORIGIN = datetime(2024, 1, 1)
+
+HALF_LIFE_MS = TRENDING_HALF_LIFE_HOURS * 3600 * 1000
+
+def current_epoch(now: Optional[datetime] = None) -> datetime:
+    """Return the epoch scores are currently stored against; derived from the clock, so no coordination is needed"""
+    now = now or datetime.utcnow()
+    period = timedelta(days=TRENDING_EPOCH_DAYS)
+    return EPOCH_ORIGIN + period * ((now - EPOCH_ORIGIN) // period)
+
+def growth(now: datetime, epoch: datetime) -> float:
+    """Weight multiplier for a signal at now: 2 ** (half-lives since the epoch)"""
+    return 2 ** ((now - epoch).total_seconds() * 1000 / HALF_LIFE_MS)
+
+def score_update(weight: float, now: Optional[datetime] = None) -> List[dict]:
+    """Build an update pipeline adding a signal to an event's trending score.
+
+    Stored scores only ever grow, and comparing them at one epoch orders events by
+    time-decayed score, so a signal is a single write and nothing is rescanned.
+    A score still stored against an older epoch is rescaled in the same update.
+    """
+    now = now or datetime.utcnow()
+    epoch = current_epoch(now)
+    rescale = {"$pow": [2, {"$divide": [{"$subtract": [{"$ifNull": ["$trending_epoch", epoch]}, epoch]}, HALF_LIFE_MS]}]}
+    return [{"$set": {
+        "trending_score": {"$add": [
+            {"$multiply": [{"$ifNull": ["$trending_score", 0]}, rescale]},
+            weight * growth(now, epoch)
+        ]},
+        "trending_epoch": epoch,
+    }}]
+
+def decayed_score(event: dict, now: Optional[datetime] = None) -> float:
+    """Return an event's trending score as of now, for display"""
+    if not event.get("trending_score") or not event.get("trending_epoch"):
+        return 0.0
+    now = now or datetime.utcnow()
+    return event["trending_score"] / growth(now, event["trending_epoch"])
+
+def city_key(location: Optional[dict]) -> Optional[str]:
+    """Normalise a location's city for per-city trending lists"""
+    city = (location or {}).get("city")
+    if not city or not city.strip():
+        return None
+    return " ".join(city.split()).lower()
+
+async def rebase(collection) -> int:
+    """Move scores left on an older epoch to the current one, returning how many moved"""
+    epoch = current_epoch()
+    result = await collection.update_many({"trending_epoch": {"$lt": epoch}}, score_update(0.0))
+    return result.modified_count
+
+async def rebase_forever(collection):
+    """Rebase once per interval; after an epoch change, events without new signals would otherwise rank too high"""
+    while True:
+        try:
+            moved = await rebase(collection)
+            if moved:
+                logger.info("Rebased trending scores on %d events", moved)
+        except Exception as e:
+            logger.error("Trending rebase failed: %s", e)
+        await asyncio.sleep(TRENDING_REBASE_INTERVAL)
@@ -63,6 +63,37 @@ export const apiService = {
     return response.data;
   },
 
+  // bounds: { minLng, minLat, maxLng, maxLat }
+  getEventsMap: async (bounds, zoom, limit = null) => {
+    const params = new URLSearchParams();
+    params.append('bbox', [bounds.minLng, bounds.minLat, bounds.maxLng, bounds.maxLat].join(','));
+    params.append('zoom', zoom.toString());
+    if (limit) params.append('limit', limit.toString());
+    
+    const response = await api.get(`/events/map?${params}`);
+    return response.data;
+  },
+
+  getTrendingEvents: async (city = null, userLat = null, userLng = null, limit = null) => {
+    const params = new URLSearchParams();
+    if (city) params.append('city', city);
+    if (userLat !== null) params.append('user_lat', userLat.toString());
+    if (userLng !== null) params.append('user_lng', userLng.toString());
+    if (limit) params.append('limit', limit.toString());
+    
+    const response = await api.get(`/events/trending?${params}`);
+    return response.data;
+  },
+
+  getEventsByIds: async (eventIds, userLat = null, userLng = null) => {
+    const response = await api.post('/events/batch', {
+      ids: eventIds,
+      user_lat: userLat,
+      user_lng: userLng,
+    });
+    return response.data;
+  },
+
   createEvent: async (eventData) => {
     const response = await api.post('/events', eventData);
     return response.data;
@@ -87,6 +118,18 @@ export const apiService = {
     return response.data;
   },
 
+  // Live attendee and rating updates; returns a function that closes the stream
+  subscribeToEventUpdates: (eventIds, onUpdate) => {
+    const params = new URLSearchParams();
+    params.append('ids', eventIds.join(','));
+    
+    const source = new EventSource(`${API_BASE}/events/live?${params}`);
+    source.addEventListener('update', (message) => {
+      JSON.parse(message.data).forEach(onUpdate);
+    });
+    return () => source.close();
+  },
+
   getSimilarEvents: async (eventId, userLat = null, userLng = null, limit = 3) => {
     const params = new URLSearchParams();
     if (userLat !== null) params.append('user_lat', userLat.toString());
@@ -124,15 +167,28 @@ export const apiService = {
     return response.data;
   },
 
+  getOrganizersByIds: async (organizerIds, userLat = null, userLng = null) => {
+    const response = await api.post('/organizers/batch', {
+      ids: organizerIds,
+      user_lat: userLat,
+      user_lng: userLng,
+    });
+    return response.data;
+  },
+
   createOrganizer: async (organizerData) => {
     const response = await api.post('/organizers', organizerData);
     return response.data;
   },
 
-  getOrganizerEvents: async (organizerId, userLat = null, userLng = null) => {
+  getOrganizerEvents: async (organizerId, userLat = null, userLng = null, options = {}) => {
     const params = new URLSearchParams();
     if (userLat !== null) params.append('user_lat', userLat.toString());
     if (userLng !== null) params.append('user_lng', userLng.toString());
+    if (options.when) params.append('when', options.when);
+    if (options.orderBy) params.append('order_by', options.orderBy);
+    if (options.cursor) params.append('cursor', options.cursor);
+    if (options.limit) params.append('limit', options.limit.toString());
     
     const response = await api.get(`/organizers/${organizerId}/events?${params}`);
     return response.data;
@@ -149,6 +205,17 @@ export const apiService = {
     return response.data;
   },
 
+  // Search API
+  getSuggestions: async (query, types = null, limit = 8) => {
+    const params = new URLSearchParams();
+    params.append('q', query);
+    if (types) params.append('types', types.join(','));
+    params.append('limit', limit.toString());
+    
+    const response = await api.get(`/search/suggest?${params}`);
+    return response.data;
+  },
+
   // Authentication API
   register: async (userData) => {
     const response = await api.post('/auth/register', userData);
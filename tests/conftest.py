@@ -0,0 +1,26 @@
+import os
+import sys
+
+# Tests run against the in-process store; backend modules import each other top-level
+os.environ.setdefault("STORAGE_BACKEND", "memory")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+import asyncio
+
+import pytest
+
+from database import db, index_reconciler
+
+
+@pytest.fixture(scope="session", autouse=True)
+def indexes():
+    """Create the spec'd indexes, which back the memory store's geo queries"""
+    asyncio.run(index_reconciler.run())
+
+
+@pytest.fixture(autouse=True)
+def empty_database():
+    """Start every test from empty collections"""
+    db.clear()
+    yield
+    db.clear()
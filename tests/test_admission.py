@@ -0,0 +1,180 @@
+import asyncio
+import json
+
+from fastapi.testclient import TestClient
+
+import server
+from admission import READ, SEARCH, WRITE, AdmissionMiddleware, Budget, admission_controller, classify
+from routes import admin
+
+
+def test_budget_admits_up_to_concurrency_then_queues():
+    async def scenario():
+        budget = Budget("test", concurrency=2, queue=1, timeout=1.0)
+        assert await budget.acquire()
+        assert await budget.acquire()
+        assert budget.active == 2
+
+        waiter = asyncio.create_task(budget.acquire())
+        await asyncio.sleep(0)
+        assert budget.waiting == 1
+        assert not waiter.done()
+
+        # The queue holds one waiter, so the next request is shed immediately
+        assert not await budget.acquire()
+
+        await budget.release()
+        assert await waiter
+        assert budget.active == 2
+        assert budget.waiting == 0
+
+    asyncio.run(scenario())
+
+
+def test_budget_sheds_queued_request_after_timeout():
+    async def scenario():
+        budget = Budget("test", concurrency=1, queue=5, timeout=0.01)
+        assert await budget.acquire()
+        assert not await budget.acquire()
+        assert budget.active == 1
+        assert budget.waiting == 0
+
+    asyncio.run(scenario())
+
+
+def test_raised_concurrency_admits_waiter_on_next_release():
+    async def scenario():
+        budget = Budget("test", concurrency=1, queue=2, timeout=1.0)
+        assert await budget.acquire()
+        first = asyncio.create_task(budget.acquire())
+        second = asyncio.create_task(budget.acquire())
+        await asyncio.sleep(0)
+
+        budget.configure(concurrency=3)
+        await budget.release()
+        assert await first
+        await budget.release()
+        assert await second
+
+    asyncio.run(scenario())
+
+
+def test_classify():
+    assert classify("GET", "/api/events/abc") == READ
+    assert classify("GET", "/api/events/") == SEARCH
+    assert classify("GET", "/api/search/facets") == SEARCH
+    assert classify("POST", "/api/events/") == WRITE
+    assert classify("POST", "/api/events/batch") == READ
+
+
+def test_middleware_sheds_with_503_and_retry_after(monkeypatch):
+    monkeypatch.setitem(admission_controller.budgets, READ, Budget(READ, concurrency=1, queue=0, timeout=0.1))
+    monkeypatch.setattr(admission_controller, "route_budgets", [])
+
+    async def scenario():
+        release = asyncio.Event()
+
+        async def app(scope, receive, send):
+            await release.wait()
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+            await send({"type": "http.response.body", "body": b"ok"})
+
+        middleware = AdmissionMiddleware(app)
+
+        async def request(path):
+            messages = []
+
+            async def send(message):
+                messages.append(message)
+
+            await middleware({"type": "http", "method": "GET", "path": path}, None, send)
+            return messages
+
+        held = asyncio.create_task(request("/api/events/abc"))
+        await asyncio.sleep(0)
+
+        shed = await request("/api/events/def")
+        assert shed[0]["status"] == 503
+        headers = dict(shed[0]["headers"])
+        assert headers[b"retry-after"] == b"1"
+        assert json.loads(shed[1]["body"])["status_code"] == 503
+
+        release.set()
+        assert (await held)[0]["status"] == 200
+        assert admission_controller.budgets[READ].active == 0
+
+    asyncio.run(scenario())
+
+
+def test_route_budget_applies_before_class_budget(monkeypatch):
+    monkeypatch.setattr(admission_controller, "route_budgets", [])
+    admission_controller.set_route_budget("GET", r"^/api/events/slow$", concurrency=1)
+
+    async def scenario():
+        release = asyncio.Event()
+
+        async def app(scope, receive, send):
+            await release.wait()
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+            await send({"type": "http.response.body", "body": b"ok"})
+
+        middleware = AdmissionMiddleware(app)
+        statuses = []
+
+        async def request(path):
+            async def send(message):
+                if message["type"] == "http.response.start":
+                    statuses.append((path, message["status"]))
+
+            await middleware({"type": "http", "method": "GET", "path": path}, None, send)
+
+        held = asyncio.create_task(request("/api/events/slow"))
+        await asyncio.sleep(0)
+        await request("/api/events/slow")
+        assert statuses == [("/api/events/slow", 503)]
+
+        release.set()
+        await held
+        await request("/api/events/other")
+        assert ("/api/events/other", 200) in statuses
+
+    asyncio.run(scenario())
+
+
+def test_admin_endpoints_update_budgets_at_runtime(monkeypatch):
+    monkeypatch.setattr(admin, "ADMIN_TOKEN", "secret")
+    monkeypatch.setitem(admission_controller.budgets, SEARCH, Budget(SEARCH, concurrency=20, queue=20, timeout=0.25))
+    monkeypatch.setattr(admission_controller, "route_budgets", [])
+    headers = {"X-Admin-Token": "secret"}
+
+    with TestClient(server.app) as client:
+        assert client.put("/api/admin/admission/classes/search", json={"concurrency": 5}).status_code == 403
+
+        response = client.put("/api/admin/admission/classes/search", headers=headers, json={"concurrency": 5, "timeout": 0.5})
+        assert response.status_code == 200
+        assert response.json()["data"]["concurrency"] == 5
+        assert admission_controller.budgets[SEARCH].concurrency == 5
+        assert admission_controller.budgets[SEARCH].timeout == 0.5
+        assert admission_controller.budgets[SEARCH].queue == 20
+
+        response = client.put("/api/admin/admission/classes/search", headers=headers, json={"concurrency": 0})
+        assert response.status_code == 422
+
+        route = {"method": "get", "path": r"^/api/feed/?$", "concurrency": 2}
+        response = client.put("/api/admin/admission/routes", headers=headers, json=route)
+        assert response.status_code == 200
+        assert response.json()["data"][r"GET ^/api/feed/?$"]["concurrency"] == 2
+
+        response = client.put("/api/admin/admission/routes", headers=headers, json={**route, "concurrency": 4})
+        assert response.status_code == 200
+        assert len(admission_controller.route_budgets) == 1
+        assert admission_controller.route_budget("GET", "/api/feed").concurrency == 4
+
+        response = client.put("/api/admin/admission/routes", headers=headers, json={**route, "path": "("})
+        assert response.status_code == 400
+
+        params = {"method": "GET", "path": r"^/api/feed/?$"}
+        response = client.delete("/api/admin/admission/routes", headers=headers, params=params)
+        assert response.status_code == 200
+        assert response.json()["data"] == {}
+        assert admission_controller.route_budget("GET", "/api/feed") is None
@@ -0,0 +1,39 @@
+import time
+
+from fastapi.testclient import TestClient
+
+import server
+
+LOCATION = {"name": "Blue Note Hall", "address": "1 Main", "lat": 40.73, "lng": -73.99, "city": "New York"}
+
+
+def test_app_runs_without_mongod():
+    with TestClient(server.app) as client:
+        response = client.post("/api/auth/register", json={"name": "Ada", "email": "ada@example.com", "password": "secret12"})
+        assert response.status_code == 200
+        headers = {"Authorization": f"Bearer {response.json()['data']['access_token']}"}
+
+        response = client.post("/api/organizers/", headers=headers, json={
+            "name": "Jazz Collective", "description": "Live jazz", "location": LOCATION,
+            "categories": ["Music"], "contact": {"email": "jazz@example.com"}
+        })
+        assert response.status_code == 200
+        organizer_id = response.json()["data"]["id"]
+
+        response = client.post("/api/events/", headers=headers, json={
+            "title": "Jazz Night", "description": "Quartet", "date": "2031-05-01", "time": "20:00",
+            "location": LOCATION, "category": "Music", "price": {"min": 10, "max": 20},
+            "organizer_id": organizer_id
+        })
+        assert response.status_code == 200
+
+        deadline = time.time() + 5
+        while client.get("/api/ready").status_code != 200 and time.time() < deadline:
+            time.sleep(0.1)
+        assert client.get("/api/ready").status_code == 200
+
+        response = client.get("/api/events/", params={"search": "jazz nigth", "fuzzy": True})
+        assert [event["title"] for event in response.json()["data"]] == ["Jazz Night"]
+
+        response = client.get("/api/search/suggest", params={"q": "jaz"})
+        assert "Jazz Night" in [item["label"] for item in response.json()["data"]]
@@ -0,0 +1,88 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from archiver import EventArchiver
+from database import events_collection, events_archive_collection, event_neighbors_collection
+from invalidation import invalidation_bus, InvalidationBus
+from organizer_stats import OrganizerStats
+
+
+def make_event(event_id, days_from_now, reviews=()):
+    starts_at = datetime.utcnow() + timedelta(days=days_from_now)
+    return {
+        "id": event_id,
+        "title": f"Show {event_id}",
+        "organizer_id": "org-1",
+        "location": {"name": "Hall", "lat": 40.73, "lng": -73.99},
+        "starts_at": starts_at,
+        "created_at": starts_at - timedelta(days=60),
+        "reviews": [{"id": f"{event_id}-{i}", "rating": rating} for i, rating in enumerate(reviews)],
+    }
+
+
+def test_archive_moves_past_events_and_cleans_neighbors():
+    async def scenario():
+        await events_collection.insert_many([make_event("old", -90, [4, 2]), make_event("new", 10, [5])])
+        await event_neighbors_collection.insert_many([
+            {"event_id": "old", "neighbors": [{"id": "new", "score": 3}]},
+            {"event_id": "new", "neighbors": [{"id": "old", "score": 3}]},
+        ])
+        moved = await EventArchiver.archive_batch()
+        live = [event["id"] async for event in events_collection.find({})]
+        archived = await events_archive_collection.find_one({"id": "old"})
+        neighbors = [doc async for doc in event_neighbors_collection.find({}, {"_id": 0})]
+        return moved, live, archived, neighbors
+
+    moved, live, archived, neighbors = asyncio.run(scenario())
+    assert moved == 1
+    assert live == ["new"]
+    assert archived["archived_at"] is not None
+    assert neighbors == [{"event_id": "new", "neighbors": []}]
+
+
+def test_rescheduled_event_is_not_left_in_archive():
+    async def scenario():
+        event = make_event("moved", -90)
+        await events_collection.insert_one(event)
+        # Another writer reschedules the event between the archiver's copy and delete
+        original = events_archive_collection.bulk_write
+
+        async def copy_then_reschedule(*args, **kwargs):
+            result = await original(*args, **kwargs)
+            await events_collection.update_one({"id": "moved"}, {"$set": {"starts_at": datetime.utcnow() + timedelta(days=5)}})
+            return result
+
+        events_archive_collection.bulk_write = copy_then_reschedule
+        try:
+            moved = await EventArchiver.archive_batch()
+        finally:
+            del events_archive_collection.bulk_write
+        return moved, await events_archive_collection.count_documents({}), await events_collection.count_documents({})
+
+    assert asyncio.run(scenario()) == (0, 0, 1)
+
+
+def test_organizer_stats_include_archived_events():
+    async def scenario():
+        await events_collection.insert_many([make_event("old", -90, [4, 2]), make_event("new", 10, [5])])
+        await EventArchiver.archive_batch()
+        return await OrganizerStats.compute_stats(["org-1"])
+
+    stats = asyncio.run(scenario())["org-1"]
+    assert stats["totalEvents"] == 2
+    assert stats["reviewCount"] == 3
+    assert stats["ratingSum"] == 11
+    assert stats["recentEvents"] == ["new", "old"]
+
+
+def test_archive_delete_resolves_to_event_id():
+    async def scenario():
+        event = make_event("old", -90)
+        await events_collection.insert_one(event)
+        await EventArchiver.archive_batch()
+        change = {"operationType": "delete", "ns": {"db": "test", "coll": "events"}, "documentKey": {"_id": event["_id"]}}
+        return await invalidation_bus.resolve(InvalidationBus.from_change(change))
+
+    invalidation = asyncio.run(scenario())
+    assert invalidation.operation == "delete"
+    assert invalidation.document_id == "old"
@@ -0,0 +1,47 @@
+import asyncio
+
+from counters import CounterBuffer
+from database import events_collection, organizers_collection
+
+
+def test_flush_writes_pending_counts():
+    buffer = CounterBuffer()
+
+    async def scenario():
+        await events_collection.insert_one({"id": "event-1", "views": 1})
+        await organizers_collection.insert_one({"id": "org-1"})
+        buffer.view({"id": "event-1", "organizer_id": "org-1"})
+        buffer.impressions([{"id": "event-1", "organizer_id": "org-1"}] * 2)
+        written = await buffer.flush()
+        return written, await events_collection.find_one({"id": "event-1"}), await organizers_collection.find_one({"id": "org-1"})
+
+    written, event, organizer = asyncio.run(scenario())
+    assert written == 2
+    assert event["views"] == 2 and event["impressions"] == 2
+    assert event["trending_score"] > 0
+    assert organizer["totalViews"] == 1 and organizer["totalImpressions"] == 2
+    assert asyncio.run(buffer.flush()) == 0
+
+
+def test_failed_writes_are_retried_without_double_counting():
+    buffer = CounterBuffer()
+
+    async def scenario():
+        # A non-numeric counter makes only this event's $inc fail
+        await events_collection.insert_many([{"id": "good", "views": 0}, {"id": "bad", "views": "broken"}])
+        buffer.view({"id": "good"})
+        buffer.view({"id": "bad"})
+        written = await buffer.flush()
+        pending = {event_id: dict(counts) for event_id, counts in buffer._events.items()}
+
+        await events_collection.update_one({"id": "bad"}, {"$set": {"views": 0}})
+        retried = await buffer.flush()
+        good = await events_collection.find_one({"id": "good"})
+        bad = await events_collection.find_one({"id": "bad"})
+        return written, pending, retried, good, bad
+
+    written, pending, retried, good, bad = asyncio.run(scenario())
+    assert written == 1
+    assert pending == {"bad": {"views": 1}}
+    assert retried == 1
+    assert good["views"] == 1 and bad["views"] == 1
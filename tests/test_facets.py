@@ -0,0 +1,76 @@
+import asyncio
+
+import pytest
+
+import facets
+from database import events_collection
+from facets import FacetedSearch, parse_facets
+from geo import geo_point
+
+
+def make_event(n, rating, category="Music", price_min=10, location=None):
+    location = location or {"lat": 40.73 + n / 1000, "lng": -73.99}
+    return {
+        "id": f"event-{n}",
+        "title": f"Show {n}",
+        "organizer_id": "org-1",
+        "category": category,
+        "rating": rating,
+        "price": {"min": price_min, "max": price_min + 10},
+        "location": location,
+        "geo": geo_point(location),
+    }
+
+
+def test_page_is_sorted_over_every_match_when_counts_are_truncated(monkeypatch):
+    monkeypatch.setattr(facets, "FACET_SCAN_LIMIT", 5)
+
+    async def scenario():
+        # The best rated events are inserted last, beyond the facet scan limit
+        await events_collection.insert_many([make_event(n, n / 4) for n in range(20)])
+        return await FacetedSearch.search_events(["category"], sort_by="rating", limit=3)
+
+    result = asyncio.run(scenario())
+    assert [event["id"] for event in result["events"]] == ["event-19", "event-18", "event-17"]
+    assert result["truncated"] is True
+    assert result["total"] == 5
+
+
+def test_counts_apply_distance_filter():
+    async def scenario():
+        await events_collection.insert_many([
+            make_event(1, 4.5, "Music", 0),
+            make_event(2, 3.2, "Sports", 30),
+            make_event(3, 4.8, "Music", 60, location={"lat": 34.05, "lng": -118.24}),
+        ])
+        return await FacetedSearch.search_events(
+            ["category", "price", "rating", "distance"],
+            max_distance=25, user_lat=40.73, user_lng=-73.99, sort_by="distance"
+        )
+
+    result = asyncio.run(scenario())
+    assert [event["id"] for event in result["events"]] == ["event-1", "event-2"]
+    assert result["total"] == 2 and result["truncated"] is False
+    assert result["facets"]["category"] == [{"value": "Music", "count": 1}, {"value": "Sports", "count": 1}]
+    assert [bucket["count"] for bucket in result["facets"]["price"]] == [1, 0, 1, 0, 0]
+    assert result["facets"]["distance"][0] == {"within": 1, "count": 2}
+
+
+def test_parse_facets_rejects_unknown():
+    assert parse_facets("category, price", facets.EVENT_FACETS) == ["category", "price"]
+    with pytest.raises(ValueError):
+        parse_facets("category,colour", facets.EVENT_FACETS)
+
+
+def test_origin_bounds_page_and_counts_to_the_nearest_matches(monkeypatch):
+    monkeypatch.setattr(facets, "FACET_SCAN_LIMIT", 5)
+
+    async def scenario():
+        await events_collection.insert_many([make_event(n, n / 4) for n in range(20)])
+        return await FacetedSearch.search_events(["rating"], user_lat=40.73, user_lng=-73.99, sort_by="rating", limit=3)
+
+    result = asyncio.run(scenario())
+    # Page and counts both cover the five nearest events
+    assert [event["id"] for event in result["events"]] == ["event-4", "event-3", "event-2"]
+    assert result["total"] == 5 and result["truncated"] is True
+    assert sum(bucket["count"] for bucket in result["facets"]["rating"]) == 5
@@ -0,0 +1,68 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import feed
+import invalidation_handlers  # noqa: F401 - subscribes caches to the invalidation bus
+from database import events_collection
+from feed import EventFeed, feed_cache
+from geo import geo_point
+from invalidation import invalidation_bus, Invalidation
+
+
+def make_event(event_id, lat, days_from_now=10):
+    location = {"name": "Hall", "lat": lat, "lng": -73.99}
+    return {
+        "id": event_id,
+        "location": location,
+        "geo": geo_point(location),
+        "starts_at": datetime.utcnow() + timedelta(days=days_from_now),
+        "reviews": [{"rating": 5}],
+    }
+
+
+def test_candidates_are_the_nearest_upcoming_events(monkeypatch):
+    monkeypatch.setattr(feed, "CANDIDATE_LIMIT", 2)
+
+    async def scenario():
+        # Inserted farthest first, so an unsorted limit would keep the far ones
+        await events_collection.insert_many([
+            make_event("out-of-range", 42.0),
+            make_event("far", 40.90),
+            make_event("middle", 40.80),
+            make_event("past", 40.73, days_from_now=-1),
+            make_event("near", 40.74),
+        ])
+        return await EventFeed.get_candidates(40.73, -73.99, 25)
+
+    candidates = asyncio.run(scenario())
+    assert [candidate["id"] for candidate in candidates] == ["near", "middle"]
+    assert "reviews" not in candidates[0] and "_id" not in candidates[0]
+    assert round(candidates[0]["distance"], 1) == 0.7
+
+
+def cache_feeds():
+    feed_cache.clear()
+    feed_cache.set("lists-it", {"lat": 10.0, "lng": 10.0, "max_distance": 25, "events": [{"id": "e1"}]})
+    feed_cache.set("nearby", {"lat": 40.73, "lng": -73.99, "max_distance": 25, "events": [{"id": "e2"}]})
+    feed_cache.set("elsewhere", {"lat": -33.9, "lng": 151.2, "max_distance": 25, "events": [{"id": "e3"}]})
+
+
+def test_event_changes_drop_only_the_feeds_they_affect():
+    cache_feeds()
+    assert EventFeed.invalidate_event("e1", {"lat": 40.74, "lng": -73.99}) == 2
+    assert feed_cache.get("elsewhere") is not None
+
+
+def test_counter_changes_keep_cached_feeds():
+    cache_feeds()
+
+    async def scenario():
+        await events_collection.insert_one(make_event("e1", 40.74))
+        invalidation_bus.publish(Invalidation("events", "e1", "update", frozenset({"attendees", "rating"})))
+        await asyncio.sleep(0.01)
+        counted = feed_cache.stats()["entries"]
+        invalidation_bus.publish(Invalidation("events", "e1", "update", frozenset({"title"})))
+        await asyncio.sleep(0.01)
+        return counted, feed_cache.stats()["entries"]
+
+    assert asyncio.run(scenario()) == (3, 1)
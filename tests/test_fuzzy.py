@@ -0,0 +1,72 @@
+import asyncio
+
+from fuzzy import FuzzyIndex, edit_distance
+
+VENUES = [
+    {"id": "fillmore", "title": "Soul Revue", "location": {"name": "The Fillmore"}},
+    {"id": "golden-gate", "title": "Sunset Picnic", "location": {"name": "Golden Gate Park"}},
+    {"id": "gate-club", "title": "Gate Club Night", "location": {"name": "Warehouse"}},
+    {"id": "filmhouse", "title": "Film Marathon", "location": {"name": "Filmhouse"}},
+]
+
+
+def build(documents=VENUES):
+    index = FuzzyIndex("events", ["title", "location.name"])
+    for document in documents:
+        index.index(document)
+    return index
+
+
+def test_edit_distance_counts_transpositions_and_stops_at_the_limit():
+    assert edit_distance("filmore", "fillmore", 2) == 1
+    assert edit_distance("gate", "gaet", 1) == 1
+    assert edit_distance("kitten", "sitting", 3) == 3
+    assert edit_distance("concert", "festival", 2) == 3
+
+
+def test_similar_words_respects_the_tolerance_per_word_length():
+    index = build()
+    assert index.similar_words("goldn") == {"golden": 1}
+    assert index.similar_words("filmore") == {"fillmore": 1}
+    # Short words must match exactly
+    assert index.similar_words("gat") == {}
+
+
+def test_misspelled_venues_are_found():
+    index = build()
+    assert index.search("Filmore") == ["fillmore"]
+    assert index.search("Goldn Gate") == ["golden-gate"]
+    # Every query word has to match
+    assert index.search("Goldn Warehouse") == []
+
+
+def test_exact_matches_come_first():
+    index = build([{"id": "near", "title": "Gaet Study"}, {"id": "exact", "title": "Gate Study"}])
+    assert index.search("gate study") == ["exact", "near"]
+
+
+def test_renames_and_removals_update_the_index():
+    index = build()
+    index.index({"id": "fillmore", "title": "Soul Revue", "location": {"name": "Apollo"}})
+    index.remove("golden-gate")
+    assert index.search("Filmore") == []
+    assert index.search("Goldn Gate") == []
+    assert "fillmore" not in index.postings
+
+
+def test_writes_during_load_survive_the_swap():
+    index = build(VENUES[:1])
+
+    class Collection:
+        def find(self, query, projection):
+            return self._documents()
+
+        async def _documents(self):
+            yield VENUES[0]
+            index.index(VENUES[1])
+            index.remove("fillmore")
+            yield VENUES[2]
+
+    asyncio.run(index.load(Collection()))
+    assert sorted(index.documents) == ["gate-club", "golden-gate"]
+    assert index.search("Goldn Gate") == ["golden-gate"]
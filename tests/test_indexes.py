@@ -0,0 +1,77 @@
+import asyncio
+
+import index_advisor
+from indexes import IndexReconciler
+from memory_store import MemoryDatabase
+
+SPECS = {
+    "users": [
+        {"keys": [("email", 1)], "unique": True, "hot": True},
+        {"keys": [("id", 1)], "hot": True},
+    ],
+}
+
+
+def test_same_keys_under_another_name_are_adopted():
+    db = MemoryDatabase("indexes")
+
+    async def scenario():
+        await db.users.create_index([("id", 1)], name="by_id")
+        return await IndexReconciler(db, SPECS).run()
+
+    status = asyncio.run(scenario())
+    assert status["ready"] and not status["failed_hot"]
+    assert status["adopted"] == {"users.id_1": "by_id"}
+
+
+def test_failed_hot_index_keeps_the_instance_not_ready_until_a_retry_succeeds():
+    db = MemoryDatabase("indexes")
+    reconciler = IndexReconciler(db, SPECS)
+
+    async def scenario():
+        await db.users.insert_many([{"email": "ada@example.com"}, {"email": "ada@example.com"}])
+        failed = await reconciler.run()
+        await db.users.delete_many({})
+        return failed, await reconciler.run()
+
+    failed, retried = asyncio.run(scenario())
+    assert not failed["ready"]
+    assert failed["failed_hot"] == ["users.email_1"]
+    assert "duplicate key" in failed["failed"]["users.email_1"]
+    assert retried["ready"] and not retried["failed_hot"]
+
+
+def test_advisor_counts_adopted_indexes_as_managed(monkeypatch):
+    db = MemoryDatabase("indexes")
+    monkeypatch.setattr(index_advisor, "db", db)
+    monkeypatch.setattr(index_advisor, "INDEX_SPECS", SPECS)
+
+    async def usage(collection):
+        return {}
+
+    monkeypatch.setattr(index_advisor, "index_usage", usage)
+
+    async def scenario():
+        await db.users.create_index([("id", 1)], name="by_id")
+        await db.users.create_index([("name", 1)])
+        return await index_advisor.build_report(["users"], 1)
+
+    report = asyncio.run(scenario())["collections"]["users"]
+    assert report["missing"] == ["email_1"]
+    assert report["unmanaged"] == ["name_1"]
+
+
+def test_build_conflicting_with_a_concurrent_build_adopts_it():
+    db = MemoryDatabase("indexes")
+    reconciler = IndexReconciler(db, SPECS)
+
+    async def scenario():
+        missing = await reconciler.plan()
+        # Another instance builds the same keys under its own name after the plan
+        await db.users.create_index([("id", 1)], name="by_id")
+        await asyncio.gather(*(reconciler._build(key, asyncio.Semaphore(1)) for key in missing))
+        return reconciler.status()
+
+    status = asyncio.run(scenario())
+    assert status["counts"] == {"ready": 2}
+    assert status["adopted"] == {"users.id_1": "by_id"}
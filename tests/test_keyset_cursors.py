@@ -0,0 +1,89 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+from fastapi.testclient import TestClient
+
+import server
+from database import Database, organizers_collection
+
+
+def create_events(count, same_start=False, same_venue=False, undated=0):
+    async def scenario():
+        start = datetime(2031, 5, 1, 20)
+        for n in range(count + undated):
+            starts_at = start if same_start else start + timedelta(days=n)
+            await Database.create_event({
+                "id": f"event-{n}",
+                "title": f"Show {n}",
+                # The last ones carry dates that never parse into starts_at
+                "date": starts_at.date().isoformat() if n < count else "TBA",
+                "time": starts_at.strftime("%H:%M"),
+                "location": {"name": "Hall", "lat": 40.73 + (0 if same_venue else n / 100), "lng": -73.99},
+                "organizer_id": "org-1",
+            })
+    asyncio.run(scenario())
+
+
+def pages(order_by="date", limit=2, cursors=None, **location):
+    async def scenario():
+        seen, cursor = [], None
+        while True:
+            page = await Database.get_events_by_organizer(
+                "org-1", order_by=order_by, cursor=cursor, limit=limit, **location
+            )
+            seen += [event["id"] for event in page["events"]]
+            if not page["has_more"]:
+                return seen
+            cursor = page["next_cursor"]
+            if cursors is not None:
+                cursors.append(cursor)
+    return asyncio.run(scenario())
+
+
+def test_date_cursor_breaks_ties_on_id():
+    create_events(5, same_start=True)
+    assert sorted(pages(limit=2)) == [f"event-{n}" for n in range(5)]
+    assert len(pages(limit=2)) == 5
+
+
+def test_distance_cursor_walks_every_event_once():
+    create_events(5)
+    assert pages(order_by="distance", user_lat=40.73, user_lng=-73.99) == [f"event-{n}" for n in range(5)]
+
+
+def test_distance_cursor_stays_small_at_a_single_venue():
+    create_events(7, same_venue=True)
+    cursors = []
+    seen = pages(order_by="distance", cursors=cursors, user_lat=40.8, user_lng=-73.99)
+    assert sorted(seen) == [f"event-{n}" for n in range(7)] and len(seen) == 7
+    assert len({len(cursor) for cursor in cursors}) == 1
+
+
+def test_all_events_end_with_undated_ones():
+    create_events(3, undated=2)
+    assert pages(limit=2) == [f"event-{n}" for n in range(5)]
+
+
+@pytest.mark.parametrize("position, by_distance", [
+    ({"v": "2031-05-01T20:00:00", "id": "not-an-object-id"}, False),
+    ({"d": 10.0, "ids": []}, False),
+    ({"d": 10.0, "ids": []}, True),
+    ({"v": "2031-05-01T20:00:00", "id": str(ObjectId())}, True),
+    (["not", "a", "position"], False),
+])
+def test_invalid_cursor_is_rejected(position, by_distance):
+    cursor = Database.encode_cursor(position)
+    with pytest.raises(ValueError):
+        Database.decode_organizer_events_cursor(cursor, by_distance)
+
+
+def test_invalid_cursor_returns_400():
+    asyncio.run(organizers_collection.insert_one({"id": "org-1", "name": "Jazz Collective"}))
+    client = TestClient(server.app)
+    cursor = Database.encode_cursor({"d": 10.0, "ids": ["x"]})
+    response = client.get("/api/organizers/org-1/events", params={"cursor": cursor})
+    assert response.status_code == 400
+    response = client.get("/api/organizers/org-1/events", params={"cursor": "%%%"})
+    assert response.status_code == 400
@@ -0,0 +1,85 @@
+import json
+
+import pytest
+
+from live import LIVE_QUEUE_SIZE, LiveHub
+from metrics import metrics
+
+
+@pytest.fixture
+def hub(monkeypatch):
+    # A fresh hub registers its own gauge; keep the app's one in place afterwards
+    monkeypatch.setitem(metrics.gauges, "live", metrics.gauges["live"])
+    return LiveHub(interval=60)
+
+
+def drain(subscriber):
+    messages = []
+    while not subscriber.queue.empty():
+        messages.append(subscriber.queue.get_nowait())
+    return messages
+
+
+def payload(message):
+    data = next(line for line in message.decode().split("\n") if line.startswith("data: "))
+    return json.loads(data[len("data: "):])
+
+
+def test_publishes_within_an_interval_coalesce_into_one_message(hub):
+    first = hub.subscribe(["a", "b"])
+    second = hub.subscribe(["a"])
+
+    hub.publish("a", {"attendees": 1})
+    hub.publish("a", {"attendees": 2, "status": "open"})
+    hub.publish("b", {"attendees": 7})
+    assert drain(first) == []
+
+    assert hub.flush() == 2
+
+    [message] = drain(first)
+    assert sorted(payload(message), key=lambda update: update["id"]) == [
+        {"id": "a", "attendees": 2, "status": "open"},
+        {"id": "b", "attendees": 7},
+    ]
+    [message] = drain(second)
+    assert payload(message) == [{"id": "a", "attendees": 2, "status": "open"}]
+
+    # Nothing changed since, so the next flush sends nothing
+    assert hub.flush() == 0
+    assert drain(first) == []
+
+
+def test_publish_without_subscribers_is_ignored(hub):
+    hub.publish("a", {"attendees": 1})
+    assert hub.stats()["pending_topics"] == 0
+    assert hub.flush() == 0
+
+
+def test_slow_subscriber_keeps_only_the_latest_messages(hub):
+    subscriber = hub.subscribe(["a"])
+    for attendees in range(LIVE_QUEUE_SIZE + 3):
+        hub.publish("a", {"attendees": attendees})
+        hub.flush()
+
+    messages = drain(subscriber)
+    assert len(messages) == LIVE_QUEUE_SIZE
+    assert [payload(message)[0]["attendees"] for message in messages] == list(range(3, LIVE_QUEUE_SIZE + 3))
+
+
+def test_unsubscribe_cleans_up_topics_and_pending_updates(hub):
+    first = hub.subscribe(["a", "b"])
+    second = hub.subscribe(["b"])
+    hub.publish("a", {"attendees": 1})
+    hub.publish("b", {"attendees": 2})
+
+    hub.unsubscribe(first)
+    assert not hub.has_subscribers("a")
+    assert hub.has_subscribers("b")
+    assert hub.stats() == {"topics": 1, "subscriptions": 1, "pending_topics": 1}
+
+    assert hub.flush() == 1
+    assert drain(first) == []
+    assert [payload(message) for message in drain(second)] == [[{"id": "b", "attendees": 2}]]
+
+    hub.unsubscribe(second)
+    assert hub.stats() == {"topics": 0, "subscriptions": 0, "pending_topics": 0}
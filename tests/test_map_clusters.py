@@ -0,0 +1,77 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import map_clusters
+from map_clusters import MapClusterIndex, MAX_ZOOM, cells_per_axis
+
+WORLD = (-180.0, -85.0, 180.0, 85.0)
+
+
+def make_event(event_id, lat, lng):
+    return {"id": event_id, "title": event_id, "location": {"lat": lat, "lng": lng},
+            "starts_at": datetime.utcnow() + timedelta(days=3)}
+
+
+def build(events):
+    index = MapClusterIndex()
+    for event in events:
+        index.index_event(event)
+    return index
+
+
+def test_nearby_events_cluster_and_expand_when_zoomed_in():
+    index = build([make_event(f"soho-{n}", 40.7233 + n / 100000, -74.0030) for n in range(3)]
+                  + [make_event("sydney", -33.87, 151.21)])
+
+    world = index.query(WORLD, 2)
+    assert world["total"] == 4
+    assert sorted(item.get("count", 1) for item in world["items"]) == [1, 3]
+
+    street = index.query((-74.01, 40.72, -73.99, 40.73), MAX_ZOOM)
+    assert sorted(item["id"] for item in street["items"]) == ["soho-0", "soho-1", "soho-2"]
+
+
+def test_removed_and_past_events_leave_no_clusters():
+    index = build([make_event("a", 10.0, 10.0), make_event("b", 10.0, 10.0)])
+    index.remove("a")
+    index.index_event({**make_event("b", 10.0, 10.0), "starts_at": datetime.utcnow() - timedelta(days=30)})
+    assert index.query(WORLD, 5)["total"] == 0
+    assert all(not level for level in index.levels)
+
+
+def test_cell_ranges_split_at_the_antimeridian():
+    size = cells_per_axis(3)
+    east, west = MapClusterIndex.cell_ranges((170.0, -10.0, -170.0, 10.0), 3)
+    assert east[1] == size - 1 and west[0] == 0
+    assert east[2:] == west[2:]
+
+    index = build([make_event("fiji", -17.7, 178.0), make_event("samoa", -13.8, -172.0), make_event("lima", -12.0, -77.0)])
+    result = index.query((170.0, -30.0, -170.0, 0.0), 4)
+    assert result["total"] == 2
+
+
+def test_limit_coarsens_the_zoom():
+    index = build([make_event(f"e{x}-{y}", y * 10.0, x * 10.0) for x in range(-10, 10) for y in range(-5, 5)])
+    result = index.query(WORLD, 10, limit=20)
+    assert result["zoom"] < 10
+    assert len(result["items"]) <= 20
+    assert result["total"] == 200
+
+
+def test_writes_during_load_survive_the_swap(monkeypatch):
+    index = build([make_event("gone", 1.0, 1.0)])
+
+    class Collection:
+        def find(self, query, projection):
+            return self._documents()
+
+        async def _documents(self):
+            yield make_event("gone", 1.0, 1.0)
+            index.index_event(make_event("late", 2.0, 2.0))
+            index.remove("gone")
+            yield make_event("early", 3.0, 3.0)
+
+    monkeypatch.setattr(map_clusters, "events_collection", Collection())
+    asyncio.run(index.load())
+    assert sorted(index.points) == ["early", "late"]
+    assert index.query(WORLD, 0)["total"] == 2
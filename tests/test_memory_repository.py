@@ -0,0 +1,85 @@
+import asyncio
+
+from database import Database
+from memory_repository import MemoryRepository
+from memory_store import MemoryDatabase
+
+
+def make_event(title, organizer_id, lat=40.73, lng=-73.99, date="2031-05-01", price_min=10):
+    return {
+        "id": title.lower().replace(" ", "-"),
+        "title": title,
+        "description": "An evening of live music",
+        "date": date,
+        "time": "20:00",
+        "location": {"name": "Hall", "address": "1 Main", "lat": lat, "lng": lng, "city": "New York"},
+        "category": "Music",
+        "price": {"min": price_min, "max": price_min + 10},
+        "organizer_id": organizer_id,
+        "rating": 0,
+        "attendees": 0,
+    }
+
+
+def make_repository():
+    repository = MemoryRepository(MemoryDatabase("test"))
+    asyncio.run(repository.create_organizer({"id": "org-1", "name": "Jazz Collective", "location": {"lat": 40.73, "lng": -73.99}}))
+    return repository
+
+
+def test_create_and_find_event():
+    repository = make_repository()
+
+    async def scenario():
+        await repository.create_event(make_event("Jazz Night", "org-1"))
+        return await repository.get_event_by_id("jazz-night")
+
+    event = asyncio.run(scenario())
+    assert event["title"] == "Jazz Night"
+    assert event["organizer"]["name"] == "Jazz Collective"
+    assert event["geo"] == {"type": "Point", "coordinates": [-73.99, 40.73]}
+
+
+def test_filters_by_price_and_distance():
+    repository = make_repository()
+
+    async def scenario():
+        await repository.create_event(make_event("Near Cheap", "org-1", price_min=5))
+        await repository.create_event(make_event("Near Pricey", "org-1", price_min=80))
+        await repository.create_event(make_event("Far Cheap", "org-1", lat=34.05, lng=-118.24, price_min=5))
+        return await repository.get_events_with_filters(
+            max_price=20, max_distance=10, user_lat=40.73, user_lng=-73.99
+        )
+
+    events = asyncio.run(scenario())
+    assert [event["title"] for event in events] == ["Near Cheap"]
+    assert events[0]["distance"] == 0
+
+
+def test_organizer_events_page_with_cursor():
+    repository = make_repository()
+
+    async def scenario():
+        for day in range(1, 6):
+            await repository.create_event(make_event(f"Show {day}", "org-1", date=f"2031-05-0{day}"))
+        first = await repository.get_events_by_organizer("org-1", limit=2)
+        second = await repository.get_events_by_organizer("org-1", cursor=first["next_cursor"], limit=2)
+        third = await repository.get_events_by_organizer("org-1", cursor=second["next_cursor"], limit=2)
+        return first, second, third
+
+    first, second, third = asyncio.run(scenario())
+    titles = [event["title"] for page in (first, second, third) for event in page["events"]]
+    assert titles == [f"Show {day}" for day in range(1, 6)]
+    assert first["has_more"] and second["has_more"] and not third["has_more"]
+
+
+def test_use_repository_routes_database_calls():
+    from database import use_repository, db
+    assert isinstance(db, MemoryDatabase)
+    use_repository(MemoryRepository(db))
+
+    async def scenario():
+        await Database.create_organizer({"id": "org-2", "name": "Night Owls"})
+        return await Database.get_organizer_by_id("org-2")
+
+    assert asyncio.run(scenario())["name"] == "Night Owls"
@@ -0,0 +1,34 @@
+import asyncio
+from datetime import datetime
+
+from bson import ObjectId, json_util
+
+from memory_store import MemoryDatabase
+from query_shapes import EXAMPLE_MAX_LENGTH, QueryShapeRecorder
+
+
+def test_example_is_stored_as_extended_json():
+    recorder = QueryShapeRecorder()
+    query = {"starts_at": {"$gte": datetime(2031, 5, 1)}, "_id": {"$gt": ObjectId()}}
+    recorder.record("events", query, [("starts_at", 1)])
+    # Mutating the caller's query afterwards must not change the example
+    query["starts_at"]["$gte"] = datetime(1999, 1, 1)
+    recorder.record("events", query, [("starts_at", 1)])
+
+    database = MemoryDatabase("shapes")
+    assert asyncio.run(recorder.flush(database)) == 1
+    stored = asyncio.run(database.query_shapes.find_one({"collection": "events"}))
+    assert stored["count"] == 2
+    assert stored["example_truncated"] is False
+    assert json_util.loads(stored["example"])["starts_at"]["$gte"] == datetime(2031, 5, 1)
+
+
+def test_large_example_is_truncated():
+    recorder = QueryShapeRecorder()
+    recorder.record("events", {"id": {"$in": [f"event-{n}" for n in range(5000)]}})
+
+    database = MemoryDatabase("shapes")
+    asyncio.run(recorder.flush(database))
+    stored = asyncio.run(database.query_shapes.find_one({"collection": "events"}))
+    assert len(stored["example"]) == EXAMPLE_MAX_LENGTH
+    assert stored["example_truncated"] is True
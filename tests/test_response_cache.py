@@ -0,0 +1,36 @@
+from cache import TTLCache
+from response_cache import ResponseCacheMiddleware, invalidate_routes, CACHEABLE_ROUTES
+
+
+def scope(method, path):
+    return {"type": "http", "method": method, "path": path, "headers": []}
+
+
+def filled_cache():
+    cache = TTLCache(60)
+    for path in ("/api/events/", "/api/events/trending", "/api/events/similar/e1",
+                 "/api/organizers/", "/api/organizers/nearby/top", "/api/search/suggest"):
+        cache.set((path, b""), path)
+    return cache
+
+
+def cached_paths(cache):
+    return {path for path, _ in cache._entries}
+
+
+def test_writes_drop_only_the_routes_they_change():
+    invalidates = ResponseCacheMiddleware.invalidates
+    assert invalidates(scope("GET", "/api/events/")) == ()
+    assert invalidates(scope("POST", "/api/events/batch")) == ()
+    assert invalidates(scope("POST", "/api/events/e1/save")) == ("trending",)
+    assert "organizers" not in invalidates(scope("POST", "/api/events/e1/rsvp"))
+    assert "suggest" in invalidates(scope("PUT", "/api/organizers/o1"))
+    # Writes without a mapping stay safe by dropping every route
+    assert invalidates(scope("DELETE", "/api/events/e1")) == tuple(CACHEABLE_ROUTES)
+
+
+def test_invalidate_routes_keeps_other_entries():
+    cache = filled_cache()
+    dropped = invalidate_routes(ResponseCacheMiddleware.invalidates(scope("POST", "/api/events/e1/rsvp")), cache)
+    assert dropped == 3
+    assert cached_paths(cache) == {"/api/events/similar/e1", "/api/organizers/", "/api/organizers/nearby/top"}
@@ -0,0 +1,100 @@
+import asyncio
+import time
+
+import search_index
+from search_index import SuggestIndex, EVENT, TOP_K
+from snapshot import SnapshotReader, SuggestSnapshot, publish, write_snapshot
+
+
+def build(events):
+    index = SuggestIndex()
+    for event in events:
+        index.index_event(event)
+    return index
+
+
+def labels(suggestions):
+    return [suggestion["label"] for suggestion in suggestions]
+
+
+def test_popular_match_beyond_many_lexically_earlier_terms():
+    events = [{"id": f"e{n}", "title": f"Aa Show {n:05d}", "rating": 0, "attendees": 0} for n in range(3000)]
+    events.append({"id": "hit", "title": "Azure Festival", "rating": 5, "attendees": 5000})
+    index = build(events)
+    assert labels(index.suggest("a", limit=1, kinds=[EVENT])) == ["Azure Festival"]
+    assert labels(index.suggest("azure f", limit=1)) == ["Azure Festival"]
+
+
+def test_top_lists_follow_weight_changes_and_removals():
+    events = [{"id": f"e{n}", "title": f"Jazz {n}", "rating": 0, "attendees": n} for n in range(TOP_K + 10)]
+    index = build(events)
+    assert labels(index.suggest("jazz", limit=1)) == [f"Jazz {TOP_K + 9}"]
+
+    index.index_event({"id": "e3", "title": "Jazz 3", "rating": 5, "attendees": 10 ** 6})
+    assert labels(index.suggest("jazz", limit=1)) == ["Jazz 3"]
+
+    index.index_event({"id": "e3", "title": "Jazz 3", "rating": 0, "attendees": 0})
+    index.remove(EVENT, f"e{TOP_K + 9}")
+    assert labels(index.suggest("jazz", limit=2)) == [f"Jazz {TOP_K + 8}", f"Jazz {TOP_K + 7}"]
+
+
+def test_writes_during_load_survive_the_swap(monkeypatch):
+    index = SuggestIndex()
+    late = {"id": "late", "title": "Late Addition", "rating": 5, "attendees": 10}
+
+    class Collection:
+        def __init__(self, documents, during=None):
+            self.documents = documents
+            self.during = during
+
+        async def find(self, query, projection):
+            for document in self.documents:
+                yield document
+                if self.during:
+                    self.during()
+
+    monkeypatch.setattr(search_index, "events_collection", Collection(
+        [{"id": "early", "title": "Early Show", "rating": 1, "attendees": 1}],
+        during=lambda: index.index_event(late)
+    ))
+    monkeypatch.setattr(search_index, "organizers_collection", Collection([]))
+
+    asyncio.run(index.load())
+    assert labels(index.suggest("late")) == ["Late Addition"]
+    assert labels(index.suggest("early")) == ["Early Show"]
+
+
+def test_snapshot_matches_the_index(tmp_path):
+    events = [{"id": f"e{n}", "title": f"Show {n} at the Park", "rating": n % 5, "attendees": n,
+               "location": {"name": f"Park {n % 3}"}} for n in range(200)]
+    index = build(events)
+    path = tmp_path / "suggest.snap"
+    write_snapshot(index, path)
+    snapshot = SuggestSnapshot(path)
+
+    for query, kinds in [("s", None), ("park", None), ("show 12", None), ("p", ["venue"]), ("the park", [EVENT])]:
+        expected = search_index.rank_suggestions(index.matches(query, kinds), index._entries.__getitem__, 8)
+        actual = search_index.rank_suggestions(snapshot.matches(query, kinds), snapshot.entry, 8)
+        assert labels(actual) == labels(expected)
+
+
+def test_workers_overlay_writes_until_the_next_snapshot(tmp_path):
+    builder = build([{"id": "e1", "title": "Jazz Brunch", "rating": 1, "attendees": 1},
+                     {"id": "e2", "title": "Jazz Picnic", "rating": 1, "attendees": 2}])
+    builder.load_started_at = 0
+    publish(builder, tmp_path)
+
+    worker = SuggestIndex()
+    worker.attach(SnapshotReader(tmp_path))
+    worker.snapshot_reader.refresh()
+    worker.index_event({"id": "e1", "title": "Jazz Gala", "rating": 5, "attendees": 500})
+    worker.remove(EVENT, "e2")
+    assert labels(worker.suggest("jazz")) == ["Jazz Gala"]
+
+    # A snapshot whose load started after the writes replaces the overlay
+    builder.index_event({"id": "e3", "title": "Jazz Vespers", "rating": 1, "attendees": 1})
+    builder.load_started_at = time.time()
+    publish(builder, tmp_path)
+    worker.snapshot_reader.refresh()
+    assert labels(worker.suggest("jazz")) == ["Jazz Picnic", "Jazz Brunch", "Jazz Vespers"]
+    assert worker.stats()["overlaid"] == 0
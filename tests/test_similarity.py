@@ -0,0 +1,49 @@
+import asyncio
+
+from database import events_collection, event_neighbors_collection
+from geo import geo_point
+from similarity import EventSimilarity
+
+
+def make_event(event_id, category, lat, lng=-73.99):
+    location = {"name": "Hall", "lat": lat, "lng": lng}
+    return {
+        "id": event_id,
+        "title": f"Show {event_id}",
+        "date": "2031-05-01",
+        "category": category,
+        "price": {"min": 10, "max": 20},
+        "location": location,
+        "geo": geo_point(location),
+    }
+
+
+def test_candidates_are_nearest_first_and_other_categories_stay_nearby():
+    source = make_event("source", "Music", 40.73)
+
+    async def scenario():
+        await events_collection.insert_many([
+            source,
+            make_event("music-far", "Music", 34.05, -118.24),
+            make_event("music-near", "Music", 40.74),
+            make_event("sports-near", "Sports", 40.75),
+            make_event("sports-far", "Sports", 41.73),
+        ])
+        return await EventSimilarity.get_candidates(source)
+
+    candidates = asyncio.run(scenario())
+    assert [candidate["id"] for candidate in candidates] == ["music-near", "sports-near", "music-far"]
+    assert "candidate_distance" not in candidates[0]
+
+
+def test_refresh_updates_both_sides():
+    source = make_event("source", "Music", 40.73)
+
+    async def scenario():
+        await events_collection.insert_many([source, make_event("other", "Music", 40.74)])
+        await event_neighbors_collection.insert_one({"event_id": "other", "neighbors": []})
+        await EventSimilarity.refresh_event({**source, "title": "Renamed"})
+        return await event_neighbors_collection.find_one({"event_id": "other"})
+
+    neighbors = asyncio.run(scenario())["neighbors"]
+    assert [(neighbor["id"], neighbor["title"]) for neighbor in neighbors] == [("source", "Renamed")]